@@ -0,0 +1,529 @@
+"""
+Load benchmark for the Trip and Booking services.
+
+Starts both projects on local ports (or targets running ones with
+--trip-url/--booking-url), seeds them through the NDJSON bulk endpoints,
+then drives a weighted mix of add_*, *_listing and *_details requests
+from --concurrency threads. Latency percentiles, throughput and the SQL
+query totals the services report per request (X-DB-Queries, see
+QUERY_COUNT_HEADER) are printed and saved as JSON.
+
+    python benchmarks/loadtest.py --rows 100000 --duration 60 --output runs/base.json
+    python benchmarks/loadtest.py --skip-seed --duration 60 --compare runs/base.json
+
+A run consumes --reserve spare routes and trips for add_trip and
+add_booking, so compare runs on freshly seeded databases.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TRIP_PROJECT = os.path.join(ROOT, 'django_task_1', 'Trip_service')
+BOOKING_PROJECT = os.path.join(ROOT, 'django_task_2', 'Booking_service')
+
+# Relative weight of each operation in the default mix
+DEFAULT_MIX = {
+    'route_details': 20,
+    'trip_details': 20,
+    'booking_details': 15,
+    'route_listing': 10,
+    'trip_listing': 10,
+    'booking_listing': 10,
+    'add_route': 5,
+    'add_trip': 5,
+    'add_booking': 5,
+}
+
+# New route ids are taken from a random block above this, so repeated runs
+# against one database rarely collide
+ADD_ID_BASE = 50_000_000
+ADD_ID_BLOCK = 100_000
+
+STOPS = ['Satara', 'Kolhapur', 'Belgaum', 'Hubli', 'Dharwad', 'Karad', 'Sangli', 'Miraj']
+CITIES = ['Pune', 'Goa', 'Mumbai', 'Nashik', 'Nagpur', 'Solapur']
+
+
+def route_row(number):
+    return {
+        'route_id': f'RT{number:08d}',
+        'user_id': f'U{number % 1000}',
+        'route_name': f'Route {number}',
+        'route_origin': CITIES[number % len(CITIES)],
+        'route_destination': CITIES[(number + 1) % len(CITIES)],
+        'stops': [STOPS[(number + offset) % len(STOPS)] for offset in range(3)],
+    }
+
+
+def trip_row(number):
+    # Trip n runs on route n, a route takes a single trip
+    return {
+        'trip_id': f'TP{number:08d}',
+        'user_id': f'U{number % 1000}',
+        'vehicle_id': f'V{number % 5000}',
+        'route_id': f'RT{number:08d}',
+        'driver_name': f'Driver {number % 997}',
+        'trip_distance': f'{10 + number % 900}.50',
+    }
+
+
+def booking_row(number):
+    # Booking n is for trip n, a trip takes a single booking
+    return {
+        'ticket_id': f'TK{number:08d}',
+        'trip_id': f'TP{number:08d}',
+        'traveller_name': f'Traveller {number % 991}',
+        'traveller_number': f'{9000000000 + number}',
+        'ticket_cost': f'{100 + number % 400}.00',
+        'traveller_email': f'traveller{number}@example.com',
+    }
+
+
+class Dataset:
+    """
+    Row numbers of the seeded data. Every one of rows has a route, a trip
+    and a booking. reserve further routes have a trip and no booking, for
+    add_booking, and reserve more have neither, for add_trip.
+    """
+
+    def __init__(self, rows, reserve):
+        self.rows = rows
+        self.reserve = reserve
+        self.routes = rows + 2 * reserve
+        self.trips = rows + reserve
+        self.bookings = rows
+        self._bookable_trips = itertools.count(rows + 1)
+        self._free_routes = itertools.count(rows + reserve + 1)
+        self._new_routes = itertools.count(ADD_ID_BASE + random.randrange(400) * ADD_ID_BLOCK)
+
+    def _take(self, counter, last):
+        # next() on itertools.count is atomic under the GIL
+        number = next(counter)
+        return number if number <= last else None
+
+    def bookable_trip(self):
+        return self._take(self._bookable_trips, self.trips)
+
+    def free_route(self):
+        return self._take(self._free_routes, self.routes)
+
+    def new_route(self):
+        return next(self._new_routes)
+
+
+def bulk_upload(session, url, rows):
+    """
+    Send rows to a bulk endpoint as one NDJSON body, returning (created,
+    failed, first error). The body is sized up front, runserver cannot read
+    a chunked upload.
+    """
+    body = ''.join(json.dumps(row) + '\n' for row in rows).encode()
+    response = session.post(url, data=body, headers={'Content-Type': 'application/x-ndjson'}, stream=True,
+                            timeout=None)
+    response.raise_for_status()
+    created = failed = 0
+    first_error = None
+    for line in response.iter_lines():
+        if not line:
+            continue
+        result = json.loads(line)
+        if 'status' not in result:
+            continue  # the closing summary line
+        if result['status'] == 'created':
+            created += 1
+        else:
+            failed += 1
+            first_error = first_error or result.get('error')
+    return created, failed, first_error
+
+
+def seed(trip_url, booking_url, dataset, batch_rows):
+    """Load the dataset through the bulk endpoints, batch_rows rows per request."""
+    tables = [
+        ('routes', f'{trip_url}/bulk_add_routes/', route_row, dataset.routes),
+        ('trips', f'{trip_url}/bulk_add_trips/', trip_row, dataset.trips),
+        ('bookings', f'{booking_url}/bulk_add_bookings/', booking_row, dataset.bookings),
+    ]
+    report = {}
+    session = requests.Session()
+    for table, url, make_row, count in tables:
+        started = time.perf_counter()
+        created = failed = 0
+        first_error = None
+        for first in range(1, count + 1, batch_rows):
+            last = min(count, first + batch_rows - 1)
+            batch_created, batch_failed, error = bulk_upload(session, url, map(make_row, range(first, last + 1)))
+            created += batch_created
+            failed += batch_failed
+            first_error = first_error or error
+            print(f'  {table}: {last}/{count}', end='\r', flush=True)
+        seconds = time.perf_counter() - started
+        report[table] = {
+            'rows': count,
+            'created': created,
+            'failed': failed,
+            'seconds': round(seconds, 2),
+            'rows_per_second': round(count / seconds, 1) if seconds else None,
+        }
+        print(f'\r  {table}: {created} created, {failed} failed in {seconds:.1f}s'
+              + (f' (e.g. {first_error})' if first_error else ''))
+    return report
+
+
+class Workload:
+    """The benchmarked operations. Each returns the request to time, or None when it has nothing to do."""
+
+    def __init__(self, trip_url, booking_url, dataset):
+        self.trip_url = trip_url
+        self.booking_url = booking_url
+        self.dataset = dataset
+        # Listings are browsed over their first pages, like a user would
+        self.pages = max(1, min(100, dataset.rows // 10))
+
+    def route_details(self, rng):
+        return 'GET', f'{self.trip_url}/route_details/RT{rng.randint(1, self.dataset.routes):08d}/', None
+
+    def trip_details(self, rng):
+        return 'GET', f'{self.trip_url}/trip_details/TP{rng.randint(1, self.dataset.trips):08d}/', None
+
+    def booking_details(self, rng):
+        # Answered with the trip and route fetched from the trip service
+        return 'GET', f'{self.booking_url}/booking_details/TK{rng.randint(1, self.dataset.bookings):08d}/', None
+
+    def route_listing(self, rng):
+        return 'GET', f'{self.trip_url}/route_listing/?page={rng.randint(1, self.pages)}', None
+
+    def trip_listing(self, rng):
+        return 'GET', f'{self.trip_url}/trip_listing/?page={rng.randint(1, self.pages)}', None
+
+    def booking_listing(self, rng):
+        return 'GET', f'{self.booking_url}/booking_listing/?page={rng.randint(1, self.pages)}', None
+
+    def add_route(self, rng):
+        return 'POST', f'{self.trip_url}/add_route/', route_row(self.dataset.new_route())
+
+    def add_trip(self, rng):
+        number = self.dataset.free_route()
+        return None if number is None else ('POST', f'{self.trip_url}/add_trip/', trip_row(number))
+
+    def add_booking(self, rng):
+        number = self.dataset.bookable_trip()
+        return None if number is None else ('POST', f'{self.booking_url}/add_booking/', booking_row(number))
+
+
+class EndpointStats:
+
+    def __init__(self):
+        self.latencies = []
+        self.statuses = {}
+        self.errors = 0
+        self.db_queries = 0
+        self.db_counted = 0
+
+    def add(self, seconds, status, db_queries):
+        self.latencies.append(seconds * 1000)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        if status >= 400:
+            self.errors += 1
+        if db_queries is not None:
+            self.db_queries += db_queries
+            self.db_counted += 1
+
+    def merge(self, other):
+        self.latencies.extend(other.latencies)
+        for status, count in other.statuses.items():
+            self.statuses[status] = self.statuses.get(status, 0) + count
+        self.errors += other.errors
+        self.db_queries += other.db_queries
+        self.db_counted += other.db_counted
+
+    def report(self, seconds):
+        latencies = sorted(self.latencies)
+
+        def percentile(p):
+            # Nearest rank
+            return round(latencies[min(len(latencies) - 1, max(0, -(-len(latencies) * p // 100) - 1))], 2)
+
+        return {
+            'requests': len(latencies),
+            'requests_per_second': round(len(latencies) / seconds, 1) if seconds else None,
+            'errors': self.errors,
+            'statuses': {str(status): count for status, count in sorted(self.statuses.items(), key=str)},
+            'latency_ms': {
+                'p50': percentile(50),
+                'p95': percentile(95),
+                'p99': percentile(99),
+                'max': round(latencies[-1], 2),
+                'mean': round(sum(latencies) / len(latencies), 2),
+            } if latencies else {},
+            'db_queries': {
+                'total': self.db_queries,
+                'per_request': round(self.db_queries / self.db_counted, 2) if self.db_counted else None,
+            },
+        }
+
+
+def run_workload(workload, mix, concurrency, duration, max_requests, seed_value):
+    """Drive the mix from concurrency threads, returning (per operation stats, elapsed seconds)."""
+    operations = list(mix)
+    weights = [mix[name] for name in operations]
+    deadline = time.perf_counter() + duration if duration else None
+    budget = itertools.count(1)
+    results = []
+    failures = []
+
+    def worker(index):
+        rng = random.Random(seed_value + index)
+        session = requests.Session()
+        stats = {name: EndpointStats() for name in operations}
+        transport_errors = {name: 0 for name in operations}
+        while deadline is None or time.perf_counter() < deadline:
+            if max_requests and next(budget) > max_requests:
+                break
+            name = rng.choices(operations, weights)[0]
+            request = getattr(workload, name)(rng)
+            if request is None:
+                continue
+            method, url, body = request
+            started = time.perf_counter()
+            try:
+                response = session.request(method, url, json=body, timeout=30)
+            except requests.RequestException:
+                transport_errors[name] += 1
+                continue
+            elapsed = time.perf_counter() - started
+            db_queries = response.headers.get('X-DB-Queries')
+            stats[name].add(elapsed, response.status_code, int(db_queries) if db_queries is not None else None)
+        results.append(stats)
+        failures.append(transport_errors)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    totals = {name: EndpointStats() for name in operations}
+    for stats in results:
+        for name, endpoint_stats in stats.items():
+            totals[name].merge(endpoint_stats)
+    transport_errors = {name: sum(errors[name] for errors in failures) for name in operations}
+    return totals, transport_errors, elapsed
+
+
+def parse_mix(text):
+    if not text:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f'Unknown operation: {name}. Available: {", ".join(DEFAULT_MIX)}')
+        try:
+            mix[name] = float(weight) if weight else 1.0
+        except ValueError:
+            raise argparse.ArgumentTypeError(f'Invalid weight for {name}: {weight}')
+    return mix
+
+
+class Service:
+    """One Django project run as a child process on a local port."""
+
+    def __init__(self, name, project, package, port, settings_module, env, server, workers, log_dir):
+        self.name = name
+        self.project = project
+        self.package = package
+        self.url = f'http://127.0.0.1:{port}'
+        self.port = port
+        self.settings_module = settings_module or f'{package}.settings'
+        self.env = env
+        self.server = server
+        self.workers = workers
+        self.log_path = os.path.join(log_dir, f'{name}.log')
+        self.process = None
+
+    def command(self):
+        if self.server == 'gunicorn':
+            return [sys.executable, '-m', 'gunicorn', f'{self.package}.wsgi', '--bind', f'127.0.0.1:{self.port}',
+                    '--workers', str(self.workers), '--threads', '4']
+        if self.server == 'uvicorn':
+            return [sys.executable, '-m', 'uvicorn', f'{self.package}.asgi:application', '--port', str(self.port),
+                    '--workers', str(self.workers), '--no-access-log']
+        return [sys.executable, 'manage.py', 'runserver', str(self.port), '--noreload']
+
+    def start(self):
+        env = {**os.environ, **self.env, 'DJANGO_SETTINGS_MODULE': self.settings_module}
+        subprocess.run([sys.executable, 'manage.py', 'migrate', '--verbosity', '0'], cwd=self.project, env=env,
+                       check=True)
+        log = open(self.log_path, 'w')
+        self.process = subprocess.Popen(self.command(), cwd=self.project, env=env, stdout=log,
+                                        stderr=subprocess.STDOUT)
+
+    def wait_ready(self, path, timeout=60):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process is not None and self.process.poll() is not None:
+                raise RuntimeError(f'{self.name} service exited, see {self.log_path}')
+            try:
+                requests.get(self.url + path, timeout=2)
+                return
+            except requests.RequestException:
+                time.sleep(0.2)
+        raise RuntimeError(f'{self.name} service did not start within {timeout}s, see {self.log_path}')
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+def print_report(report, previous=None):
+    previous_endpoints = (previous or {}).get('endpoints', {})
+    header = f'{"operation":<16}{"req":>8}{"req/s":>9}{"err":>6}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"q/req":>7}'
+    if previous:
+        header += f'{"p95 vs base":>13}{"req/s vs base":>15}'
+    print(header)
+    for name, stats in report['endpoints'].items():
+        latency = stats['latency_ms']
+        line = (f'{name:<16}{stats["requests"]:>8}{stats["requests_per_second"] or 0:>9}{stats["errors"]:>6}'
+                f'{latency.get("p50", "-"):>9}{latency.get("p95", "-"):>9}{latency.get("p99", "-"):>9}'
+                f'{stats["db_queries"]["per_request"] if stats["db_queries"]["per_request"] is not None else "-":>7}')
+        base = previous_endpoints.get(name)
+        if previous and base and base['latency_ms'] and latency:
+            p95_change = (latency['p95'] - base['latency_ms']['p95']) / base['latency_ms']['p95'] * 100
+            rps_change = ((stats['requests_per_second'] - base['requests_per_second'])
+                          / base['requests_per_second'] * 100) if base['requests_per_second'] else 0
+            line += f'{p95_change:>+12.1f}%{rps_change:>+14.1f}%'
+        print(line)
+    total = report['total']
+    print(f'total: {total["requests"]} requests, {total["requests_per_second"]} req/s, {total["errors"]} errors')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load benchmark for the Trip and Booking services.')
+    parser.add_argument('--rows', type=int, default=10_000,
+                        help='Routes, trips and bookings to seed (10k to 10M)')
+    parser.add_argument('--reserve', type=int, default=10_000,
+                        help='Spare routes and trips seeded for add_trip and add_booking')
+    parser.add_argument('--seed-batch', type=int, default=20_000, help='Rows per bulk upload request')
+    parser.add_argument('--skip-seed', action='store_true', help='Use the data already loaded')
+    parser.add_argument('--mix', type=parse_mix, default=None,
+                        help='Operation weights, e.g. "trip_details=5,add_booking=1" (default: a read heavy mix)')
+    parser.add_argument('--concurrency', type=int, default=8, help='Client threads')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds to run the mix for, 0 for no limit')
+    parser.add_argument('--requests', type=int, default=0, help='Stop after this many requests, 0 for no limit')
+    parser.add_argument('--warmup', type=float, default=5, help='Seconds of unrecorded load before the run')
+    parser.add_argument('--random-seed', type=int, default=1, help='Seed of the request mix')
+    parser.add_argument('--output', help='Write the report to this JSON file')
+    parser.add_argument('--compare', help='A previous report to show the changes against')
+    parser.add_argument('--trip-url', help='Benchmark an already running trip service instead of starting one')
+    parser.add_argument('--booking-url', help='Benchmark an already running booking service instead of starting one')
+    parser.add_argument('--trip-port', type=int, default=8100)
+    parser.add_argument('--booking-port', type=int, default=8101)
+    parser.add_argument('--trip-settings', help='DJANGO_SETTINGS_MODULE of the trip service (default: its own)')
+    parser.add_argument('--booking-settings', help='DJANGO_SETTINGS_MODULE of the booking service (default: its own)')
+    parser.add_argument('--pythonpath', help='Added to PYTHONPATH of both services, e.g. for local settings modules')
+    parser.add_argument('--server', choices=['runserver', 'gunicorn', 'uvicorn'], default='runserver',
+                        help='How the services are served (gunicorn and uvicorn must be installed)')
+    parser.add_argument('--workers', type=int, default=4, help='Worker processes for gunicorn and uvicorn')
+    parser.add_argument('--async-views', action='store_true', help='Serve the async views (ASYNC_VIEWS=1)')
+    parser.add_argument('--log-dir', help='Where the service logs go (default: a temporary directory)')
+    args = parser.parse_args(argv)
+    if (args.trip_url is None) != (args.booking_url is None):
+        parser.error('--trip-url and --booking-url go together')
+    if not args.duration and not args.requests:
+        parser.error('Give a --duration or a --requests limit')
+    mix = args.mix or dict(DEFAULT_MIX)
+
+    services = []
+    if args.trip_url:
+        trip_url, booking_url = args.trip_url.rstrip('/'), args.booking_url.rstrip('/')
+    else:
+        log_dir = args.log_dir or tempfile.mkdtemp(prefix='loadtest-')
+        trip_url = f'http://127.0.0.1:{args.trip_port}'
+        booking_url = f'http://127.0.0.1:{args.booking_port}'
+        env = {
+            'QUERY_COUNT_HEADER': '1',
+            'ASYNC_VIEWS': '1' if args.async_views else '',
+            'TRIP_SERVICE_URL': trip_url,
+            'BOOKING_SERVICE_URL': booking_url,
+        }
+        if args.pythonpath:
+            env['PYTHONPATH'] = os.pathsep.join(filter(None, [args.pythonpath, os.environ.get('PYTHONPATH')]))
+        services = [
+            Service('trip', TRIP_PROJECT, 'Trip_service', args.trip_port, args.trip_settings, env, args.server,
+                    args.workers, log_dir),
+            Service('booking', BOOKING_PROJECT, 'Booking_service', args.booking_port, args.booking_settings, env,
+                    args.server, args.workers, log_dir),
+        ]
+        print(f'Starting the services, logs in {log_dir}')
+
+    try:
+        for service in services:
+            service.start()
+        for service in services:
+            service.wait_ready('/service_stats/')
+
+        dataset = Dataset(args.rows, args.reserve)
+        seed_report = None
+        if not args.skip_seed:
+            print(f'Seeding {dataset.routes} routes, {dataset.trips} trips and {dataset.bookings} bookings')
+            seed_report = seed(trip_url, booking_url, dataset, args.seed_batch)
+
+        workload = Workload(trip_url, booking_url, dataset)
+        if args.warmup:
+            print(f'Warming up for {args.warmup}s')
+            run_workload(workload, mix, args.concurrency, args.warmup, 0, args.random_seed + 10_000)
+        print(f'Running for {args.duration}s with {args.concurrency} threads')
+        stats, transport_errors, elapsed = run_workload(workload, mix, args.concurrency, args.duration, args.requests,
+                                                        args.random_seed)
+    finally:
+        for service in services:
+            service.stop()
+
+    total = EndpointStats()
+    for endpoint_stats in stats.values():
+        total.merge(endpoint_stats)
+    report = {
+        'started_at': datetime.now(timezone.utc).isoformat(),
+        'host': {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count()},
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        'mix': mix,
+        'dataset': {'routes': dataset.routes, 'trips': dataset.trips, 'bookings': dataset.bookings},
+        'seed': seed_report,
+        'elapsed_seconds': round(elapsed, 2),
+        'endpoints': {name: stats[name].report(elapsed) for name in mix},
+        'transport_errors': transport_errors,
+        'total': total.report(elapsed),
+    }
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+    print_report(report, previous)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Saved to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,16 @@
+"""
+The project's URLconf with the async variants of the core views, whatever
+ASYNC_VIEWS says, so the tests can run them next to the sync ones.
+"""
+from django.urls import path, include
+from route import async_views as route_async_views
+from route.urls import core_urlpatterns as route_urlpatterns
+from trip import async_views as trip_async_views
+from trip.urls import core_urlpatterns as trip_urlpatterns
+from .urls import urlpatterns as project_urlpatterns
+
+urlpatterns = [
+    path('', include(trip_urlpatterns(trip_async_views))),
+    path('', include(route_urlpatterns(route_async_views))),
+    *project_urlpatterns,
+]
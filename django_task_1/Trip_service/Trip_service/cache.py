@@ -0,0 +1,128 @@
+import threading
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+DEFAULTS = {
+    'MAX_ENTRIES': 10000,
+    'BACKEND': None,
+    'TIMEOUT': 300,
+}
+
+
+class DetailsCache:
+    """
+    Read-through cache for the route_details and trip_details payloads.
+
+    A size bounded in-process LRU sits in front of an optional shared
+    Django cache backend. Routes and trips are never updated in place, so
+    inserts only need to refresh or drop their own keys.
+    """
+
+    def __init__(self, max_entries, backend=None, timeout=300):
+        self.max_entries = max_entries
+        self.backend = caches[backend] if backend else None
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.shared_hits = self.misses = self.evictions = 0
+
+    def _local_get(self, key):
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def _local_set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _shared_hit(self, key, value):
+        if value is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.shared_hits += 1
+        self._local_set(key, value)
+        return value
+
+    def get(self, key):
+        value = self._local_get(key)
+        if value is not None:
+            return value
+        return self._shared_hit(key, self.backend.get(key) if self.backend else None)
+
+    async def aget(self, key):
+        value = self._local_get(key)
+        if value is not None:
+            return value
+        return self._shared_hit(key, await self.backend.aget(key) if self.backend else None)
+
+    def set(self, key, value):
+        self._local_set(key, value)
+        if self.backend:
+            self.backend.set(key, value, self.timeout)
+
+    async def aset(self, key, value):
+        self._local_set(key, value)
+        if self.backend:
+            await self.backend.aset(key, value, self.timeout)
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+        if self.backend:
+            self.backend.delete_many(keys)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'shared_backend': bool(self.backend),
+            }
+
+
+def route_key(route_id):
+    return f'route_details:{route_id}'
+
+
+def trip_key(trip_id):
+    return f'trip_details:{trip_id}'
+
+
+_details_cache = None
+_details_cache_lock = threading.Lock()
+
+
+def get_details_cache():
+    global _details_cache
+    if _details_cache is None:
+        with _details_cache_lock:
+            if _details_cache is None:
+                options = {**DEFAULTS, **getattr(settings, 'DETAILS_CACHE', {})}
+                _details_cache = DetailsCache(options['MAX_ENTRIES'], options['BACKEND'], options['TIMEOUT'])
+    return _details_cache
+
+
+@receiver(setting_changed)
+def reset_details_cache(setting=None, **kwargs):
+    global _details_cache
+    if setting in (None, 'DETAILS_CACHE', 'CACHES'):
+        _details_cache = None
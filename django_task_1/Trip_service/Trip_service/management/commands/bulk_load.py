@@ -0,0 +1,16 @@
+from Trip_service.bulk_load import BulkLoadCommand, LoadTable
+from route.ingest import copy_ingest_routes, ingest_routes
+from route.models import Route, RouteStop, RouteSummary
+from trip.ingest import copy_ingest_trips, ingest_trips
+from trip.models import Trip, TripChange
+
+
+class Command(BulkLoadCommand):
+    help = ('Load routes or trips from a CSV or NDJSON file with the checks of /bulk_add_routes/ and '
+            '/bulk_add_trips/, through COPY on Postgres')
+
+    tables = {
+        'routes': LoadTable('route_id', copy_ingest_routes, ingest_routes, [Route, RouteStop, RouteSummary],
+                            json_columns=['stops']),
+        'trips': LoadTable('trip_id', copy_ingest_trips, ingest_trips, [Trip, TripChange, RouteSummary]),
+    }
@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from Trip_service.tracing import DEFAULTS, read_spans, waterfall
+
+
+class Command(BaseCommand):
+    help = ('Draw the waterfall of a traced request across both services from the span files, '
+            'or list the latest traced requests')
+
+    def add_arguments(self, parser):
+        parser.add_argument('request_id', nargs='?', help='The X-Request-ID of a response, default: list requests')
+        parser.add_argument('--directory', help='Span file directory, default: TRACING["DIRECTORY"]')
+        parser.add_argument('--width', type=int, default=40, help='Width of the time axis')
+        parser.add_argument('--last', type=int, default=20, help='Number of requests to list')
+
+    def handle(self, *args, **options):
+        directory = options['directory'] or {**DEFAULTS, **getattr(settings, 'TRACING', {})}['DIRECTORY']
+        if not options['request_id']:
+            # The requests that started a trace, newest last
+            roots = [span for span in read_spans(directory) if span['kind'] == 'server' and span['parent_id'] is None]
+            for span in sorted(roots, key=lambda span: span['start'])[-options['last']:]:
+                attributes = span['attributes']
+                self.stdout.write(f"{span['trace_id']}  {span['duration_ms']:9.1f} ms  {span['service']:<10} "
+                                  f"{attributes['method']} {attributes['path']} {attributes['status']}")
+            return
+
+        spans = read_spans(directory, options['request_id'])
+        if not spans:
+            raise CommandError(f'No spans of {options["request_id"]} in {directory}')
+        services = sorted({span['service'] for span in spans})
+        self.stdout.write(f'Request {options["request_id"]}: {len(spans)} spans in {", ".join(services)}')
+        self.stdout.write(f'{"start ms":>9} {"took ms":>9}  {"service":<10} {"span":<70} |{"":<{options["width"]}}|')
+        for line in waterfall(spans, width=options['width']):
+            self.stdout.write(line)
@@ -0,0 +1,132 @@
+import bisect
+import math
+import threading
+from .request_context import current_request
+
+# Prometheus client defaults, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Every metric, in the order /metrics lists them
+REGISTRY = []
+
+
+class Counter:
+    """A counter per combination of label values, safe to increment from any thread."""
+
+    type = 'counter'
+
+    def __init__(self, name, documentation, labels):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            yield self.name, dict(zip(self.labels, label_values)), value
+
+
+class Histogram:
+    """
+    Observations counted into fixed buckets per combination of label values.
+    An observation is one bisect and one locked list update, the cumulative
+    bucket counts Prometheus expects are only summed up when rendered.
+    """
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labels, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [count per bucket..., count above the last, sum]
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, *label_values, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def samples(self):
+        with self._lock:
+            items = sorted((label_values, list(series)) for label_values, series in self._series.items())
+        for label_values, series in items:
+            labels = dict(zip(self.labels, label_values))
+            count = 0
+            for bound, bucket_count in zip((*self.buckets, math.inf), series):
+                count += bucket_count
+                yield f'{self.name}_bucket', {**labels, 'le': _number(bound)}, count
+            yield f'{self.name}_count', labels, count
+            yield f'{self.name}_sum', labels, series[-1]
+
+
+def _number(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render():
+    """Every metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.type}')
+        for name, labels, value in metric.samples():
+            if labels:
+                name += '{' + ','.join(f'{label}="{_label_value(v)}"' for label, v in labels.items()) + '}'
+            lines.append(f'{name} {_number(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'Time to produce a response, by view, method and status',
+    ['view', 'method', 'status'])
+REQUEST_DB_QUERIES = Counter(
+    'http_request_db_queries_total', 'SQL queries run while handling requests, by view', ['view'])
+REQUEST_DB_DURATION = Histogram(
+    'http_request_db_duration_seconds', 'Time each request spent in SQL queries, by view', ['view'])
+REQUEST_OUTBOUND_DURATION = Histogram(
+    'http_request_outbound_duration_seconds', 'Time each request spent calling peer services, by view', ['view'])
+OUTBOUND_REQUESTS = Counter(
+    'outbound_requests_total', 'Calls to peer services, every attempt, by target, method and status',
+    ['target', 'method', 'status'])
+OUTBOUND_DURATION = Histogram(
+    'outbound_request_duration_seconds', 'Latency of calls to peer services, every attempt, by target and method',
+    ['target', 'method'])
+
+
+def observe_outbound(target, method, status, seconds):
+    """Record one call to a peer service, status being the response status or "error"."""
+    OUTBOUND_REQUESTS.inc(target, method, status)
+    OUTBOUND_DURATION.observe(target, method, value=seconds)
+    request_context = current_request.get()
+    if request_context is not None:
+        request_context.outbound_seconds += seconds
+
+
+def observe_request(view, method, status, seconds, request_context):
+    REQUEST_DURATION.observe(view, method, status, value=seconds)
+    REQUEST_DB_QUERIES.inc(view, amount=request_context.queries)
+    REQUEST_DB_DURATION.observe(view, value=request_context.db_seconds)
+    REQUEST_OUTBOUND_DURATION.observe(view, value=request_context.outbound_seconds)
@@ -0,0 +1,150 @@
+import json
+import re
+from contextlib import contextmanager
+from unittest import mock
+import requests
+from asgiref.sync import async_to_sync
+from django.db import connection, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from .service_client import ServiceClient
+
+# SQLite reports a full table walk as "SCAN <table>" with no index named
+_SQLITE_FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$')
+
+
+def _postgres_seq_scans(plan):
+    scans = []
+    if plan.get('Node Type') == 'Seq Scan':
+        scans.append(plan['Relation Name'])
+    for child in plan.get('Plans', []):
+        scans.extend(_postgres_seq_scans(child))
+    return scans
+
+
+def sequential_scans(sql):
+    """
+    Return the tables sql reads with a sequential scan, or None when the
+    database has no plan to look at.
+
+    On Postgres the plan is taken with enable_seqscan off, so a Seq Scan is
+    left only where no index can answer the query. SQLite's query planner
+    uses an index whenever one applies, a plain SCAN means there is none.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            with transaction.atomic():
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}')
+                plan = cursor.fetchone()[0]
+                # Rolling the savepoint back undoes the SET LOCAL as well
+                transaction.set_rollback(True)
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return _postgres_seq_scans(plan[0]['Plan'])
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [match.group(1) for match in (_SQLITE_FULL_SCAN.match(row[-1]) for row in cursor.fetchall())
+                    if match]
+    return None
+
+
+class QueryBudgetMixin:
+    """
+    TestCase assertions pinning the SQL an endpoint runs: how many queries it
+    may take, and that its reads are answered from an index.
+    """
+
+    def get_all(self, path, **kwargs):
+        # GET path and read a streamed body through, so its queries are counted too
+        response = self.client.get(path, **kwargs)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+    @contextmanager
+    def assertMaxQueries(self, budget):
+        with CaptureQueriesContext(connection) as captured:
+            yield captured
+        if len(captured) > budget:
+            queries = '\n'.join(f'{number}. {query["sql"]}' for number, query in enumerate(captured, start=1))
+            self.fail(f'{len(captured)} queries executed, the budget is {budget}\n{queries}')
+
+    def assertIndexScans(self, captured, allowed=()):
+        """Fail for a SELECT in captured that scans a whole table, other than the allowed tables."""
+        for query in captured:
+            if not query['sql'].lstrip().upper().startswith('SELECT'):
+                continue
+            scans = sequential_scans(query['sql'])
+            if scans is None:
+                self.skipTest(f'No query plans for {connection.vendor}')
+            scans = [table for table in scans if table not in allowed]
+            if scans:
+                self.fail(f'Sequential scan of {", ".join(scans)} in:\n{query["sql"]}')
+
+
+class AsyncViewsMixin:
+    """
+    For TestCases run with override_settings(ROOT_URLCONF='Trip_service.async_urls'):
+    send_both() sends a request to the async variant of a view through the
+    AsyncClient, and to the sync view through the project's URLconf, so a
+    fix made to one copy and not the other fails the test.
+    """
+
+    sync_urlconf = 'Trip_service.urls'
+
+    def reset_views(self):
+        """Drop state (e.g. caches) one variant's request leaves for the other, before each request."""
+
+    def send_both(self, method, path, data=None, async_data=None, **extra):
+        """
+        Return the (sync, async) responses to method path, each view sent
+        data, or async_data for the async one when given.
+        """
+        self.reset_views()
+        with override_settings(ROOT_URLCONF=self.sync_urlconf):
+            sync_response = getattr(self.client, method)(path, data, **extra)
+        self.reset_views()
+
+        async def send():
+            return await getattr(self.async_client, method)(path, data if async_data is None else async_data, **extra)
+
+        return sync_response, async_to_sync(send)()
+
+    def assertBothAnswer(self, method, path, data=None, status=200, **extra):
+        """Check both variants answer method path alike with status, and return the async answer's JSON."""
+        sync_response, async_response = self.send_both(method, path, data, **extra)
+        self.assertEqual(sync_response.status_code, status, sync_response.content)
+        self.assertEqual(async_response.status_code, status, async_response.content)
+        self.assertEqual(async_response.json(), sync_response.json())
+        return async_response.json()
+
+
+def service_response(status, data):
+    response = requests.Response()
+    response.status_code = status
+    response.headers['Content-Type'] = 'application/json'
+    response._content = json.dumps(data).encode()
+    return response
+
+
+@contextmanager
+def stub_service_calls(answers):
+    """
+    Answer peer service calls from answers, a dict of (method, path) to
+    (status, data), instead of the network. The yielded list records the
+    (method, path) of every call, one missing from answers fails the test.
+    """
+    calls = []
+
+    def request(client, method, path, idempotent=None, **kwargs):
+        calls.append((method, path))
+        if (method, path) not in answers:
+            raise AssertionError(f'Unexpected call to {method} {client.url(path)}')
+        return service_response(*answers[method, path])
+
+    async def arequest(client, method, path, idempotent=None, **kwargs):
+        return request(client, method, path, idempotent, **kwargs)
+
+    with mock.patch.object(ServiceClient, 'request', request), mock.patch.object(ServiceClient, 'arequest', arequest):
+        yield calls
@@ -0,0 +1,179 @@
+import asyncio
+from pathlib import Path
+from unittest import skipIf, skipUnless
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.test import SimpleTestCase
+from .request_context import RequestContext, current_request
+from .service_client import ServiceClient
+from .tracing import Tracer
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+# Each service is deployed as its own tree, so these are kept as one copy
+# per service. They only differ in the project package they import from.
+SHARED_FILES = [
+    'Trip_service/bulk_load.py',
+    'Trip_service/export.py',
+    'Trip_service/metrics.py',
+    'Trip_service/middleware.py',
+    'Trip_service/ndjson.py',
+    'Trip_service/pagination.py',
+    'Trip_service/request_context.py',
+    'Trip_service/search.py',
+    'Trip_service/serializers.py',
+    'Trip_service/service_client.py',
+    'Trip_service/testing.py',
+    'Trip_service/tracing.py',
+    'Trip_service/management/commands/show_trace.py',
+    'jobs/apps.py',
+    'jobs/models.py',
+    'jobs/queue.py',
+    'jobs/urls.py',
+    'jobs/views.py',
+    'jobs/management/commands/run_jobs.py',
+    'jobs/migrations/0001_initial.py',
+]
+
+TRIP_SERVICE = Path(settings.BASE_DIR)
+BOOKING_SERVICE = TRIP_SERVICE.parent.parent / 'django_task_2' / 'Booking_service'
+
+
+@skipUnless(BOOKING_SERVICE.is_dir(), 'The booking service is not checked out next to this one')
+class SharedFilesTests(SimpleTestCase):
+
+    def test_booking_service_copies_match(self):
+        # A fix made in one copy and not the other fails here
+        for name in SHARED_FILES:
+            with self.subTest(name=name):
+                trip = (TRIP_SERVICE / name).read_text()
+                booking = (BOOKING_SERVICE / name.replace('Trip_service/', 'Booking_service/')).read_text()
+                self.assertEqual(booking.replace('Booking_service', 'Trip_service'), trip)
+
+
+class ScriptedAdapter(HTTPAdapter):
+    """Answers each request with the next outcome, a status code or an exception to raise."""
+
+    def __init__(self, outcomes):
+        super().__init__()
+        self.outcomes = list(outcomes)
+        self.sent = []
+
+    def send(self, request, **kwargs):
+        self.sent.append(request)
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        response = requests.Response()
+        response.status_code = outcome
+        response.request = request
+        response.url = request.url
+        response._content = b'{}'
+        return response
+
+
+class ServiceClientRetryTests(SimpleTestCase):
+
+    def client_answering(self, *outcomes):
+        client = ServiceClient('http://trip.test', retries=2, backoff=0)
+        adapter = ScriptedAdapter(outcomes)
+        client.session.mount('http://', adapter)
+        return client, adapter
+
+    def assertCounts(self, client, requests, retried, failures):
+        stats = client.stats()
+        self.assertEqual((stats['requests'], stats['retried'], stats['failures']), (requests, retried, failures))
+
+    def test_post_is_sent_once(self):
+        client, adapter = self.client_answering(503)
+        self.assertEqual(client.post('/add_trip/', json={}).status_code, 503)
+        self.assertEqual(len(adapter.sent), 1)
+        self.assertCounts(client, 1, 0, 0)
+
+    def test_idempotent_post_is_retried(self):
+        client, adapter = self.client_answering(503, 200)
+        self.assertEqual(client.request('POST', '/trip_lookup/', idempotent=True, json={}).status_code, 200)
+        self.assertEqual(len(adapter.sent), 2)
+
+    def test_get_is_retried_until_it_is_answered(self):
+        client, adapter = self.client_answering(503, requests.ConnectionError(), 200)
+        self.assertEqual(client.get('/trip_details/TP00000001/').status_code, 200)
+        self.assertEqual(len(adapter.sent), 3)
+        self.assertCounts(client, 3, 2, 0)
+
+    def test_get_returns_the_last_answer_once_the_retries_run_out(self):
+        client, adapter = self.client_answering(503, 502, 504)
+        self.assertEqual(client.get('/trip_details/TP00000001/').status_code, 504)
+        self.assertEqual(len(adapter.sent), 3)
+        self.assertCounts(client, 3, 2, 0)
+
+    def test_get_raises_once_the_retries_run_out(self):
+        client, adapter = self.client_answering(requests.ConnectionError(), requests.Timeout(), requests.ConnectionError())
+        with self.assertRaises(requests.ConnectionError):
+            client.get('/trip_details/TP00000001/')
+        self.assertEqual(len(adapter.sent), 3)
+        self.assertCounts(client, 3, 2, 1)
+
+    def test_other_answers_are_not_retried(self):
+        client, adapter = self.client_answering(404)
+        self.assertEqual(client.get('/trip_details/TP00000001/').status_code, 404)
+        self.assertEqual(len(adapter.sent), 1)
+
+    def test_traceparent_is_forwarded_per_attempt(self):
+        client, adapter = self.client_answering(503, 200)
+        trace = Tracer('trip', settings.BASE_DIR).start_trace()
+        token = current_request.set(RequestContext(trace))
+        try:
+            client.get('/trip_details/TP00000001/')
+        finally:
+            current_request.reset(token)
+        headers = [request.headers['traceparent'] for request in adapter.sent]
+        self.assertEqual(headers, [trace.traceparent(span['span_id']) for span in trace.spans])
+        self.assertEqual(len(set(headers)), 2)
+        self.assertEqual([span['attributes']['status'] for span in trace.spans], ['503', '200'])
+
+    @skipIf(httpx is None, 'httpx is not installed')
+    def test_async_requests_follow_the_same_policy(self):
+        def run(method, outcomes, **kwargs):
+            client = ServiceClient('http://trip.test', retries=2, backoff=0)
+            outcomes = list(outcomes)
+            sent = []
+
+            def handler(request):
+                sent.append(request)
+                outcome = outcomes.pop(0)
+                if isinstance(outcome, Exception):
+                    raise outcome
+                return httpx.Response(outcome, json={})
+
+            async def send():
+                async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as http:
+                    client._async_clients[asyncio.get_running_loop()] = http
+                    try:
+                        return (await client.arequest(method, '/trip_details/TP00000001/', **kwargs)).status_code
+                    except httpx.HTTPError as e:
+                        return type(e)
+
+            return asyncio.run(send()), sent, client
+
+        status, sent, client = run('POST', [503])
+        self.assertEqual((status, len(sent)), (503, 1))
+        status, sent, client = run('GET', [503, 502, 200])
+        self.assertEqual((status, len(sent)), (200, 3))
+        self.assertCounts(client, 3, 2, 0)
+        status, sent, client = run('GET', [httpx.ConnectError('refused')] * 3)
+        self.assertEqual((status, len(sent)), (httpx.ConnectError, 3))
+        self.assertCounts(client, 3, 2, 1)
+
+        trace = Tracer('trip', settings.BASE_DIR).start_trace()
+        token = current_request.set(RequestContext(trace))
+        try:
+            status, sent, client = run('GET', [503, 200])
+        finally:
+            current_request.reset(token)
+        self.assertEqual([request.headers['traceparent'] for request in sent],
+                         [trace.traceparent(span['span_id']) for span in trace.spans])
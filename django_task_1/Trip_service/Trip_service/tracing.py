@@ -0,0 +1,212 @@
+import glob
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from .request_context import current_request
+
+DEFAULTS = {
+    'ENABLED': False,
+    'DIRECTORY': 'traces',
+    'SERVICE_NAME': 'service',
+    'MAX_SPANS': 1000,
+    'SQL_LENGTH': 200,
+}
+
+# W3C trace context header: version-trace_id-parent_span_id-flags
+TRACEPARENT = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$')
+
+
+def new_id(bits):
+    return f'{random.getrandbits(bits):0{bits // 4}x}'
+
+
+class Trace:
+    """
+    The spans one service records for one request. They are kept in memory
+    and written out together when the request ends, at most max_spans of
+    them, the rest only counted.
+    """
+
+    def __init__(self, tracer, trace_id, parent_id):
+        self.tracer = tracer
+        self.trace_id = trace_id
+        self.parent_id = parent_id
+        self.span_id = new_id(64)
+        self.spans = []
+        self.dropped = 0
+        # Span starts are perf_counter readings, turned into wall clock times from here
+        self.perf_start = time.perf_counter()
+        self.wall_start = time.time()
+
+    def traceparent(self, span_id):
+        return f'00-{self.trace_id}-{span_id}-01'
+
+    def _span(self, span_id, parent_id, kind, name, started, seconds, attributes):
+        return {
+            'trace_id': self.trace_id,
+            'span_id': span_id,
+            'parent_id': parent_id,
+            'service': self.tracer.service_name,
+            'kind': kind,
+            'name': name,
+            'start': self.wall_start + (started - self.perf_start),
+            'duration_ms': round(seconds * 1000, 3),
+            'attributes': attributes,
+        }
+
+    def add(self, kind, name, started, seconds, span_id=None, **attributes):
+        # A span inside the request, started at the perf_counter reading started
+        if len(self.spans) >= self.tracer.max_spans:
+            self.dropped += 1
+            return
+        self.spans.append(self._span(span_id or new_id(64), self.span_id, kind, name, started, seconds, attributes))
+
+    def finish(self, name, started, seconds, **attributes):
+        # The request's own span, child of the caller's span when there is one
+        if self.dropped:
+            attributes['dropped_spans'] = self.dropped
+        self.spans.append(self._span(self.span_id, self.parent_id, 'server', name, started, seconds, attributes))
+
+
+class Tracer:
+    """Starts a Trace per request and appends finished ones to this process's JSONL span file."""
+
+    def __init__(self, service_name, directory, max_spans=1000, sql_length=200):
+        self.service_name = service_name
+        self.directory = directory
+        self.max_spans = max_spans
+        self.sql_length = sql_length
+        self._lock = threading.Lock()
+
+    def start_trace(self, traceparent=None):
+        # Continue the caller's trace when the request carries one
+        match = TRACEPARENT.match(traceparent or '')
+        if match:
+            return Trace(self, match.group(1), match.group(2))
+        return Trace(self, new_id(128), None)
+
+    def export(self, trace):
+        lines = ''.join(json.dumps(span, separators=(',', ':')) + '\n' for span in trace.spans)
+        # One file per process, so concurrent workers never interleave lines
+        path = os.path.join(self.directory, f'{self.service_name}-{os.getpid()}.jsonl')
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(path, 'a') as f:
+                f.write(lines)
+
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer():
+    """The process wide Tracer, None while TRACING is not enabled."""
+    global _tracer
+    if _tracer is None:
+        with _tracer_lock:
+            if _tracer is None:
+                options = {**DEFAULTS, **getattr(settings, 'TRACING', {})}
+                _tracer = False
+                if options['ENABLED']:
+                    _tracer = Tracer(options['SERVICE_NAME'], str(options['DIRECTORY']),
+                                     max_spans=options['MAX_SPANS'], sql_length=options['SQL_LENGTH'])
+    return _tracer or None
+
+
+@receiver(setting_changed)
+def reset_tracer(setting=None, **kwargs):
+    global _tracer
+    if setting in (None, 'TRACING'):
+        _tracer = None
+
+
+def _current_trace():
+    request_context = current_request.get()
+    return request_context.trace if request_context is not None else None
+
+
+def outbound_span():
+    """
+    The (span_id, traceparent header) for a call to a peer service made
+    while handling a traced request, (None, None) otherwise.
+    """
+    trace = _current_trace()
+    if trace is None:
+        return None, None
+    span_id = new_id(64)
+    return span_id, trace.traceparent(span_id)
+
+
+def record_outbound(span_id, method, url, status, started, seconds):
+    trace = _current_trace()
+    if trace is not None and span_id is not None:
+        trace.add('client', f'{method} {url}', started, seconds, span_id=span_id, method=method, url=url,
+                  status=status)
+
+
+def read_spans(directory, trace_id=None):
+    """Spans from every service's JSONL files in directory, only trace_id's when given."""
+    spans = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.jsonl'))):
+        with open(path) as f:
+            for line in f:
+                # A substring test first, most lines belong to other traces
+                if trace_id is not None and trace_id not in line:
+                    continue
+                try:
+                    span = json.loads(line)
+                except ValueError:
+                    # A line still being written by a running service
+                    continue
+                if trace_id is None or span['trace_id'] == trace_id:
+                    spans.append(span)
+    return spans
+
+
+def span_label(span):
+    attributes = span['attributes']
+    if span['kind'] == 'server':
+        return f"{attributes['method']} {span['name']} {attributes['status']}"
+    if span['kind'] == 'client':
+        return f"-> {span['name']} {attributes['status']}"
+    return ' '.join(attributes.get('sql', span['name']).split())
+
+
+def waterfall(spans, width=40):
+    """
+    Lines drawing spans as a waterfall: each span's offset from the start of
+    the trace and its duration in ms, its service, and a bar on a shared
+    time axis, children indented under the span that started them.
+    """
+    if not spans:
+        return []
+    by_id = {span['span_id']: span for span in spans}
+    children = defaultdict(list)
+    for span in spans:
+        children[span['parent_id'] if span['parent_id'] in by_id else None].append(span)
+    start = min(span['start'] for span in spans)
+    end = max(span['start'] + span['duration_ms'] / 1000 for span in spans)
+    total_ms = max((end - start) * 1000, 0.001)
+
+    lines = []
+
+    def draw(span, depth):
+        offset_ms = (span['start'] - start) * 1000
+        left = min(int(offset_ms / total_ms * width), width - 1)
+        length = min(max(1, round(span['duration_ms'] / total_ms * width)), width - left)
+        bar = (' ' * left + '=' * length).ljust(width)
+        label = '  ' * depth + span_label(span)
+        lines.append(f"{offset_ms:9.1f} {span['duration_ms']:9.1f}  {span['service']:<10.10} {label:<70.70} |{bar}|")
+        for child in sorted(children[span['span_id']], key=lambda child: child['start']):
+            draw(child, depth + 1)
+
+    for root in sorted(children[None], key=lambda span: span['start']):
+        draw(root, 0)
+    return lines
@@ -18,6 +18,7 @@ from django.contrib import admin
 from django.urls import path, include
 
 from django.http import HttpResponse
+from . import views
 
 
 def index(request):
@@ -25,6 +26,10 @@ def index(request):
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('cache_stats/', views.cache_stats, name='cache_stats'),
+    path('service_stats/', views.service_stats, name='service_stats'),
+    path('metrics', views.metrics, name='metrics'),  # Where Prometheus scrapes by default
     path('', include('trip.urls')),  # Include trip app URLs
     path('', include('route.urls')),  # Include route app URLs
+    path('', include('jobs.urls')),  # Background import status
 ]
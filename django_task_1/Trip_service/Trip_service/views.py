@@ -0,0 +1,29 @@
+from django.http import JsonResponse, HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from .cache import get_details_cache
+from .service_client import service_client_stats
+from .metrics import CONTENT_TYPE, render
+
+
+@csrf_exempt
+def cache_stats(request):
+    if request.method == 'GET':
+        return JsonResponse({'details_cache': get_details_cache().stats()})
+    else:
+        return HttpResponse(status=405)
+
+
+@csrf_exempt
+def service_stats(request):
+    if request.method == 'GET':
+        return JsonResponse({'service_clients': service_client_stats()})
+    else:
+        return HttpResponse(status=405)
+
+
+@csrf_exempt
+def metrics(request):
+    if request.method == 'GET':
+        return HttpResponse(render(), content_type=CONTENT_TYPE)
+    else:
+        return HttpResponse(status=405)
@@ -0,0 +1,34 @@
+import time
+from django.core.management.base import BaseCommand
+from jobs.queue import claim_chunk, job_options, process_chunk
+
+
+class Command(BaseCommand):
+    help = 'Work through queued background import jobs, run several for more throughput'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Handle what is queued, then exit')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--lease', type=int, default=None,
+                            help='Seconds before a stalled worker\'s chunk is taken over (default JOBS["LEASE_SECONDS"])')
+
+    def handle(self, *args, **options):
+        lease = options['lease'] if options['lease'] is not None else job_options()['LEASE_SECONDS']
+        while True:
+            chunk = claim_chunk(lease)
+            if chunk is None:
+                if options['once']:
+                    return
+                time.sleep(options['interval'])
+                continue
+            started = time.perf_counter()
+            recorded = process_chunk(chunk)
+            seconds = time.perf_counter() - started
+            self.stdout.write(f'Job {chunk.job_id} chunk {chunk.index}: {chunk.row_count} rows in {seconds:.2f}s')
+            # A chunk outliving its lease is worked twice, say so before it happens
+            if not recorded:
+                self.stderr.write(f'Job {chunk.job_id} chunk {chunk.index} outlived its {lease}s lease and was taken '
+                                  f'over by another worker, raise JOBS["LEASE_SECONDS"] or lower CHUNK_SIZE')
+            elif seconds > lease / 2:
+                self.stderr.write(f'Job {chunk.job_id} chunk {chunk.index} took over half its {lease}s lease, '
+                                  f'raise JOBS["LEASE_SECONDS"] or lower CHUNK_SIZE')
@@ -0,0 +1,51 @@
+from django.db import models
+from django.db.models import Q
+
+
+class Job(models.Model):
+    # A bulk import accepted by an endpoint and worked through by run_jobs
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUSES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (SUCCEEDED, 'Succeeded'), (FAILED, 'Failed')]
+
+    kind = models.CharField(max_length=50)
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED)
+    total_rows = models.PositiveIntegerField(default=0)
+    processed_rows = models.PositiveIntegerField(default=0)
+    created_rows = models.PositiveIntegerField(default=0)
+    failed_rows = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+
+class JobChunk(models.Model):
+    # A slice of a job's rows, stored as NDJSON until a worker has handled it
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    job = models.ForeignKey(Job, on_delete=models.CASCADE, related_name='chunks')
+    index = models.PositiveIntegerField()
+    first_row = models.PositiveIntegerField()
+    row_count = models.PositiveIntegerField()
+    body = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    # Results of the rows that failed, with their row number in the whole upload
+    errors = models.JSONField(default=list)
+    error_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['job', 'index'], name='job_chunk_unique_index'),
+        ]
+        indexes = [
+            # Workers only look for chunks that still need handling, oldest first
+            models.Index(fields=['id'], condition=Q(status__in=['queued', 'running']), name='job_chunk_pending'),
+        ]
@@ -0,0 +1,210 @@
+import json
+from datetime import timedelta
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from Trip_service.ndjson import parse_lines
+from .models import Job, JobChunk
+
+DEFAULTS = {
+    'HANDLERS': {},
+    'CHUNK_SIZE': 1000,
+    'LEASE_SECONDS': 300,
+    'MAX_ATTEMPTS': 3,
+}
+
+# Errors listed by the status endpoint, the counts always cover every row
+MAX_LISTED_ERRORS = 100
+
+
+def job_options():
+    return {**DEFAULTS, **getattr(settings, 'JOBS', {})}
+
+
+def upload_lines(request):
+    """
+    The rows of a bulk upload as NDJSON lines: the body itself for
+    application/x-ndjson, else each element of a JSON array body. Raises
+    ValueError with the message to answer for a body that is not an array.
+    """
+    if request.content_type == 'application/x-ndjson':
+        return (line.decode() if isinstance(line, bytes) else line for line in request)
+    try:
+        rows = json.loads(request.body)
+    except json.JSONDecodeError:
+        raise ValueError('Invalid JSON data')
+    if not isinstance(rows, list):
+        raise ValueError('Expected a JSON array')
+    return (json.dumps(row, cls=DjangoJSONEncoder) for row in rows)
+
+
+def enqueue(kind, lines):
+    """
+    Store lines (one NDJSON row each) as a queued job of the given kind,
+    CHUNK_SIZE rows per chunk, and return the job. Nothing is validated here,
+    the worker's handler reports bad rows like the synchronous import does.
+    """
+    options = job_options()
+    if kind not in options['HANDLERS']:
+        raise ValueError(f'Unknown job kind: {kind}')
+    chunk_size = options['CHUNK_SIZE']
+
+    with transaction.atomic():
+        job = Job.objects.create(kind=kind)
+        chunks = []
+        rows = []
+        total_rows = 0
+        chunk_count = 0
+        for line in lines:
+            if not line.strip():
+                continue
+            rows.append(line.strip())
+            if len(rows) >= chunk_size:
+                chunks.append(JobChunk(job=job, index=chunk_count, first_row=total_rows + 1,
+                                       row_count=len(rows), body='\n'.join(rows)))
+                total_rows += len(rows)
+                chunk_count += 1
+                rows = []
+                if len(chunks) >= 100:
+                    JobChunk.objects.bulk_create(chunks)
+                    chunks = []
+        if rows:
+            chunks.append(JobChunk(job=job, index=chunk_count, first_row=total_rows + 1,
+                                   row_count=len(rows), body='\n'.join(rows)))
+            total_rows += len(rows)
+        JobChunk.objects.bulk_create(chunks)
+
+        job.total_rows = total_rows
+        if not total_rows:
+            job.status = Job.SUCCEEDED
+            job.started_at = job.finished_at = timezone.now()
+        job.save()
+    return job
+
+
+def job_accepted(job):
+    # Body of the 202 answer to a bulk upload queued with ?background=1
+    return {'job_id': job.id, 'status': job.status, 'total_rows': job.total_rows, 'status_url': f'/jobs/{job.id}/'}
+
+
+def claim_chunk(lease_seconds=None):
+    """
+    Take the oldest chunk that is queued, or whose worker has held it longer
+    than lease_seconds, and return it, or None when there is nothing to do.
+    The claim is a conditional UPDATE, so two workers never both win a chunk
+    and no row lock is needed. An expired chunk already claimed MAX_ATTEMPTS
+    times, whose workers keep dying on it (killed or out of memory), is
+    failed instead of handed out again.
+    """
+    options = job_options()
+    if lease_seconds is None:
+        lease_seconds = options['LEASE_SECONDS']
+    now = timezone.now()
+    expired = Q(status=JobChunk.RUNNING, claimed_at__lt=now - timedelta(seconds=lease_seconds))
+    candidates = JobChunk.objects.filter(Q(status=JobChunk.QUEUED) | expired).order_by('id') \
+        .values_list('id', 'status', 'claimed_at', 'attempts')[:10]
+    for chunk_id, status, claimed_at, attempts in candidates:
+        if status == JobChunk.RUNNING and attempts >= options['MAX_ATTEMPTS']:
+            chunk = JobChunk.objects.get(id=chunk_id)
+            if chunk.claimed_at == claimed_at:
+                errors = [{'row': chunk.first_row, 'status': 'error',
+                           'error': f'Chunk failed: its worker stopped without finishing it {attempts} times'}]
+                _finish_chunk(chunk, JobChunk.FAILED, 0, chunk.row_count, errors)
+            continue
+        claimed = JobChunk.objects.filter(id=chunk_id, status=status, claimed_at=claimed_at) \
+            .update(status=JobChunk.RUNNING, claimed_at=now, attempts=F('attempts') + 1)
+        if claimed:
+            chunk = JobChunk.objects.select_related('job').get(id=chunk_id)
+            Job.objects.filter(id=chunk.job_id, status=Job.QUEUED).update(status=Job.RUNNING, started_at=now)
+            return chunk
+    return None
+
+
+def process_chunk(chunk):
+    """
+    Run the chunk's rows through its job's handler, then record the outcome
+    on the chunk and the job's counters. A handler exception puts the chunk
+    back in the queue until MAX_ATTEMPTS, then fails all its rows.
+
+    Returns False when the chunk's lease ran out before it was done: another
+    worker has taken it over and its outcome is the one recorded, with the
+    rows this worker created reported as already existing. LEASE_SECONDS
+    has to be well above the time one chunk takes.
+    """
+    options = job_options()
+    handler = import_string(options['HANDLERS'][chunk.job.kind])
+    created = 0
+    errors = []
+    try:
+        for result in handler(parse_lines(chunk.body.split('\n'))):
+            if result['status'] == 'created':
+                created += 1
+            else:
+                errors.append({**result, 'row': result['row'] + chunk.first_row - 1})
+    except Exception as e:
+        if chunk.attempts < options['MAX_ATTEMPTS']:
+            return bool(JobChunk.objects.filter(id=chunk.id, status=JobChunk.RUNNING, claimed_at=chunk.claimed_at)
+                        .update(status=JobChunk.QUEUED, claimed_at=None))
+        errors = [{'row': chunk.first_row, 'status': 'error', 'error': f'Chunk failed: {e}'}]
+        return _finish_chunk(chunk, JobChunk.FAILED, 0, chunk.row_count, errors)
+    return _finish_chunk(chunk, JobChunk.DONE, created, chunk.row_count - created, errors)
+
+
+def _finish_chunk(chunk, status, created, failed, errors):
+    with transaction.atomic():
+        # A worker whose lease ran out lost the chunk to another one, which records it instead
+        finished = JobChunk.objects.filter(id=chunk.id, status=JobChunk.RUNNING, claimed_at=chunk.claimed_at) \
+            .update(status=status, errors=errors[:MAX_LISTED_ERRORS], error_count=failed, body='')
+        if not finished:
+            return False
+        Job.objects.filter(id=chunk.job_id).update(
+            processed_rows=F('processed_rows') + chunk.row_count,
+            created_rows=F('created_rows') + created,
+            failed_rows=F('failed_rows') + failed,
+        )
+        remaining = JobChunk.objects.filter(job_id=chunk.job_id, status__in=[JobChunk.QUEUED, JobChunk.RUNNING])
+        if not remaining.exists():
+            failed_chunks = JobChunk.objects.filter(job_id=chunk.job_id, status=JobChunk.FAILED).exists()
+            Job.objects.filter(id=chunk.job_id).update(status=Job.FAILED if failed_chunks else Job.SUCCEEDED,
+                                                       finished_at=timezone.now())
+    return True
+
+
+def run_pending(limit=None):
+    """Handle chunks until the queue is empty or limit chunks are done, returning how many were."""
+    done = 0
+    while limit is None or done < limit:
+        chunk = claim_chunk()
+        if chunk is None:
+            break
+        process_chunk(chunk)
+        done += 1
+    return done
+
+
+def job_status(job):
+    finished_at = job.finished_at or timezone.now()
+    elapsed = (finished_at - job.started_at).total_seconds() if job.started_at else 0
+    errors = []
+    for chunk_errors in job.chunks.filter(error_count__gt=0).order_by('index').values_list('errors', flat=True):
+        errors.extend(chunk_errors[:MAX_LISTED_ERRORS - len(errors)])
+        if len(errors) >= MAX_LISTED_ERRORS:
+            break
+    return {
+        'job_id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'total_rows': job.total_rows,
+        'processed_rows': job.processed_rows,
+        'created': job.created_rows,
+        'failed': job.failed_rows,
+        'progress': round(job.processed_rows / job.total_rows, 4) if job.total_rows else 1.0,
+        'rows_per_second': round(job.processed_rows / elapsed, 1) if elapsed > 0 else None,
+        'created_at': job.created_at,
+        'started_at': job.started_at,
+        'finished_at': job.finished_at,
+        'errors': errors,
+    }
@@ -0,0 +1,70 @@
+import json
+from django.test import TestCase, override_settings
+from route.models import Route
+from .models import Job, JobChunk
+from .queue import claim_chunk, process_chunk, run_pending
+
+
+def route_row(number):
+    return {'route_id': f'RT{number:08d}', 'user_id': 'U1', 'route_name': f'Route {number}',
+            'route_origin': 'Pune', 'route_destination': 'Goa', 'stops': ['Satara']}
+
+
+@override_settings(JOBS={'HANDLERS': {'import_routes': 'route.ingest.ingest_routes'}, 'CHUNK_SIZE': 2})
+class BackgroundImportTests(TestCase):
+
+    def test_upload_is_queued_then_worked_in_chunks(self):
+        rows = [route_row(1), route_row(2), route_row(3), {'route_id': 'bad'}, route_row(1)]
+        response = self.client.post('/bulk_add_routes/?background=1', json.dumps(rows),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json()['job_id']
+        self.assertEqual(response.json()['total_rows'], 5)
+        self.assertEqual(JobChunk.objects.filter(job_id=job_id).count(), 3)
+        self.assertFalse(Route.objects.exists())
+
+        self.assertEqual(run_pending(), 3)
+        job = self.client.get(response.json()['status_url']).json()['job']
+        self.assertEqual((job['status'], job['processed_rows'], job['created'], job['failed']), ('succeeded', 5, 3, 2))
+        self.assertEqual(job['progress'], 1.0)
+        # Row numbers count from the start of the upload, not the chunk
+        self.assertEqual([error['row'] for error in job['errors']], [4, 5])
+        self.assertEqual(Route.objects.count(), 3)
+
+    def test_ndjson_upload(self):
+        body = '\n'.join(json.dumps(route_row(number)) for number in range(1, 4)) + '\nnot json\n'
+        response = self.client.post('/bulk_add_routes/?background=1', body, content_type='application/x-ndjson')
+        run_pending()
+        job = Job.objects.get(id=response.json()['job_id'])
+        self.assertEqual((job.created_rows, job.failed_rows), (3, 1))
+
+    def test_a_chunk_is_claimed_once(self):
+        self.client.post('/bulk_add_routes/?background=1', json.dumps([route_row(1)]), content_type='application/json')
+        self.assertIsNotNone(claim_chunk())
+        self.assertIsNone(claim_chunk())
+        # Once its lease has run out another worker takes it over
+        self.assertIsNotNone(claim_chunk(lease_seconds=-1))
+
+    def test_a_chunk_whose_workers_keep_dying_is_failed(self):
+        response = self.client.post('/bulk_add_routes/?background=1', json.dumps([route_row(1)]),
+                                    content_type='application/json')
+        # Each claim's worker is killed before it finishes, its lease then runs out
+        for attempt in range(3):
+            self.assertIsNotNone(claim_chunk(lease_seconds=-1))
+        self.assertIsNone(claim_chunk(lease_seconds=-1))
+        job = self.client.get(response.json()['status_url']).json()['job']
+        self.assertEqual((job['status'], job['processed_rows'], job['failed']), ('failed', 1, 1))
+        self.assertIn('stopped without finishing it 3 times', job['errors'][0]['error'])
+
+    def test_a_worker_that_lost_its_lease_is_told(self):
+        self.client.post('/bulk_add_routes/?background=1', json.dumps([route_row(1)]), content_type='application/json')
+        slow = claim_chunk()
+        taken_over = claim_chunk(lease_seconds=-1)
+        self.assertTrue(process_chunk(taken_over))
+        self.assertFalse(process_chunk(slow))
+        self.assertEqual(Job.objects.get().created_rows, 1)
+
+    def test_unknown_job_and_bad_body(self):
+        self.assertEqual(self.client.get('/jobs/999/').status_code, 404)
+        response = self.client.post('/bulk_add_routes/?background=1', '{}', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,125 @@
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, HttpResponse
+from .models import Route
+from django.core.exceptions import ValidationError
+from Trip_service.search import get_search_backend
+from .views import ROUTE_SEARCH_FIELDS, ROUTE_SERIALIZER, route_details_payload, route_serializer
+from Trip_service.serializers import InvalidFields, api_response, pick, requested_fields
+from Trip_service.cache import get_details_cache, route_key
+from .ingest import validate_route
+from Trip_service.pagination import apaginate, akeyset_page, InvalidCursor
+import json
+
+
+# csrf_exempt() from Django 4.2 hides the coroutine from the handler,
+# so mark the async views by hand
+def csrf_exempt(view_func):
+    view_func.csrf_exempt = True
+    return view_func
+
+
+@csrf_exempt
+async def add_route(request):
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body)
+
+            # Validate input data
+            error = validate_route(data)
+            if error:
+                return JsonResponse({'error': error}, status=400)
+
+            # Add to the database, along with its stop index rows
+            route = await sync_to_async(Route.objects.create_with_stops)(
+                route_id=data['route_id'],
+                user_id=data['user_id'],
+                route_name=data['route_name'],
+                route_origin=data['route_origin'],
+                route_destination=data['route_destination'],
+                stops=data['stops']
+            )
+            await get_details_cache().aset(route_key(route.route_id), route_details_payload(route))
+            return JsonResponse({'message': 'Route added successfully', 'route_id': route.route_id}, status=200)
+        except json.JSONDecodeError:
+            return JsonResponse({'error': 'Invalid JSON data'}, status=400)
+        except ValidationError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        except Exception as e:
+            return JsonResponse({'error': str(e)}, status=400)
+    else:
+        return HttpResponse(status=405)
+
+
+@csrf_exempt
+async def route_listing(request):
+    if request.method == 'GET':
+        try:
+            serializer = route_serializer(request)
+        except InvalidFields as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        # In route_id order unless sorted otherwise
+        routes = Route.objects.order_by('route_id')
+
+        # Apply search filter based on query parameters
+        query = request.GET.get('query')
+        search = get_search_backend()
+        if query:
+            routes = routes.filter(search.q(query, ROUTE_SEARCH_FIELDS))
+
+        # Sorting
+        sort_fields = ['route_id', 'route_name', 'route_origin', 'route_destination']
+        sort_by = request.GET.get('sort_by', 'route_id')
+        if sort_by in sort_fields:
+            routes = routes.order_by(sort_by)
+        elif sort_by == 'relevance' and query:
+            routes = search.rank(routes, query, ROUTE_SEARCH_FIELDS)
+
+        # Load only the requested columns, plus the sort column the cursor is read from
+        if serializer is not ROUTE_SERIALIZER:
+            routes = routes.only(*serializer.only(), sort_by if sort_by in sort_fields else 'route_id')
+
+        # Keyset pagination when a cursor is given (?after=<cursor>, empty for the first page)
+        if 'after' in request.GET:
+            try:
+                page_routes, has_next, next_cursor = await akeyset_page(
+                    routes, sort_by if sort_by in sort_fields else 'route_id', request.GET['after'], 10)
+            except InvalidCursor as e:
+                return JsonResponse({'error': str(e)}, status=400)
+            page_data = {'has_next': has_next, 'next_cursor': next_cursor}
+        else:
+            routes_page, page_routes = await apaginate(routes, request.GET.get('page', 1), 10)
+            page_data = {
+                'has_next': routes_page.has_next(),
+                'has_previous': routes_page.has_previous(),
+                'total_pages': routes_page.paginator.num_pages,
+                'current_page': routes_page.number
+            }
+
+        data = {'routes': serializer.serialize_many(page_routes), **page_data}
+        return api_response(request, data)
+    else:
+        return HttpResponse(status=405)
+
+
+@csrf_exempt
+async def route_details(request, route_id):
+    if request.method == 'GET':
+        try:
+            fields = requested_fields(request, ROUTE_SERIALIZER.keys)
+        except InvalidFields as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        try:
+            # Read through the details cache, it holds the full route so
+            # ?fields= only narrows the answer
+            details_cache = get_details_cache()
+            data = await details_cache.aget(route_key(route_id))
+            if data is None:
+                route = await Route.objects.aget(route_id=route_id)
+                data = route_details_payload(route)
+                await details_cache.aset(route_key(route_id), data)
+            return api_response(request, {"route": pick(data["route"], fields)})
+        except Route.DoesNotExist:
+            return JsonResponse({'error': 'Route not found'}, status=404)
+    else:
+        return HttpResponse(status=405)
@@ -0,0 +1,157 @@
+import re
+from django.db import DatabaseError, connection
+from .models import Route, RouteStop, RouteSummary
+from Trip_service.cache import get_details_cache, route_key
+from Trip_service.bulk_load import (STAGING_TABLE, length_checks, reject_duplicates, reject_rows, sql_blank,
+                                    sql_literal, sql_message, sql_mismatch)
+
+ROUTE_FIELDS = ['route_id', 'user_id', 'route_name', 'route_origin', 'route_destination', 'stops']
+
+
+def validate_route(data):
+    """Return the error message for an add_route payload, or None when it is valid."""
+    if not isinstance(data, dict):
+        return 'Route must be a JSON object'
+
+    # Check if all required fields are present and not blank
+    for field in ROUTE_FIELDS:
+        if field not in data or not data[field]:
+            return f'{field.capitalize()} is required and cannot be blank'
+
+    # Validate route_id format
+    if not isinstance(data['route_id'], str) or not re.match(r'^RT\d{8}$', data['route_id']):
+        return 'Invalid route_id format. It should start with RT followed by 8 digits'
+
+    # A string would be indexed as one stop per character
+    if not isinstance(data['stops'], list):
+        return 'Stops must be a JSON array'
+    return None
+
+
+def ingest_routes(rows, batch_size=1000):
+    """
+    Validate and insert routes, yielding one result per row in input order.
+
+    Rows are handled batch_size at a time: one query finds the ids that
+    already exist, then the valid rows go in with a single bulk insert, so
+    memory stays bounded however long rows is. A bad row only fails itself.
+    """
+    batch = []
+    for row_number, data in enumerate(rows, start=1):
+        batch.append((row_number, data))
+        if len(batch) >= batch_size:
+            yield from _ingest_batch(batch)
+            batch = []
+    if batch:
+        yield from _ingest_batch(batch)
+
+
+def _ingest_batch(batch):
+    errors = {}
+    routes = {}
+    batch_ids = set()
+    for row_number, data in batch:
+        if isinstance(data, ValueError):
+            errors[row_number] = 'Invalid JSON data'
+            continue
+        error = validate_route(data)
+        if error is None and data['route_id'] in batch_ids:
+            error = f"Duplicate route_id {data['route_id']} in upload"
+        if error:
+            errors[row_number] = error
+            continue
+        batch_ids.add(data['route_id'])
+        routes[row_number] = Route(**{field: data[field] for field in ROUTE_FIELDS})
+
+    existing = set(Route.objects.filter(route_id__in=batch_ids).values_list('route_id', flat=True))
+    for row_number, route in list(routes.items()):
+        if route.route_id in existing:
+            errors[row_number] = f'Route with route_id {route.route_id} already exists'
+            del routes[row_number]
+
+    if routes:
+        try:
+            Route.objects.bulk_create_with_stops(list(routes.values()))
+        except DatabaseError:
+            # A concurrent insert or a value the database rejects, retry row by row
+            for row_number, route in list(routes.items()):
+                try:
+                    Route.objects.bulk_create_with_stops([route])
+                except DatabaseError as e:
+                    errors[row_number] = str(e)
+                    del routes[row_number]
+
+    get_details_cache().delete_many([route_key(route.route_id) for route in routes.values()])
+
+    for row_number, data in batch:
+        if row_number in routes:
+            yield {'row': row_number, 'route_id': routes[row_number].route_id, 'status': 'created'}
+        else:
+            route_id = data.get('route_id') if isinstance(data, dict) else None
+            yield {'row': row_number, 'route_id': route_id, 'status': 'error', 'error': errors[row_number]}
+
+
+def copy_ingest_routes(cursor):
+    """
+    The COPY loader's version of _ingest_batch: check and insert the routes
+    staged by bulk_load.copy_load with set-based statements, recording each
+    rejected row's error on the staging table. Stops must be a JSON array.
+    Running servers pick the new routes up in the journey planner once
+    their network is rebuilt (JOURNEY_NETWORK_MAX_AGE) or on restart.
+    """
+    quote = connection.ops.quote_name
+    routes = quote(Route._meta.db_table)
+    stops = quote(RouteStop._meta.db_table)
+    summaries = quote(RouteSummary._meta.db_table)
+    falsy = """('null', '""', '0', 'false', '[]', '{}')"""
+    missing = """('null', '""')"""
+
+    checks = [("jsonb_typeof(doc) <> 'object'", sql_literal('Route must be a JSON object'))]
+    checks += [(sql_blank(field), sql_literal(f'{field.capitalize()} is required and cannot be blank'))
+               for field in ROUTE_FIELDS]
+    checks.append((sql_mismatch('route_id', r'^RT[0-9]{8}$'),
+                   sql_literal('Invalid route_id format. It should start with RT followed by 8 digits')))
+    checks.append(("jsonb_typeof(doc->'stops') <> 'array'", sql_literal('Stops must be a JSON array')))
+    checks += length_checks(Route, ['user_id', 'route_name', 'route_origin', 'route_destination'])
+    reject_rows(cursor, checks)
+    reject_duplicates(cursor, [('route_id', sql_message('Duplicate route_id {route_id} in upload'))])
+
+    # Routes that already exist are left out by the insert and rejected
+    cursor.execute(
+        f'WITH inserted AS ('
+        f"  INSERT INTO {routes} (route_id, user_id, route_name, route_origin, route_destination, stops)"
+        f"  SELECT doc->>'route_id', doc->>'user_id', doc->>'route_name', doc->>'route_origin',"
+        f"         doc->>'route_destination', doc->'stops'"
+        f"  FROM {STAGING_TABLE} WHERE error IS NULL ORDER BY doc->>'route_id'"
+        f'  ON CONFLICT DO NOTHING RETURNING route_id'
+        f') UPDATE {STAGING_TABLE} s SET error = {sql_message("Route with route_id {route_id} already exists")} '
+        f"WHERE error IS NULL AND NOT EXISTS (SELECT 1 FROM inserted i WHERE i.route_id = s.doc->>'route_id')"
+    )
+
+    # The stop index rows, as route_stop_names() lists them: origin, the
+    # stops (names or objects with a name), then destination, with blanks
+    # and consecutive repeats dropped
+    cursor.execute(
+        f'INSERT INTO {stops} (route_id, stop, position) '
+        f'SELECT route_id, stop, row_number() OVER (PARTITION BY route_id ORDER BY ord) - 1 FROM ('
+        f'  SELECT route_id, ord, stop, lag(stop) OVER (PARTITION BY route_id ORDER BY ord) AS previous FROM ('
+        f"    SELECT s.doc->>'route_id' AS route_id, e.ord,"
+        f"           left(btrim(e.value #>> '{{}}', E' \\t\\n\\r\\f\\x0b'), 100) AS stop"
+        f'    FROM {STAGING_TABLE} s CROSS JOIN LATERAL ('
+        f"      SELECT 0::bigint AS ord, s.doc->'route_origin' AS value"
+        f'      UNION ALL'
+        f"      SELECT ord, CASE WHEN jsonb_typeof(stop) <> 'object' THEN stop"
+        f"                       WHEN coalesce(stop->'name', 'null') IN {falsy} THEN stop->'stop_name'"
+        f"                       ELSE stop->'name' END"
+        f"      FROM jsonb_array_elements(s.doc->'stops') WITH ORDINALITY AS stops (stop, ord)"
+        f'      UNION ALL'
+        f"      SELECT 9223372036854775807, s.doc->'route_destination'"
+        f'    ) e'
+        f"    WHERE s.error IS NULL AND e.value IS NOT NULL AND e.value NOT IN {missing}"
+        f'  ) named'
+        f') ordered WHERE previous IS NULL OR previous <> stop'
+    )
+    cursor.execute(
+        f'INSERT INTO {summaries} (route_id, trip_count, total_distance) '
+        f"SELECT doc->>'route_id', 0, 0 FROM {STAGING_TABLE} WHERE error IS NULL"
+    )
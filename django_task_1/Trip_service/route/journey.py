@@ -0,0 +1,168 @@
+import threading
+import time
+from django.conf import settings
+from .models import Route, route_stop_names
+
+
+class RouteNetwork:
+    """
+    In-process route graph used by the journey planner.
+
+    Every route is kept as its ordered stop tuple, and each stop knows the
+    (route, position) pairs serving it. Journeys are found round by round,
+    one extra ride per round, scanning only the routes that serve stops
+    improved in the previous round. The cost of a journey is the number of
+    stop-to-stop hops plus transfer_penalty for every transfer.
+    """
+
+    def __init__(self, transfer_penalty=2):
+        self.transfer_penalty = transfer_penalty
+        self.routes = {}       # route_id -> (route_name, stop tuple)
+        self.stop_routes = {}  # stop -> [(route_id, position), ...]
+        self.built_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add_route(self, route_id, route_name, stops):
+        with self._lock:
+            if route_id in self.routes:
+                return
+            stops = tuple(stops)
+            self.routes[route_id] = (route_name, stops)
+            for position, stop in enumerate(stops):
+                self.stop_routes.setdefault(stop, []).append((route_id, position))
+
+    def plan(self, origin, destination, max_transfers=2):
+        """
+        Return the fastest journeys from origin to destination, one per number of
+        transfers that improves on the journeys with fewer transfers.
+        """
+        if origin == destination or origin not in self.stop_routes or destination not in self.stop_routes:
+            return []
+
+        infinity = float('inf')
+
+        # Stops one ride away from the destination, and the routes through them.
+        # The ride before the last one only needs to reach these.
+        feeder_stops = set()
+        for route_id, position in self.stop_routes[destination]:
+            feeder_stops.update(self.routes[route_id][1][:position])
+        feeder_routes = {route_id for stop in feeder_stops for route_id, _ in self.stop_routes[stop]}
+
+        best = {origin: 0}
+        previous_labels = {origin: 0}
+        parents = []
+        journeys = []
+        for ride in range(max_transfers + 1):
+            penalty = self.transfer_penalty if ride else 0
+            last_ride = ride == max_transfers
+            feeder_ride = ride == max_transfers - 1
+            # Stops worth labelling this round, None for all of them
+            wanted = None
+
+            if last_ride:
+                # Only the destination matters on the last ride, so only scan its routes
+                queue = {route_id: 0 for route_id, _ in self.stop_routes[destination]}
+                wanted = {destination}
+            else:
+                if feeder_ride:
+                    wanted = feeder_stops | {destination}
+                # Scan each route serving a stop improved last round from its earliest such stop
+                queue = {}
+                for stop in previous_labels:
+                    for route_id, position in self.stop_routes[stop]:
+                        if feeder_ride and route_id not in feeder_routes:
+                            continue
+                        if position < queue.get(route_id, infinity):
+                            queue[route_id] = position
+
+            labels = {}
+            round_parents = {}
+            for route_id, start in queue.items():
+                stops = self.routes[route_id][1]
+                boarded = None  # (cost at boarding minus its position, boarding stop, boarding position)
+                for position in range(start, len(stops)):
+                    stop = stops[position]
+                    if boarded is not None and (wanted is None or stop in wanted):
+                        cost = boarded[0] + position
+                        if cost < best.get(stop, infinity) and cost < best.get(destination, infinity):
+                            best[stop] = cost
+                            labels[stop] = cost
+                            round_parents[stop] = (route_id, boarded[1], boarded[2], position)
+                    if stop in previous_labels:
+                        base = previous_labels[stop] + penalty - position
+                        if boarded is None or base < boarded[0]:
+                            boarded = (base, stop, position)
+
+            parents.append(round_parents)
+            if destination in labels:
+                journeys.append(self._journey(parents, destination, labels[destination]))
+            if not labels:
+                break
+            previous_labels = labels
+        return journeys
+
+    def _journey(self, parents, destination, cost):
+        legs = []
+        stop = destination
+        for round_parents in reversed(parents):
+            route_id, board_stop, board_position, alight_position = round_parents[stop]
+            route_name, stops = self.routes[route_id]
+            legs.append({
+                'route_id': route_id,
+                'route_name': route_name,
+                'board': board_stop,
+                'alight': stop,
+                'stops': list(stops[board_position:alight_position + 1]),
+            })
+            # The boarding stop was reached in the previous round
+            stop = board_stop
+        legs.reverse()
+        return {'cost': cost, 'transfers': len(legs) - 1, 'legs': legs}
+
+
+_network = None
+_network_lock = threading.Lock()
+
+
+def _build_network():
+    network = RouteNetwork(transfer_penalty=getattr(settings, 'JOURNEY_TRANSFER_PENALTY', 2))
+    routes = Route.objects.values_list('route_id', 'route_name', 'route_origin', 'stops', 'route_destination')
+    for route_id, route_name, route_origin, stops, route_destination in routes.iterator(chunk_size=2000):
+        network.add_route(route_id, route_name, route_stop_names(route_origin, stops, route_destination))
+    return network
+
+
+def get_network():
+    """
+    Return the process wide network, loading it from the routes table once.
+
+    Routes added through this process are applied incrementally. Set
+    JOURNEY_NETWORK_MAX_AGE (seconds) to also reload periodically and pick up
+    routes added through other worker processes.
+    """
+    global _network
+    max_age = getattr(settings, 'JOURNEY_NETWORK_MAX_AGE', None)
+    network = _network
+    if network is None or (max_age is not None and time.monotonic() - network.built_at > max_age):
+        with _network_lock:
+            if _network is network:
+                _network = _build_network()
+            network = _network
+    return network
+
+
+def add_routes_to_network(routes):
+    # Nothing to do until the network is first loaded, it will include the routes
+    if _network is not None:
+        for route in routes:
+            _network.add_route(route.route_id, route.route_name,
+                               route_stop_names(route.route_origin, route.stops, route.route_destination))
+
+
+def add_route_to_network(route):
+    add_routes_to_network([route])
+
+
+def reset_network():
+    global _network
+    _network = None
@@ -0,0 +1,52 @@
+import random
+import time
+from django.core.management.base import BaseCommand
+from route.journey import RouteNetwork
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the journey planner on a synthetic route network (no database access)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--routes', type=int, default=20000)
+        parser.add_argument('--stops-per-route', type=int, default=20)
+        parser.add_argument('--stop-count', type=int, default=50000, help='Number of distinct stops in the network')
+        parser.add_argument('--queries', type=int, default=500)
+        parser.add_argument('--max-transfers', type=int, default=2)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        stop_names = [f'S{i:06d}' for i in range(options['stop_count'])]
+
+        network = RouteNetwork()
+        started = time.perf_counter()
+        for i in range(options['routes']):
+            network.add_route(f'RT{i:08d}', f'Route {i}', rng.sample(stop_names, options['stops_per_route']))
+        build_seconds = time.perf_counter() - started
+
+        # Incremental insert cost, as paid by add_route
+        started = time.perf_counter()
+        for i in range(1000):
+            network.add_route(f'RX{i:08d}', f'Extra {i}', rng.sample(stop_names, options['stops_per_route']))
+        insert_ms = (time.perf_counter() - started) * 1000 / 1000
+
+        served = list(network.stop_routes)
+        timings = []
+        found = 0
+        for _ in range(options['queries']):
+            origin, destination = rng.sample(served, 2)
+            started = time.perf_counter()
+            journeys = network.plan(origin, destination, max_transfers=options['max_transfers'])
+            timings.append((time.perf_counter() - started) * 1000)
+            found += bool(journeys)
+        timings.sort()
+
+        def percentile(p):
+            return timings[min(len(timings) - 1, int(len(timings) * p / 100))]
+
+        self.stdout.write(f"routes={len(network.routes)} stops={len(network.stop_routes)} "
+                          f"build={build_seconds:.2f}s insert={insert_ms:.3f}ms/route")
+        self.stdout.write(f"queries={len(timings)} found={found} "
+                          f"p50={percentile(50):.2f}ms p95={percentile(95):.2f}ms p99={percentile(99):.2f}ms "
+                          f"max={timings[-1]:.2f}ms")
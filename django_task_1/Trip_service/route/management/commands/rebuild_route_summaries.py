@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from route.models import RouteSummary
+
+
+class Command(BaseCommand):
+    help = 'Recompute the per route trip totals from the trips, or with --verify only compare them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true', help='Report summaries that differ, change nothing')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--show', type=int, default=20, help='Number of differing routes to print')
+
+    def handle(self, *args, **options):
+        if not options['verify']:
+            created = RouteSummary.objects.rebuild(batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt {created} route summaries'))
+            return
+
+        mismatches = 0
+        for route_id, stored, expected in RouteSummary.objects.mismatches(batch_size=options['batch_size']):
+            mismatches += 1
+            if mismatches <= options['show']:
+                self.stdout.write(f'{route_id}: stored {_totals(stored)}, expected {_totals(expected)}')
+        if mismatches:
+            raise CommandError(f'{mismatches} route summaries differ from the trips, '
+                               f'run rebuild_route_summaries to fix them')
+        self.stdout.write(self.style.SUCCESS('Route summaries match the trips'))
+
+
+def _totals(row):
+    if row is None:
+        return 'missing'
+    trip_count, total_distance = row
+    return f'trip_count={trip_count} total_distance={total_distance}'
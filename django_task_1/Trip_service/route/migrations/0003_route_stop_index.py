@@ -0,0 +1,61 @@
+# Generated by Django 4.2.30 on 2026-10-18 17:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def route_stop_names(route_origin, stops, route_destination):
+    # A copy of route.models.route_stop_names as of this migration, so later
+    # changes to the model's version do not change what the backfill wrote
+    if not isinstance(stops, list):
+        stops = [stops]
+    names = []
+    for stop in [route_origin, *stops, route_destination]:
+        if isinstance(stop, dict):
+            stop = stop.get('name') or stop.get('stop_name')
+        if stop is None or stop == '':
+            continue
+        stop = str(stop).strip()[:100]
+        if not names or names[-1] != stop:
+            names.append(stop)
+    return names
+
+
+def backfill_route_stops(apps, schema_editor):
+    Route = apps.get_model('route', 'Route')
+    RouteStop = apps.get_model('route', 'RouteStop')
+    batch = []
+    for route in Route.objects.iterator(chunk_size=2000):
+        names = route_stop_names(route.route_origin, route.stops, route.route_destination)
+        batch.extend(RouteStop(route_id=route.route_id, stop=name, position=position) for position, name in enumerate(names))
+        if len(batch) >= 5000:
+            RouteStop.objects.bulk_create(batch)
+            batch = []
+    RouteStop.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('route', '0002_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteStop',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stop', models.CharField(max_length=100)),
+                ('position', models.PositiveIntegerField()),
+                ('route', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='route_stops', to='route.route')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['stop', 'route', 'position'], name='route_stop_lookup')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='routestop',
+            constraint=models.UniqueConstraint(fields=('route', 'position'), name='route_stop_unique_position'),
+        ),
+        migrations.RunPython(backfill_route_stops, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.30 on 2026-10-18 17:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models.functions import Coalesce
+from decimal import Decimal
+
+
+def backfill_route_summaries(apps, schema_editor):
+    # Totals for the existing routes, computed from their trips
+    Route = apps.get_model('route', 'Route')
+    RouteSummary = apps.get_model('route', 'RouteSummary')
+    routes = Route.objects.order_by('route_id').annotate(
+        trip_count=models.Count('trip'),
+        total_distance=Coalesce(models.Sum('trip__trip_distance'), Decimal(0), output_field=models.DecimalField()),
+    ).values_list('route_id', 'trip_count', 'total_distance')
+    batch = []
+    for route_id, trip_count, total_distance in routes.iterator(chunk_size=5000):
+        batch.append(RouteSummary(route_id=route_id, trip_count=trip_count, total_distance=total_distance))
+        if len(batch) >= 5000:
+            RouteSummary.objects.bulk_create(batch)
+            batch = []
+    RouteSummary.objects.bulk_create(batch)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('route', '0003_route_stop_index'),
+        # The backfill counts trips
+        ('trip', '0004_trip_unique_route'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteSummary',
+            fields=[
+                ('route', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='route.route')),
+                ('trip_count', models.IntegerField(default=0)),
+                ('total_distance', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+        ),
+        migrations.RunPython(backfill_route_summaries, migrations.RunPython.noop),
+    ]
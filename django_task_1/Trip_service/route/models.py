@@ -1,7 +1,35 @@
-from django.db import models
+from decimal import Decimal
+from django.db import connections, models, transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce
 import re
 from django.core.exceptions import ValidationError
 
+class RouteManager(models.Manager):
+
+    def create_with_stops(self, **fields):
+        # Insert the route and its stop index rows together
+        from .journey import add_route_to_network
+
+        with transaction.atomic():
+            route = self.create(**fields)
+            RouteStop.objects.bulk_create(RouteStop.for_route(route))
+            RouteSummary.objects.create(route=route)
+            # Keep the in-process journey planner graph current
+            transaction.on_commit(lambda: add_route_to_network(route))
+        return route
+
+    def bulk_create_with_stops(self, routes):
+        from .journey import add_routes_to_network
+
+        with transaction.atomic():
+            self.bulk_create(routes)
+            RouteStop.objects.bulk_create([stop for route in routes for stop in RouteStop.for_route(route)])
+            RouteSummary.objects.bulk_create([RouteSummary(route=route) for route in routes])
+            transaction.on_commit(lambda: add_routes_to_network(routes))
+        return routes
+
+
 class Route(models.Model):
     route_id = models.CharField(primary_key=True, max_length=10)  #PK
     user_id = models.CharField(max_length=10)
@@ -10,6 +38,8 @@ class Route(models.Model):
     route_destination = models.CharField(max_length=100,null=False)
     stops = models.JSONField()  
 
+    objects = RouteManager()
+
 #added model level validation for data integrity
 
     def clean(self):
@@ -19,4 +49,137 @@ class Route(models.Model):
             raise ValidationError("Invalid route ID format. It should be 'RT' followed by 8 digits.")
 
 
+def route_stop_names(route_origin, stops, route_destination):
+    """
+    Ordered stop names served by a route: origin, the stops, then destination.
+
+    stops entries may be plain names or objects with a "name"/"stop_name" key,
+    stops that is not a list (stored before add_route required one) is a
+    single stop. Consecutive repeats (e.g. stops that already list the
+    origin) are dropped.
+    """
+    if not isinstance(stops, list):
+        stops = [stops]
+    names = []
+    for stop in [route_origin, *stops, route_destination]:
+        if isinstance(stop, dict):
+            stop = stop.get('name') or stop.get('stop_name')
+        if stop is None or stop == '':
+            continue
+        stop = str(stop).strip()[:100]
+        if not names or names[-1] != stop:
+            names.append(stop)
+    return names
+
+
+class RouteStop(models.Model):
+    # One ordered row per (route, stop) pair, maintained on route insert
+    route = models.ForeignKey(Route, on_delete=models.CASCADE, related_name='route_stops')
+    stop = models.CharField(max_length=100)
+    position = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['route', 'position'], name='route_stop_unique_position'),
+        ]
+        indexes = [
+            models.Index(fields=['stop', 'route', 'position'], name='route_stop_lookup'),
+        ]
+
+    @classmethod
+    def for_route(cls, route):
+        names = route_stop_names(route.route_origin, route.stops, route.route_destination)
+        return [cls(route=route, stop=name, position=position) for position, name in enumerate(names)]
+
+
+class RouteSummaryManager(models.Manager):
+
+    def record(self, trips, sign=1):
+        """
+        Add trips to their routes' totals, or take them off with sign=-1.
+        Each route is one INSERT ... ON CONFLICT DO UPDATE that increments
+        the stored counters, so concurrent writers never overwrite each other.
+        """
+        deltas = {}
+        for trip in trips:
+            if trip.route_id is None:
+                continue
+            count, distance = deltas.get(trip.route_id, (0, Decimal(0)))
+            deltas[trip.route_id] = (count + sign, distance + sign * Decimal(str(trip.trip_distance)))
+        if not deltas:
+            return
+
+        connection = connections[self.db]
+        quote = connection.ops.quote_name
+        table = quote(self.model._meta.db_table)
+        route_column = quote(self.model._meta.get_field('route').column)
+        total_field = self.model._meta.get_field('total_distance')
+        sql = (
+            f'INSERT INTO {table} ({route_column}, trip_count, total_distance) VALUES (%s, %s, %s) '
+            f'ON CONFLICT ({route_column}) DO UPDATE SET '
+            f'trip_count = {table}.trip_count + excluded.trip_count, '
+            f'total_distance = {table}.total_distance + excluded.total_distance'
+        )
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, [(route_id, count, total_field.get_db_prep_save(distance, connection))
+                                     for route_id, (count, distance) in sorted(deltas.items())])
+
+    def computed(self):
+        # The summaries recomputed from the trips, in route_id order
+        return Route.objects.using(self.db).order_by('route_id').annotate(
+            trip_count=Count('trip'),
+            total_distance=Coalesce(Sum('trip__trip_distance'), Decimal(0), output_field=models.DecimalField()),
+        ).values_list('route_id', 'trip_count', 'total_distance')
+
+    def rebuild(self, batch_size=1000):
+        """Replace every summary with one recomputed from the trips, returning the row count."""
+        created = 0
+        with transaction.atomic(using=self.db):
+            self.all().delete()
+            batch = []
+            for route_id, trip_count, total_distance in self.computed().iterator(chunk_size=batch_size):
+                batch.append(self.model(route_id=route_id, trip_count=trip_count, total_distance=total_distance))
+                if len(batch) >= batch_size:
+                    created += len(self.bulk_create(batch))
+                    batch = []
+            created += len(self.bulk_create(batch))
+        return created
+
+    def mismatches(self, batch_size=1000):
+        """
+        Yield (route_id, stored, expected) for every summary that differs from
+        the trips, stored or expected is None for a missing row. Both sides
+        are read in route_id order and merged, so memory stays flat.
+        """
+        stored = self.order_by('route').values_list('route_id', 'trip_count', 'total_distance') \
+            .iterator(chunk_size=batch_size)
+        expected = self.computed().iterator(chunk_size=batch_size)
+        yield from merge_mismatches(stored, expected)
+
+
+def merge_mismatches(stored, expected):
+    # Both iterators yield (key, *values) tuples sorted on key
+    stored_row = next(stored, None)
+    expected_row = next(expected, None)
+    while stored_row is not None or expected_row is not None:
+        if expected_row is None or (stored_row is not None and stored_row[0] < expected_row[0]):
+            yield stored_row[0], stored_row[1:], None
+            stored_row = next(stored, None)
+        elif stored_row is None or expected_row[0] < stored_row[0]:
+            yield expected_row[0], None, expected_row[1:]
+            expected_row = next(expected, None)
+        else:
+            if stored_row[1:] != expected_row[1:]:
+                yield stored_row[0], stored_row[1:], expected_row[1:]
+            stored_row = next(stored, None)
+            expected_row = next(expected, None)
+
+
+class RouteSummary(models.Model):
+    # Per route totals of its trips, kept current by every trip insert and
+    # delete so dashboards read one row instead of scanning the trips
+    route = models.OneToOneField(Route, on_delete=models.CASCADE, primary_key=True, related_name='summary')
+    trip_count = models.IntegerField(default=0)
+    total_distance = models.DecimalField(max_digits=14, decimal_places=2, default=0)
 
+    objects = RouteSummaryManager()
@@ -1,3 +1,527 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipIf
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from .journey import get_network, reset_network
+from .models import Route, RouteStop, RouteSummary, route_stop_names
+from trip.models import Trip, TripChange
+from Trip_service.serializers import msgpack
+from Trip_service.cache import get_details_cache, reset_details_cache, route_key
+from Trip_service.testing import AsyncViewsMixin, QueryBudgetMixin
+from Trip_service.request_context import observe_query
+from Trip_service.tracing import read_spans
 
-# Create your tests here.
+LOCMEM_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'route-tests'},
+}
+
+
+def route_payload(route_id, **fields):
+    return {
+        'route_id': route_id,
+        'user_id': 'U1',
+        'route_name': 'Coastal',
+        'route_origin': 'Pune',
+        'route_destination': 'Goa',
+        'stops': ['Satara', 'Kolhapur'],
+        **fields,
+    }
+
+
+@override_settings(CACHES=LOCMEM_CACHES, DETAILS_CACHE={'MAX_ENTRIES': 2, 'BACKEND': 'default'})
+class RouteDetailsCacheTests(TestCase):
+
+    def setUp(self):
+        # Start every test with empty caches and zeroed counters
+        reset_details_cache()
+        get_details_cache().backend.clear()
+        Route.objects.create_with_stops(**route_payload('RT00000001'))
+        Route.objects.create_with_stops(**route_payload('RT00000002'))
+        Route.objects.create_with_stops(**route_payload('RT00000003'))
+
+    def test_second_read_is_served_from_the_cache(self):
+        first = self.client.get('/route_details/RT00000001/')
+        with self.assertNumQueries(0):
+            second = self.client.get('/route_details/RT00000001/')
+        self.assertEqual(first.json(), second.json())
+        stats = get_details_cache().stats()
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hits'], 1)
+
+    def test_missing_route_is_not_cached(self):
+        self.assertEqual(self.client.get('/route_details/RT00000009/').status_code, 404)
+        Route.objects.create_with_stops(**route_payload('RT00000009'))
+        self.assertEqual(self.client.get('/route_details/RT00000009/').status_code, 200)
+
+    def test_add_route_refreshes_the_entry(self):
+        response = self.client.post('/add_route/', json.dumps(route_payload('RT00000004')), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.client.get('/route_details/RT00000004/')
+        self.assertEqual(response.json()['route']['route_name'], 'Coastal')
+
+    def test_lru_evicts_and_refills_from_the_shared_backend(self):
+        for route_id in ['RT00000001', 'RT00000002', 'RT00000003']:
+            self.client.get(f'/route_details/{route_id}/')
+        details_cache = get_details_cache()
+        self.assertEqual(details_cache.stats()['evictions'], 1)
+        self.assertEqual(details_cache.stats()['entries'], 2)
+
+        # The evicted entry still lives in the shared locmem backend
+        with self.assertNumQueries(0):
+            self.client.get('/route_details/RT00000001/')
+        self.assertEqual(details_cache.stats()['shared_hits'], 1)
+
+    def test_bulk_ingest_drops_entries(self):
+        details_cache = get_details_cache()
+        details_cache.set(route_key('RT00000005'), {'route': {'route_id': 'stale'}})
+        self.client.post('/bulk_add_routes/', json.dumps([route_payload('RT00000005')]), content_type='application/json')
+        self.assertEqual(self.client.get('/route_details/RT00000005/').json()['route']['route_id'], 'RT00000005')
+
+    def test_cache_stats_endpoint(self):
+        self.client.get('/route_details/RT00000001/')
+        stats = self.client.get('/cache_stats/').json()['details_cache']
+        self.assertEqual(stats['misses'], 1)
+        self.assertTrue(stats['shared_backend'])
+
+
+class ContentNegotiationTests(TestCase):
+
+    def setUp(self):
+        Route.objects.create_with_stops(**route_payload('RT00000001'))
+
+    def test_json_by_default(self):
+        response = self.client.get('/route_listing/')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(response.json()['routes'][0], route_payload('RT00000001'))
+
+    @skipIf(msgpack is None, 'msgpack is not installed')
+    def test_msgpack_on_request(self):
+        json_body = self.client.get('/route_details/RT00000001/').json()
+        response = self.client.get('/route_details/RT00000001/', HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertIn('Accept', response['Vary'])
+        self.assertEqual(msgpack.unpackb(response.content), json_body)
+
+
+class SparseFieldsTests(TestCase):
+
+    def setUp(self):
+        Route.objects.create_with_stops(**route_payload('RT00000001', route_name='Inland'))
+        Route.objects.create_with_stops(**route_payload('RT00000002'))
+
+    def test_listing_returns_only_the_requested_fields(self):
+        response = self.client.get('/route_listing/', {'fields': 'route_id,route_name'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['routes'][0], {'route_id': 'RT00000001', 'route_name': 'Inland'})
+
+    def test_listing_keyset_pages_on_a_sort_column_left_out(self):
+        response = self.client.get('/route_listing/', {'fields': 'route_id', 'sort_by': 'route_name', 'after': ''})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['routes'], [{'route_id': 'RT00000002'}, {'route_id': 'RT00000001'}])
+
+    def test_details_returns_only_the_requested_fields(self):
+        response = self.client.get('/route_details/RT00000001/', {'fields': 'stops'})
+        self.assertEqual(response.json(), {'route': {'stops': route_payload('RT00000001')['stops']}})
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get('/route_listing/', {'fields': 'route_id,colour'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Unknown field(s): colour', response.json()['error'])
+
+
+@override_settings(ROOT_URLCONF='Trip_service.async_urls')
+class RouteAsyncViewsTests(AsyncViewsMixin, TestCase):
+
+    def setUp(self):
+        for number in range(1, 13):
+            Route.objects.create_with_stops(**route_payload(f'RT{number:08d}', route_name=f'Coastal {13 - number:02d}'))
+
+    def reset_views(self):
+        reset_details_cache()
+
+    def test_add_route(self):
+        sync_response, async_response = self.send_both(
+            'post', '/add_route/', route_payload('RT00000020'), async_data=route_payload('RT00000021'),
+            content_type='application/json')
+        self.assertEqual(sync_response.json(), {'message': 'Route added successfully', 'route_id': 'RT00000020'})
+        self.assertEqual(async_response.json(), {'message': 'Route added successfully', 'route_id': 'RT00000021'})
+        stops = [list(RouteStop.objects.filter(route_id=route_id).order_by('position').values_list('stop', flat=True))
+                 for route_id in ('RT00000020', 'RT00000021')]
+        self.assertEqual(stops[1], stops[0])
+
+    def test_add_route_errors(self):
+        for data in [route_payload('RT00000001'), route_payload('RT1'), route_payload('RT00000020', stops='Satara')]:
+            with self.subTest(data=data):
+                self.assertBothAnswer('post', '/add_route/', data, status=400, content_type='application/json')
+
+    def test_route_listing_pages(self):
+        for path in ['/route_listing/', '/route_listing/?page=2', '/route_listing/?page=9',
+                     '/route_listing/?sort_by=route_name&fields=route_id,route_name']:
+            with self.subTest(path=path):
+                self.assertBothAnswer('get', path)
+
+    def test_route_listing_cursor(self):
+        first = self.assertBothAnswer('get', '/route_listing/?sort_by=route_name&after=')
+        second = self.assertBothAnswer('get', f"/route_listing/?sort_by=route_name&after={first['next_cursor']}")
+        self.assertEqual(len(first['routes']) + len(second['routes']), 12)
+        self.assertFalse(second['has_next'])
+        self.assertBothAnswer('get', '/route_listing/?after=abc', status=400)
+
+    def test_bad_fields(self):
+        for path in ['/route_listing/?fields=route_id,nope', '/route_details/RT00000001/?fields=nope']:
+            with self.subTest(path=path):
+                self.assertBothAnswer('get', path, status=400)
+
+    def test_route_details(self):
+        self.assertBothAnswer('get', '/route_details/RT00000001/')
+        self.assertBothAnswer('get', '/route_details/RT00000001/?fields=route_id,stops')
+        self.assertBothAnswer('get', '/route_details/RT00000099/', status=404)
+
+
+class RouteStopIndexTests(TestCase):
+
+    def test_stops_must_be_a_list(self):
+        response = self.client.post('/add_route/', json.dumps(route_payload('RT00000001', stops='Pune')),
+                                    content_type='application/json')
+        self.assertEqual(response.json(), {'error': 'Stops must be a JSON array'})
+        response = self.client.post('/bulk_add_routes/', json.dumps([route_payload('RT00000001', stops='Pune'),
+                                                                     route_payload('RT00000002')]),
+                                    content_type='application/json')
+        self.assertEqual([result['status'] for result in response.json()['results']], ['error', 'created'])
+        self.assertEqual(self.client.get('/routes_by_stop/?stop=P').json()['routes'], [])
+
+    def test_a_stored_scalar_is_one_stop(self):
+        self.assertEqual(route_stop_names('Mumbai', 'Pune', 'Goa'), ['Mumbai', 'Pune', 'Goa'])
+        self.assertEqual(route_stop_names('Mumbai', None, 'Goa'), ['Mumbai', 'Goa'])
+
+
+class JourneyPlannerTests(TestCase):
+
+    def setUp(self):
+        reset_network()
+        self.addCleanup(reset_network)
+        # A long direct ride from Pune to Goa, and a quicker one with a change at Kolhapur
+        self.add(1, 'Pune', [f'Stop {number}' for number in range(1, 9)], 'Goa')
+        self.add(2, 'Pune', [], 'Kolhapur')
+        self.add(3, 'Kolhapur', [], 'Goa')
+        # Hampi is two changes away from Pune
+        self.add(4, 'Pune', [], 'Satara')
+        self.add(5, 'Satara', [], 'Belgaum')
+        self.add(6, 'Belgaum', [], 'Hampi')
+
+    def add(self, number, origin, stops, destination):
+        Route.objects.create_with_stops(**route_payload(f'RT{number:08d}', route_name=f'Route {number}', route_origin=origin,
+                                                        stops=stops, route_destination=destination))
+
+    def plan(self, origin, destination, **params):
+        response = self.client.get('/journey_planner/', {'origin': origin, 'destination': destination, **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return [[(leg['route_id'], leg['board'], leg['alight']) for leg in journey['legs']]
+                for journey in response.json()['journeys']]
+
+    def test_direct_ride(self):
+        response = self.client.get('/journey_planner/', {'origin': 'Pune', 'destination': 'Stop 3'})
+        self.assertEqual(response.json()['journeys'], [{
+            'cost': 3,
+            'transfers': 0,
+            'legs': [{'route_id': 'RT00000001', 'route_name': 'Route 1', 'board': 'Pune', 'alight': 'Stop 3',
+                      'stops': ['Pune', 'Stop 1', 'Stop 2', 'Stop 3']}],
+        }])
+
+    def test_a_transfer_beating_a_longer_direct_ride_is_offered_after_it(self):
+        response = self.client.get('/journey_planner/', {'origin': 'Pune', 'destination': 'Goa'})
+        journeys = response.json()['journeys']
+        # Nine hops direct, against two hops plus the transfer penalty
+        self.assertEqual([(journey['cost'], journey['transfers']) for journey in journeys], [(9, 0), (4, 1)])
+        self.assertEqual(self.plan('Pune', 'Goa')[1],
+                         [('RT00000002', 'Pune', 'Kolhapur'), ('RT00000003', 'Kolhapur', 'Goa')])
+
+    def test_max_transfers(self):
+        self.assertEqual(self.plan('Pune', 'Goa', max_transfers=0), [[('RT00000001', 'Pune', 'Goa')]])
+        self.assertEqual(self.plan('Pune', 'Hampi', max_transfers=1), [])
+        self.assertEqual(self.plan('Pune', 'Hampi'), [[('RT00000004', 'Pune', 'Satara'),
+                                                       ('RT00000005', 'Satara', 'Belgaum'),
+                                                       ('RT00000006', 'Belgaum', 'Hampi')]])
+        for value in ['-1', '6', 'two']:
+            with self.subTest(max_transfers=value):
+                response = self.client.get('/journey_planner/', {'origin': 'Pune', 'destination': 'Goa',
+                                                                 'max_transfers': value})
+                self.assertEqual(response.status_code, 400)
+
+    def test_unknown_stops_and_same_origin_and_destination_have_no_journeys(self):
+        self.assertEqual(self.plan('Pune', 'Mumbai'), [])
+        self.assertEqual(self.plan('Mumbai', 'Goa'), [])
+        self.assertEqual(self.plan('Pune', 'Pune'), [])
+        self.assertEqual(self.client.get('/journey_planner/', {'origin': 'Pune'}).status_code, 400)
+
+    def test_added_routes_join_the_loaded_network(self):
+        network = get_network()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/add_route/', route_payload('RT00000007', route_origin='Goa', stops=['Ratnagiri'],
+                                                                     route_destination='Mumbai'),
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.plan('Kolhapur', 'Mumbai'), [[('RT00000003', 'Kolhapur', 'Goa'),
+                                                           ('RT00000007', 'Goa', 'Mumbai')]])
+        # Without a rebuild
+        self.assertIs(get_network(), network)
+
+    @override_settings(JOURNEY_NETWORK_MAX_AGE=60)
+    def test_network_is_reloaded_once_too_old(self):
+        network = get_network()
+        # Added by another process, so this one only learns of it from the table
+        self.add(7, 'Goa', [], 'Mumbai')
+        self.assertEqual(self.plan('Goa', 'Mumbai'), [])
+        with mock.patch('route.journey.time.monotonic', return_value=network.built_at + 61):
+            self.assertEqual(self.plan('Goa', 'Mumbai'), [[('RT00000007', 'Goa', 'Mumbai')]])
+            self.assertIsNot(get_network(), network)
+
+
+class RouteSummaryTests(TestCase):
+
+    def setUp(self):
+        for route_id in ['RT00000001', 'RT00000002']:
+            Route.objects.create_with_stops(**route_payload(route_id))
+
+    def add_trip(self, trip_id, route_id, distance):
+        return self.client.post('/add_trip/', json.dumps({
+            'trip_id': trip_id, 'user_id': 'U1', 'vehicle_id': 'V1', 'route_id': route_id,
+            'driver_name': 'Asha', 'trip_distance': distance,
+        }), content_type='application/json')
+
+    def test_totals_follow_trip_writes(self):
+        self.assertEqual(self.client.get('/route_summary/RT00000001/').json()['route_summary'],
+                         {'route_id': 'RT00000001', 'trip_count': 0, 'total_distance': '0.00'})
+        self.assertEqual(self.add_trip('TP00000001', 'RT00000001', '120.50').status_code, 200)
+        self.assertEqual(self.add_trip('TP00000002', 'RT00000001', '80.00').status_code, 400)
+        with self.assertNumQueries(1):
+            summary = self.client.get('/route_summary/RT00000001/').json()['route_summary']
+        self.assertEqual((summary['trip_count'], summary['total_distance']), (1, '120.50'))
+
+        Trip.objects.get(trip_id='TP00000001').delete()
+        summary = RouteSummary.objects.get(route_id='RT00000001')
+        self.assertEqual((summary.trip_count, summary.total_distance), (0, 0))
+
+    def test_unknown_route(self):
+        self.assertEqual(self.client.get('/route_summary/RT00000009/').status_code, 404)
+
+    def test_verify_reports_drift_and_rebuild_fixes_it(self):
+        self.add_trip('TP00000001', 'RT00000002', '42.00')
+        call_command('rebuild_route_summaries', '--verify', stdout=StringIO())
+        RouteSummary.objects.filter(route_id='RT00000002').update(trip_count=5)
+        RouteSummary.objects.filter(route_id='RT00000001').delete()
+        out = StringIO()
+        with self.assertRaisesMessage(CommandError, '2 route summaries differ'):
+            call_command('rebuild_route_summaries', '--verify', stdout=out)
+        self.assertIn('RT00000001: stored missing', out.getvalue())
+
+        call_command('rebuild_route_summaries', stdout=StringIO())
+        call_command('rebuild_route_summaries', '--verify', stdout=StringIO())
+        self.assertEqual(self.client.get('/route_summaries/').json()['route_summaries'], [
+            {'route_id': 'RT00000001', 'trip_count': 0, 'total_distance': '0.00'},
+            {'route_id': 'RT00000002', 'trip_count': 1, 'total_distance': '42.00'},
+        ])
+
+
+class BulkLoadCommandTests(TestCase):
+    # The COPY loader on Postgres, the ingest functions elsewhere, with the same results
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def load(self, table, name, content, *args):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        rejects = path + '.rejects'
+        call_command('bulk_load', table, path, '--rejects', rejects, '--batch-size', '2', *args, stdout=StringIO())
+        with open(rejects) as f:
+            return [(reject['row'], reject['error']) for reject in map(json.loads, f)]
+
+    def test_routes_from_csv_and_trips_from_ndjson(self):
+        rejects = self.load('routes', 'routes.csv', (
+            'route_id,user_id,route_name,route_origin,route_destination,stops\n'
+            'RT00000001,U1,Coastal,Pune,Goa,"[""Satara"", {""name"": ""Kolhapur""}]"\n'
+            'RT00000001,U2,Again,Pune,Goa,"[""Satara""]"\n'
+            'RT00000002,U1,Inland,Pune,Nagpur,"[""Pune"", "" Nashik ""]"\n'
+            'RT0000003,U1,Short,Pune,Goa,"[""Goa""]"\n'
+            'RT00000004,U1,Broken,Pune,Goa,[not json\n'
+        ))
+        self.assertEqual(rejects, [
+            (2, 'Duplicate route_id RT00000001 in upload'),
+            (4, 'Invalid route_id format. It should start with RT followed by 8 digits'),
+            (5, 'Invalid JSON data'),
+        ])
+        self.assertEqual(Route.objects.get(route_id='RT00000001').stops, ['Satara', {'name': 'Kolhapur'}])
+        self.assertEqual(list(RouteStop.objects.filter(route_id='RT00000002').order_by('position')
+                              .values_list('stop', flat=True)), ['Pune', 'Nashik', 'Nagpur'])
+        self.assertEqual(RouteSummary.objects.count(), 2)
+
+        trip = {'user_id': 'U1', 'vehicle_id': 'V1', 'driver_name': 'Asha', 'trip_distance': '120.50'}
+        rejects = self.load('trips', 'trips.ndjson', '\n'.join([
+            json.dumps({**trip, 'trip_id': 'TP00000001', 'route_id': 'RT00000001'}),
+            json.dumps({**trip, 'trip_id': 'TP00000002', 'route_id': 'RT00000001'}),
+            '',
+            json.dumps({**trip, 'trip_id': 'TP00000003', 'route_id': 'RT00000009'}),
+            '{"trip_id": ',
+            json.dumps({**trip, 'trip_id': 'TP00000004', 'route_id': 'RT00000002', 'trip_distance': 80}),
+        ]))
+        self.assertEqual(rejects, [
+            (2, 'Trip with route_id RT00000001 already exists'),
+            (3, 'Route with route_id RT00000009 does not exist'),
+            (4, 'Invalid JSON data'),
+        ])
+        self.assertEqual(sorted(TripChange.objects.values_list('trip_id', flat=True)), ['TP00000001', 'TP00000004'])
+        self.assertEqual(sorted(RouteSummary.objects.values_list('route_id', 'trip_count', 'total_distance')),
+                         [('RT00000001', 1, Decimal('120.50')), ('RT00000002', 1, Decimal('80.00'))])
+
+    def test_unknown_format(self):
+        with self.assertRaisesMessage(CommandError, 'Cannot tell the format'):
+            call_command('bulk_load', 'routes', 'routes.txt', stdout=StringIO())
+
+
+class TracingTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        tracing = override_settings(TRACING={'ENABLED': True, 'DIRECTORY': self.directory, 'SERVICE_NAME': 'trip'})
+        tracing.enable()
+        self.addCleanup(tracing.disable)
+        Route.objects.create_with_stops(**route_payload('RT00000001'))
+        reset_details_cache()
+
+    def test_request_continues_the_callers_trace(self):
+        trace_id, caller_span_id = '4bf92f3577b34da6a3ce929d0e0e4736', '00f067aa0ba902b7'
+        response = self.client.get('/route_details/RT00000001/',
+                                   HTTP_TRACEPARENT=f'00-{trace_id}-{caller_span_id}-01')
+        self.assertEqual(response['X-Request-ID'], trace_id)
+
+        spans = read_spans(self.directory, trace_id)
+        server = next(span for span in spans if span['kind'] == 'server')
+        self.assertEqual((server['name'], server['parent_id'], server['attributes']['status']),
+                         ('route_details', caller_span_id, 200))
+        queries = [span for span in spans if span['kind'] == 'db']
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(queries[0]['parent_id'], server['span_id'])
+
+        out = StringIO()
+        call_command('show_trace', trace_id, '--directory', self.directory, stdout=out)
+        self.assertIn('GET route_details 200', out.getvalue())
+        self.assertIn('  SELECT', out.getvalue())
+
+    @override_settings(QUERY_COUNT_HEADER=True)
+    def test_one_query_observer_feeds_header_and_spans(self):
+        response = self.client.get('/route_listing/')
+        spans = read_spans(self.directory, response['X-Request-ID'])
+        self.assertEqual(int(response['X-DB-Queries']), len([span for span in spans if span['kind'] == 'db']))
+        self.assertEqual(connection.execute_wrappers.count(observe_query), 1)
+
+    def test_new_trace_without_traceparent(self):
+        first = self.client.get('/route_details/RT00000001/')['X-Request-ID']
+        second = self.client.get('/route_details/RT00000001/')['X-Request-ID']
+        self.assertNotEqual(first, second)
+        out = StringIO()
+        call_command('show_trace', '--directory', self.directory, stdout=out)
+        self.assertEqual([line.split()[0] for line in out.getvalue().splitlines()], [first, second])
+
+
+# Most queries each read may run, whatever the number of routes it returns
+ROUTE_READ_BUDGETS = {
+    '/route_listing/': 2,
+    '/route_listing/?after=': 1,
+    '/route_listing/?after=&fields=route_id,route_name': 1,
+    '/route_listing/?query=Pune&sort_by=relevance': 2,
+    '/route_details/RT00000001/': 1,
+    '/routes_by_stop/?stop=Satara': 1,
+    '/routes_between/?origin=Pune&destination=Goa': 1,
+    '/journey_planner/?origin=Pune&destination=Goa': 1,
+    '/route_export/': 1,
+    '/route_summary/RT00000001/': 1,
+    '/route_summaries/': 1,
+}
+
+# Reads that must be answered from an index. Substring search only has
+# indexes on Postgres (pg_trgm), and the journey planner loads the whole
+# network by design.
+ROUTE_INDEXED_READS = [
+    '/route_listing/',
+    '/route_listing/?after=',
+    '/route_details/RT00000001/',
+    '/routes_by_stop/?stop=Satara',
+    '/routes_between/?origin=Pune&destination=Goa',
+    '/route_export/',
+    '/route_summary/RT00000001/',
+    '/route_summaries/?after=',
+]
+
+
+class RouteQueryBudgetTests(QueryBudgetMixin, TestCase):
+
+    def setUp(self):
+        reset_details_cache()
+        for number in range(1, 6):
+            Route.objects.create_with_stops(**route_payload(f'RT0000000{number}'))
+            Trip.objects.create_if_absent(trip_id=f'TP0000000{number}', user_id='U1', vehicle_id='V1',
+                                          route_id=f'RT0000000{number}', driver_name='Asha', trip_distance='10.00')
+
+    def test_reads_stay_within_their_query_budgets(self):
+        for path, budget in ROUTE_READ_BUDGETS.items():
+            with self.subTest(path=path):
+                reset_details_cache()
+                with self.assertMaxQueries(budget):
+                    response = self.get_all(path)
+                self.assertEqual(response.status_code, 200)
+
+    def test_bulk_add_routes_queries_do_not_grow_with_the_batch(self):
+        for first, last in [(10, 12), (20, 39)]:
+            routes = [route_payload(f'RT000000{number}') for number in range(first, last + 1)]
+            with self.assertMaxQueries(6):
+                response = self.client.post('/bulk_add_routes/', json.dumps(routes), content_type='application/json')
+            self.assertEqual(response.json()['created'], len(routes))
+
+    @override_settings(QUERY_COUNT_HEADER=True)
+    def test_query_count_header(self):
+        self.assertEqual(self.client.get('/route_listing/').headers['X-DB-Queries'], '2')
+        self.assertEqual(self.client.get('/route_details/RT00000001/').headers['X-DB-Queries'], '1')
+        self.assertEqual(self.client.get('/route_details/RT00000001/').headers['X-DB-Queries'], '0')
+
+    def test_metrics_count_queries_by_view_and_status(self):
+        def samples():
+            lines = self.client.get('/metrics').content.decode().splitlines()
+            return dict(line.rsplit(' ', 1) for line in lines if not line.startswith('#'))
+
+        before = samples()
+        self.client.get('/route_details/RT00000001/')
+        self.client.get('/route_details/RT00000001/')
+        self.client.get('/route_details/RT99999999/')
+        self.client.get('/no_such_page/')
+        after = samples()
+
+        def delta(sample):
+            return float(after.get(sample, 0)) - float(before.get(sample, 0))
+
+        self.assertEqual(delta('http_request_duration_seconds_count{view="route_details",method="GET",status="200"}'), 2)
+        self.assertEqual(delta('http_request_duration_seconds_count{view="route_details",method="GET",status="404"}'), 1)
+        self.assertEqual(delta('http_request_duration_seconds_count{view="unmatched",method="GET",status="404"}'), 1)
+        # The second read of RT00000001 comes from the details cache
+        self.assertEqual(delta('http_request_db_queries_total{view="route_details"}'), 2)
+        # Buckets are cumulative, the last holds every request
+        self.assertEqual(delta('http_request_duration_seconds_bucket{view="route_details",method="GET",status="200",le="+Inf"}'), 2)
+
+    def test_reads_use_indexes(self):
+        for path in ROUTE_INDEXED_READS:
+            with self.subTest(path=path):
+                reset_details_cache()
+                with CaptureQueriesContext(connection) as captured:
+                    self.get_all(path)
+                self.assertIndexScans(captured)
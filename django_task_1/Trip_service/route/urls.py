@@ -1,8 +1,27 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
-urlpatterns = [
-    path('add_route/', views.add_route, name='add_route'),
-    path('route_listing/', views.route_listing, name='route_listing'),
-    path('route_details/<str:route_id>/', views.route_details, name='route_details'),
-]
+
+def core_urlpatterns(core_views):
+    """The app's URL patterns, with its core views taken from core_views (views or async_views)."""
+    return [
+        path('add_route/', core_views.add_route, name='add_route'),
+        path('bulk_add_routes/', views.bulk_add_routes, name='bulk_add_routes'),
+        path('route_listing/', core_views.route_listing, name='route_listing'),
+        path('route_details/<str:route_id>/', core_views.route_details, name='route_details'),
+        path('routes_by_stop/', views.routes_by_stop, name='routes_by_stop'),
+        path('routes_between/', views.routes_between, name='routes_between'),
+        path('journey_planner/', views.journey_planner, name='journey_planner'),
+        path('route_export/', views.route_export, name='route_export'),
+        path('route_summary/<str:route_id>/', views.route_summary, name='route_summary'),
+        path('route_summaries/', views.route_summaries, name='route_summaries'),
+    ]
+
+
+# Pick the async variants of the core views when the deployment runs under ASGI
+core_views = views
+if settings.ASYNC_VIEWS:
+    from . import async_views as core_views
+
+urlpatterns = core_urlpatterns(core_views)
@@ -1,11 +1,32 @@
-from django.http import JsonResponse, HttpResponse
-from .models import Route
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
+from .models import Route, RouteStop, RouteSummary
+from .journey import get_network
+from .ingest import validate_route, ingest_routes
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.views.decorators.csrf import csrf_exempt
 from django.core.exceptions import ValidationError
+from django.db.models import Exists, OuterRef
 import json
-import re
-from django.db.models import Q
+from Trip_service.pagination import keyset_page, InvalidCursor
+from Trip_service.search import get_search_backend
+from Trip_service.ndjson import parse_lines, result_lines
+from Trip_service.cache import get_details_cache, route_key
+from Trip_service.export import export_response, EXPORT_CHUNK_SIZE
+from jobs.queue import enqueue, job_accepted, upload_lines
+from Trip_service.serializers import Serializer, InvalidFields, api_response, pick, requested_fields
+
+# Columns matched by the ?query= search
+ROUTE_SEARCH_FIELDS = ['route_id', 'route_name', 'route_origin', 'route_destination']
+
+ROUTE_SERIALIZER = Serializer(['route_id', 'user_id', 'route_name', 'route_origin', 'route_destination', 'stops'])
+
+def route_serializer(request):
+    """ROUTE_SERIALIZER narrowed to ?fields=, raises InvalidFields for unknown names."""
+    fields = requested_fields(request, ROUTE_SERIALIZER.keys)
+    return ROUTE_SERIALIZER if fields is None else ROUTE_SERIALIZER.select(fields)
+
+def route_details_payload(route):
+    return {"route": ROUTE_SERIALIZER.serialize(route)}
 
 @csrf_exempt
 def add_route(request):
@@ -13,19 +34,13 @@ def add_route(request):
         try:
             data = json.loads(request.body)
 
-            # Check if all required fields are present and not blank
-            required_fields = ['route_id', 'user_id', 'route_name', 'route_origin', 'route_destination', 'stops']
-            for field in required_fields:
-                if field not in data or not data[field]:
-                    return JsonResponse({'error': f'{field.capitalize()} is required and cannot be blank'}, status=400)
-
             # Validate input data
-            # Validate route_id format
-            if not data['route_id'].startswith('RT') or not re.match(r'^RT\d{8}$', data['route_id']):
-                return JsonResponse({'error': 'Invalid route_id format. It should start with RT followed by 8 digits'}, status=400)
+            error = validate_route(data)
+            if error:
+                return JsonResponse({'error': error}, status=400)
 
-            # Add to the database
-            route = Route.objects.create(
+            # Add to the database, along with its stop index rows
+            route = Route.objects.create_with_stops(
                 route_id=data['route_id'],
                 user_id=data['user_id'],
                 route_name=data['route_name'],
@@ -33,6 +48,7 @@ def add_route(request):
                 route_destination=data['route_destination'],
                 stops=data['stops']
             )
+            get_details_cache().set(route_key(route.route_id), route_details_payload(route))
             return JsonResponse({'message': 'Route added successfully', 'route_id': route.route_id}, status=200)
         except json.JSONDecodeError:
             return JsonResponse({'error': 'Invalid JSON data'}, status=400)
@@ -44,62 +60,94 @@ def add_route(request):
         return HttpResponse(status=405)
 
 
+@csrf_exempt
+def bulk_add_routes(request):
+    if request.method == 'POST':
+        # ?background=1 queues the rows for manage.py run_jobs and answers 202
+        # at once, progress is polled from the returned status_url
+        if request.GET.get('background'):
+            try:
+                job = enqueue('import_routes', upload_lines(request))
+            except ValueError as e:
+                return JsonResponse({'error': str(e)}, status=400)
+            return JsonResponse(job_accepted(job), status=202)
+
+        # NDJSON bodies are read line by line and answered with a stream of row results
+        if request.content_type == 'application/x-ndjson':
+            results = ingest_routes(parse_lines(request))
+            return StreamingHttpResponse(result_lines(results), content_type='application/x-ndjson')
+
+        try:
+            rows = json.loads(request.body)
+        except json.JSONDecodeError:
+            return JsonResponse({'error': 'Invalid JSON data'}, status=400)
+        if not isinstance(rows, list):
+            return JsonResponse({'error': 'Expected a JSON array of routes'}, status=400)
+
+        results = list(ingest_routes(rows))
+        created = sum(1 for result in results if result['status'] == 'created')
+        return JsonResponse({'created': created, 'failed': len(results) - created, 'results': results})
+    else:
+        return HttpResponse(status=405)
 
 
-    
 @csrf_exempt
 def route_listing(request):
     if request.method == 'GET':
-        # Fetch all routes
-        routes = Route.objects.all()
+        try:
+            serializer = route_serializer(request)
+        except InvalidFields as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        # Fetch all routes, in route_id order unless sorted otherwise
+        routes = Route.objects.order_by('route_id')
 
         # Apply search filter based on query parameters
         query = request.GET.get('query')
+        search = get_search_backend()
         if query:
-            routes = routes.filter(
-                Q(route_id__icontains=query) |
-                Q(route_name__icontains=query) |
-                Q(route_origin__icontains=query) |
-                Q(route_destination__icontains=query)
-            )
+            routes = routes.filter(search.q(query, ROUTE_SEARCH_FIELDS))
 
         # Sorting
+        sort_fields = ['route_id', 'route_name', 'route_origin', 'route_destination']
         sort_by = request.GET.get('sort_by', 'route_id')  # Default sort by route_id
-        if sort_by in ['route_id', 'route_name', 'route_origin', 'route_destination']:
+        if sort_by in sort_fields:
             routes = routes.order_by(sort_by)
+        elif sort_by == 'relevance' and query:
+            routes = search.rank(routes, query, ROUTE_SEARCH_FIELDS)
 
-        # Pagination
-        page_number = request.GET.get('page', 1)
-        paginator = Paginator(routes, 10)  # Showing 10 routes per page
-        try:
-            routes_page = paginator.page(page_number)
-        except PageNotAnInteger:
-            routes_page = paginator.page(1)
-        except EmptyPage:
-            routes_page = paginator.page(paginator.num_pages)
-
-        # Extract values from routes in the current page
-        routes_data = []
-        for route in routes_page:
-            route_data = {
-                "route_id": route.route_id,
-                "user_id": route.user_id,
-                "route_name": route.route_name,
-                "route_origin": route.route_origin,
-                "route_destination": route.route_destination,
-                "stops": route.stops
+        # Load only the requested columns, plus the sort column the cursor is read from
+        if serializer is not ROUTE_SERIALIZER:
+            routes = routes.only(*serializer.only(), sort_by if sort_by in sort_fields else 'route_id')
+
+        # Keyset pagination when a cursor is given (?after=<cursor>, empty for the first page)
+        if 'after' in request.GET:
+            try:
+                routes_page, has_next, next_cursor = keyset_page(
+                    routes, sort_by if sort_by in sort_fields else 'route_id', request.GET['after'], 10)
+            except InvalidCursor as e:
+                return JsonResponse({'error': str(e)}, status=400)
+            page_data = {'has_next': has_next, 'next_cursor': next_cursor}
+        else:
+            # Pagination
+            page_number = request.GET.get('page', 1)
+            paginator = Paginator(routes, 10)  # Showing 10 routes per page
+            try:
+                routes_page = paginator.page(page_number)
+            except PageNotAnInteger:
+                routes_page = paginator.page(1)
+            except EmptyPage:
+                routes_page = paginator.page(paginator.num_pages)
+            page_data = {
+                'has_next': routes_page.has_next(),
+                'has_previous': routes_page.has_previous(),
+                'total_pages': paginator.num_pages,
+                'current_page': routes_page.number
             }
-            routes_data.append(route_data)
 
         # Prepare response data
-        data = {
-            'routes': routes_data,
-            'has_next': routes_page.has_next(),
-            'has_previous': routes_page.has_previous(),
-            'total_pages': paginator.num_pages,
-            'current_page': routes_page.number
-        }
-        return JsonResponse(data)
+        data = {'routes': serializer.serialize_many(routes_page), **page_data}
+        return api_response(request, data)
     else:
         return HttpResponse(status=405)
 
@@ -109,17 +157,140 @@ def route_listing(request):
 def route_details(request, route_id):
     if request.method == 'GET':
         try:
-            route = Route.objects.get(route_id=route_id)
-            data = {"route": {
-                "route_id": route.route_id,
-                "user_id": route.user_id,
-                "route_name": route.route_name,
-                "route_origin": route.route_origin,
-                "route_destination": route.route_destination,
-                "stops": route.stops
-            }}
-            return JsonResponse(data)
+            fields = requested_fields(request, ROUTE_SERIALIZER.keys)
+        except InvalidFields as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        try:
+            # Read through the details cache, it holds the full route so
+            # ?fields= only narrows the answer
+            details_cache = get_details_cache()
+            data = details_cache.get(route_key(route_id))
+            if data is None:
+                route = Route.objects.get(route_id=route_id)
+                data = route_details_payload(route)
+                details_cache.set(route_key(route_id), data)
+            return api_response(request, {"route": pick(data["route"], fields)})
         except Route.DoesNotExist:
             return JsonResponse({'error': 'Route not found'}, status=404)
     else:
         return HttpResponse(status=405)
+
+
+def _route_index_response(request, routes, data):
+    # Routes found through the stop index, paged on route_id
+    try:
+        serializer = route_serializer(request)
+        if serializer is not ROUTE_SERIALIZER:
+            routes = routes.only(*serializer.only())
+        routes_page, has_next, next_cursor = keyset_page(routes, 'route_id', request.GET.get('after'), 10)
+    except (InvalidFields, InvalidCursor) as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    data['routes'] = serializer.serialize_many(routes_page)
+    data['has_next'] = has_next
+    data['next_cursor'] = next_cursor
+    return api_response(request, data)
+
+
+@csrf_exempt
+def routes_by_stop(request):
+    if request.method == 'GET':
+        stop = request.GET.get('stop')
+        if not stop:
+            return JsonResponse({'error': 'Stop is required and cannot be blank'}, status=400)
+
+        # Routes serving the stop anywhere, origin and destination included
+        routes = Route.objects.filter(route_id__in=RouteStop.objects.filter(stop=stop).values('route_id'))
+        return _route_index_response(request, routes, {'stop': stop})
+    else:
+        return HttpResponse(status=405)
+
+
+@csrf_exempt
+def routes_between(request):
+    if request.method == 'GET':
+        origin = request.GET.get('origin')
+        destination = request.GET.get('destination')
+        if not origin or not destination:
+            return JsonResponse({'error': 'Origin and destination are required and cannot be blank'}, status=400)
+
+        # Routes serving origin with destination at a later position
+        later_stop = RouteStop.objects.filter(
+            route_id=OuterRef('route_id'), stop=destination, position__gt=OuterRef('position'))
+        boarding_stops = RouteStop.objects.filter(stop=origin).filter(Exists(later_stop))
+        routes = Route.objects.filter(route_id__in=boarding_stops.values('route_id'))
+        return _route_index_response(request, routes, {'origin': origin, 'destination': destination})
+    else:
+        return HttpResponse(status=405)
+
+
+@csrf_exempt
+def journey_planner(request):
+    if request.method == 'GET':
+        origin = request.GET.get('origin')
+        destination = request.GET.get('destination')
+        if not origin or not destination:
+            return JsonResponse({'error': 'Origin and destination are required and cannot be blank'}, status=400)
+        try:
+            max_transfers = int(request.GET.get('max_transfers', 2))
+        except ValueError:
+            return JsonResponse({'error': 'max_transfers must be an integer'}, status=400)
+        if not 0 <= max_transfers <= 5:
+            return JsonResponse({'error': 'max_transfers must be between 0 and 5'}, status=400)
+
+        journeys = get_network().plan(origin, destination, max_transfers=max_transfers)
+        return api_response(request, {'origin': origin, 'destination': destination, 'journeys': journeys})
+    else:
+        return HttpResponse(status=405)
+
+
+ROUTE_EXPORT_COLUMNS = ['route_id', 'user_id', 'route_name', 'route_origin', 'route_destination', 'stops']
+
+
+@csrf_exempt
+def route_export(request):
+    if request.method == 'GET':
+        # The whole table, or the ?query= matches, streamed in route_id order
+        routes = Route.objects.all()
+        query = request.GET.get('query')
+        if query:
+            routes = routes.filter(get_search_backend().q(query, ROUTE_SEARCH_FIELDS))
+        rows = routes.order_by('route_id').values(*ROUTE_EXPORT_COLUMNS).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        return export_response(request, rows, ROUTE_EXPORT_COLUMNS, 'routes')
+    else:
+        return HttpResponse(status=405)
+
+
+ROUTE_SUMMARY_SERIALIZER = Serializer(['route_id', 'trip_count', 'total_distance'])
+
+
+@csrf_exempt
+def route_summary(request, route_id):
+    if request.method == 'GET':
+        # One primary key lookup, the totals are maintained as trips are written
+        try:
+            summary = RouteSummary.objects.get(route_id=route_id)
+        except RouteSummary.DoesNotExist:
+            return JsonResponse({'error': 'Route not found'}, status=404)
+        return api_response(request, {'route_summary': ROUTE_SUMMARY_SERIALIZER.serialize(summary)})
+    else:
+        return HttpResponse(status=405)
+
+
+@csrf_exempt
+def route_summaries(request):
+    if request.method == 'GET':
+        # Every route's totals, paged on route_id (?after=<cursor>)
+        try:
+            summaries, has_next, next_cursor = keyset_page(
+                RouteSummary.objects.all(), 'route_id', request.GET.get('after'), 10)
+        except InvalidCursor as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        data = {
+            'route_summaries': ROUTE_SUMMARY_SERIALIZER.serialize_many(summaries),
+            'has_next': has_next,
+            'next_cursor': next_cursor,
+        }
+        return api_response(request, data)
+    else:
+        return HttpResponse(status=405)
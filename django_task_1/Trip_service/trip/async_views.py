@@ -0,0 +1,140 @@
+import json
+from django.http import JsonResponse, HttpResponse
+from .models import Trip, Route
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from Trip_service.search import get_search_backend
+from .views import TRIP_SEARCH_FIELDS, TRIP_ROUTE_SEARCH_FIELDS, TRIP_LISTING_SERIALIZER, TRIP_DETAILS_SERIALIZER, \
+    parse_expand, trip_details_payload, trip_details_response, trip_listing_serializer, trip_bookings, add_trip_conflict
+from .ingest import validate_trip
+from Trip_service.cache import get_details_cache, trip_key
+from asgiref.sync import sync_to_async
+from Trip_service.pagination import apaginate, akeyset_page, InvalidCursor
+from Trip_service.serializers import InvalidFields, api_response, requested_fields
+
+
+# csrf_exempt() from Django 4.2 hides the coroutine from the handler,
+# so mark the async views by hand
+def csrf_exempt(view_func):
+    view_func.csrf_exempt = True
+    return view_func
+
+
+@csrf_exempt
+async def add_trip(request):
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body)
+
+            # Validate input data
+            error = validate_trip(data)
+            if error:
+                return JsonResponse({'error': error}, status=400)
+
+            # Add trip to the database, the insert itself checks that the
+            # route exists and that neither the route nor trip_id is taken
+            route_id = data['route_id']
+            trip = await sync_to_async(Trip.objects.create_if_absent)(
+                trip_id=data['trip_id'],
+                user_id=data['user_id'],
+                vehicle_id=data['vehicle_id'],
+                route_id=route_id,
+                driver_name=data['driver_name'],
+                trip_distance=data['trip_distance']
+            )
+            if trip is None:
+                return JsonResponse({'error': await sync_to_async(add_trip_conflict)(data['trip_id'], route_id)},
+                                    status=400)
+            await sync_to_async(get_details_cache().delete_many)([trip_key(trip.trip_id)])
+            return JsonResponse({'message': 'Trip added successfully', 'trip_id': trip.trip_id}, status=200)
+        except json.JSONDecodeError:
+            return JsonResponse({'error': 'Invalid JSON data'}, status=400)
+        except ValidationError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        except Exception as e:
+            return JsonResponse({'error': str(e)}, status=400)
+    else:
+        return HttpResponse(status=405)
+
+
+@csrf_exempt
+async def trip_listing(request):
+    if request.method == 'GET':
+        try:
+            serializer, with_bookings = trip_listing_serializer(request)
+        except InvalidFields as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        # Fetch all trips with associated route data, loading only the
+        # requested columns (and trip_id, which the cursor needs). Pages
+        # follow trip_id unless the search ranks them
+        trips = Trip.objects.order_by('trip_id')
+        if 'route' in serializer.nested:
+            trips = trips.select_related('route')
+        if with_bookings:
+            # Bookings come from the local read model in the same query
+            trips = trips.select_related('booking_view')
+        if serializer is not TRIP_LISTING_SERIALIZER:
+            trips = trips.only('trip_id', *serializer.only(), *(['booking_view__entries'] if with_bookings else []))
+
+        # Apply search filter based on query parameters
+        query = request.GET.get('query')
+        search = get_search_backend()
+        if query:
+            # Route columns are searched in a subquery so each table's own indexes apply
+            trips = trips.filter(
+                search.q(query, TRIP_SEARCH_FIELDS, exact_fields=['trip_id', 'route_id']) |
+                Q(route__in=Route.objects.filter(search.q(query, TRIP_ROUTE_SEARCH_FIELDS)))
+            )
+            if request.GET.get('sort_by') == 'relevance':
+                trips = search.rank(trips, query, TRIP_SEARCH_FIELDS + [f'route__{field}' for field in TRIP_ROUTE_SEARCH_FIELDS])
+
+        # Keyset pagination on trip_id when a cursor is given (?after=<cursor>, empty for the first page)
+        if 'after' in request.GET:
+            try:
+                page_trips, has_next, next_cursor = await akeyset_page(trips, 'trip_id', request.GET['after'], 10)
+            except InvalidCursor as e:
+                return JsonResponse({'error': str(e)}, status=400)
+            data = {'trips': [], 'has_next': has_next, 'next_cursor': next_cursor}
+        else:
+            trips_page, page_trips = await apaginate(trips, request.GET.get('page', 1), 10)
+            data = {
+                'trips': [],
+                'has_next': trips_page.has_next(),
+                'has_previous': trips_page.has_previous(),
+                'total_pages': trips_page.paginator.num_pages,
+                'current_page': trips_page.number
+            }
+
+        for trip in page_trips:
+            trip_data = serializer.serialize(trip)
+            if with_bookings:
+                trip_data["bookings"] = trip_bookings(trip)
+            data['trips'].append(trip_data)
+
+        return api_response(request, data)
+    else:
+        return HttpResponse(status=405)
+
+
+@csrf_exempt
+async def trip_details(request, trip_id):
+    if request.method == 'GET':
+        try:
+            expand = parse_expand(request)
+            fields = requested_fields(request, TRIP_DETAILS_SERIALIZER.keys)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        try:
+            # Read through the details cache, ?fields= narrows the cached trip
+            details_cache = get_details_cache()
+            payload = await details_cache.aget(trip_key(trip_id))
+            if payload is None:
+                trip = await Trip.objects.select_related('route').aget(trip_id=trip_id)
+                payload = trip_details_payload(trip)
+                await details_cache.aset(trip_key(trip_id), payload)
+            return trip_details_response(request, payload, expand, fields)
+        except Trip.DoesNotExist:
+            return JsonResponse({'error': 'Trip not found'}, status=404)
+    else:
+        return HttpResponse(status=405)
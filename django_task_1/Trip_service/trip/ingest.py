@@ -0,0 +1,169 @@
+import re
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, connection
+from .models import Trip, Route, TripChange
+from route.models import RouteSummary
+from Trip_service.cache import get_details_cache, trip_key
+from Trip_service.bulk_load import (STAGING_TABLE, decimal_message, fits_decimal, length_checks, reject_duplicates,
+                                    reject_rows, sql_blank, sql_literal, sql_message, sql_mismatch, sql_not_decimal)
+
+TRIP_FIELDS = ['user_id', 'vehicle_id', 'driver_name', 'trip_distance', 'trip_id', 'route_id']
+
+
+def validate_trip(data):
+    """Return the error message for an add_trip payload, or None when it is valid."""
+    if not isinstance(data, dict):
+        return 'Trip must be a JSON object'
+
+    # Check if all required fields are present and not blank
+    for field in TRIP_FIELDS:
+        if field not in data or not data[field]:
+            return f'Missing required field: {field}'
+
+    # Validate trip_id format
+    if not isinstance(data['trip_id'], str) or not re.match(r'^TP\d{8}$', data['trip_id']):
+        return 'Invalid trip_id format. It should start with TP followed by 8 digits'
+
+    distance = Trip._meta.get_field('trip_distance')
+    if not fits_decimal(data['trip_distance'], distance.max_digits, distance.decimal_places):
+        return decimal_message('trip_distance', distance.max_digits, distance.decimal_places)
+    return None
+
+
+def ingest_trips(rows, batch_size=1000):
+    """
+    Validate and insert trips, yielding one result per row in input order.
+
+    Each batch costs one query for the referenced routes together with the
+    trips already on them, one for already used trip_ids, and one transaction
+    inserting every valid row.
+    """
+    batch = []
+    for row_number, data in enumerate(rows, start=1):
+        batch.append((row_number, data))
+        if len(batch) >= batch_size:
+            yield from _ingest_batch(batch)
+            batch = []
+    if batch:
+        yield from _ingest_batch(batch)
+
+
+def _ingest_batch(batch):
+    errors = {}
+    candidates = {}
+    for row_number, data in batch:
+        if isinstance(data, ValueError):
+            errors[row_number] = 'Invalid JSON data'
+            continue
+        error = validate_trip(data)
+        if error:
+            errors[row_number] = error
+            continue
+        candidates[row_number] = data
+
+    # Referenced routes, each with its trip if it already has one
+    route_ids = {data['route_id'] for data in candidates.values()}
+    route_trips = dict(Route.objects.filter(route_id__in=route_ids).values_list('route_id', 'trip__trip_id'))
+    trip_ids = {data['trip_id'] for data in candidates.values()}
+    existing_trip_ids = set(Trip.objects.filter(trip_id__in=trip_ids).values_list('trip_id', flat=True))
+
+    trips = {}
+    used_route_ids = set()
+    used_trip_ids = set()
+    for row_number, data in candidates.items():
+        route_id = data['route_id']
+        trip_id = data['trip_id']
+        if route_id not in route_trips:
+            errors[row_number] = f'Route with route_id {route_id} does not exist'
+        elif route_trips[route_id] is not None or route_id in used_route_ids:
+            errors[row_number] = f'Trip with route_id {route_id} already exists'
+        elif trip_id in existing_trip_ids or trip_id in used_trip_ids:
+            errors[row_number] = f'Trip with trip_id {trip_id} already exists'
+        else:
+            used_route_ids.add(route_id)
+            used_trip_ids.add(trip_id)
+            trips[row_number] = Trip(**{field: data[field] for field in TRIP_FIELDS})
+
+    if trips:
+        try:
+            Trip.objects.bulk_create_with_changes(list(trips.values()))
+        except (DatabaseError, ValidationError):
+            # A concurrent insert or a value the database rejects, retry row by row
+            for row_number, trip in list(trips.items()):
+                try:
+                    Trip.objects.bulk_create_with_changes([trip])
+                except (DatabaseError, ValidationError) as e:
+                    errors[row_number] = str(e)
+                    del trips[row_number]
+
+    get_details_cache().delete_many([trip_key(trip.trip_id) for trip in trips.values()])
+
+    for row_number, data in batch:
+        if row_number in trips:
+            yield {'row': row_number, 'trip_id': trips[row_number].trip_id, 'status': 'created'}
+        else:
+            trip_id = data.get('trip_id') if isinstance(data, dict) else None
+            yield {'row': row_number, 'trip_id': trip_id, 'status': 'error', 'error': errors[row_number]}
+
+
+def copy_ingest_trips(cursor):
+    """
+    The COPY loader's version of _ingest_batch: check and insert the trips
+    staged by bulk_load.copy_load with set-based statements, recording each
+    rejected row's error on the staging table. The change feed entries and
+    route totals go in with the trips.
+    """
+    quote = connection.ops.quote_name
+    trips = quote(Trip._meta.db_table)
+    routes = quote(Route._meta.db_table)
+    changes = quote(TripChange._meta.db_table)
+    summaries = quote(RouteSummary._meta.db_table)
+    distance = Trip._meta.get_field('trip_distance')
+
+    checks = [("jsonb_typeof(doc) <> 'object'", sql_literal('Trip must be a JSON object'))]
+    checks += [(sql_blank(field), sql_literal(f'Missing required field: {field}')) for field in TRIP_FIELDS]
+    checks.append((sql_mismatch('trip_id', r'^TP[0-9]{8}$'),
+                   sql_literal('Invalid trip_id format. It should start with TP followed by 8 digits')))
+    checks.append((sql_not_decimal('trip_distance', distance.max_digits, distance.decimal_places),
+                   sql_literal(decimal_message('trip_distance', distance.max_digits, distance.decimal_places))))
+    checks += length_checks(Trip, ['user_id', 'vehicle_id', 'driver_name'])
+    reject_rows(cursor, checks)
+
+    reject_rows(cursor, [
+        (f"NOT EXISTS (SELECT 1 FROM {routes} r WHERE r.route_id = doc->>'route_id')",
+         sql_message('Route with route_id {route_id} does not exist')),
+        (f"EXISTS (SELECT 1 FROM {trips} t WHERE t.route_id = doc->>'route_id')",
+         sql_message('Trip with route_id {route_id} already exists')),
+        (f"EXISTS (SELECT 1 FROM {trips} t WHERE t.trip_id = doc->>'trip_id')",
+         sql_message('Trip with trip_id {trip_id} already exists')),
+    ])
+    reject_duplicates(cursor, [
+        ('route_id', sql_message('Trip with route_id {route_id} already exists')),
+        ('trip_id', sql_message('Trip with trip_id {trip_id} already exists')),
+    ])
+
+    # A trip inserted since the checks by someone else is left out and rejected
+    cursor.execute(
+        f'WITH inserted AS ('
+        f'  INSERT INTO {trips} (trip_id, user_id, vehicle_id, route_id, driver_name, trip_distance)'
+        f"  SELECT doc->>'trip_id', doc->>'user_id', doc->>'vehicle_id', doc->>'route_id', doc->>'driver_name',"
+        f"         round((doc->>'trip_distance')::numeric, {distance.decimal_places})"
+        f"  FROM {STAGING_TABLE} WHERE error IS NULL ORDER BY doc->>'trip_id'"
+        f'  ON CONFLICT DO NOTHING RETURNING trip_id'
+        f') UPDATE {STAGING_TABLE} s SET error = {sql_message("Trip with trip_id {trip_id} already exists")} '
+        f"WHERE error IS NULL AND NOT EXISTS (SELECT 1 FROM inserted i WHERE i.trip_id = s.doc->>'trip_id')"
+    )
+    cursor.execute(
+        f'INSERT INTO {changes} (trip_id, action) '
+        f"SELECT doc->>'trip_id', {sql_literal(TripChange.CREATED)} FROM {STAGING_TABLE} "
+        f'WHERE error IS NULL ORDER BY row_no'
+    )
+    # Incremented like RouteSummary.objects.record(), one row per route
+    cursor.execute(
+        f'INSERT INTO {summaries} AS summary (route_id, trip_count, total_distance) '
+        f"SELECT doc->>'route_id', 1, round((doc->>'trip_distance')::numeric, {distance.decimal_places}) "
+        f"FROM {STAGING_TABLE} WHERE error IS NULL ORDER BY doc->>'route_id' "
+        f'ON CONFLICT (route_id) DO UPDATE SET '
+        f'trip_count = summary.trip_count + excluded.trip_count, '
+        f'total_distance = summary.total_distance + excluded.total_distance'
+    )
@@ -0,0 +1,36 @@
+from django.db import migrations
+
+# Trigram GIN indexes serving the ?query= icontains search on Postgres.
+# Django compiles icontains to UPPER("col"::text) LIKE UPPER(...), so the
+# indexes are built on that expression. Other databases skip this migration.
+TABLE = 'trip_trip'
+COLUMNS = ['driver_name', 'user_id', 'vehicle_id']
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for column in COLUMNS:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {TABLE}_{column}_trgm '
+            f'ON {TABLE} USING gin ((UPPER({column}::text)) gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for column in COLUMNS:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {TABLE}_{column}_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trip', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.30 on 2026-10-18 17:44
+
+from django.db import migrations, models
+
+
+def backfill_trip_changes(apps, schema_editor):
+    # Existing trips enter the feed as created, in trip_id order
+    Trip = apps.get_model('trip', 'Trip')
+    TripChange = apps.get_model('trip', 'TripChange')
+    batch = []
+    for trip_id in Trip.objects.order_by('trip_id').values_list('trip_id', flat=True).iterator(chunk_size=5000):
+        batch.append(TripChange(trip_id=trip_id, action='created'))
+        if len(batch) >= 5000:
+            TripChange.objects.bulk_create(batch)
+            batch = []
+    TripChange.objects.bulk_create(batch)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trip', '0002_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TripChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trip_id', models.CharField(max_length=10)),
+                ('action', models.CharField(choices=[('created', 'Created'), ('deleted', 'Deleted')], max_length=7)),
+            ],
+        ),
+        migrations.RunPython(backfill_trip_changes, migrations.RunPython.noop),
+    ]
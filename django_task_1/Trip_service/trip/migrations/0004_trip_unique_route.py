@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-18 17:47
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def check_no_duplicate_routes(apps, schema_editor):
+    # Stop with the offending routes rather than fail on the constraint, the
+    # extra trips have to be resolved by hand before migrating
+    Trip = apps.get_model('trip', 'Trip')
+    duplicates = list(Trip.objects.filter(route__isnull=False).values('route_id').annotate(trips=Count('trip_id'))
+                      .filter(trips__gt=1).order_by('route_id').values_list('route_id', flat=True)[:21])
+    if duplicates:
+        listed = ', '.join(duplicates[:20]) + (' and more' if len(duplicates) > 20 else '')
+        raise RuntimeError(f'Cannot make route unique per trip, these routes have more than one trip: {listed}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trip', '0003_trip_change_feed'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_no_duplicate_routes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='trip',
+            constraint=models.UniqueConstraint(fields=('route',), name='trip_unique_route'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trip', '0004_trip_unique_route'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TripBookings',
+            fields=[
+                ('trip', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='booking_view', serialize=False, to='trip.trip')),
+                ('entries', models.JSONField(default=dict)),
+            ],
+        ),
+    ]
@@ -1,7 +1,52 @@
-from django.db import models
+from django.db import connections, models, transaction
 import re
 from django.core.exceptions import ValidationError
-from route.models import Route 
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from route.models import Route, RouteSummary
+
+class TripManager(models.Manager):
+
+    def create_if_absent(self, **fields):
+        """
+        Insert the trip in a single INSERT ... ON CONFLICT DO NOTHING, only
+        when its route exists. Returns the trip, or None when the route is
+        missing or the trip_id or route is already taken. The unique
+        constraints decide, so concurrent requests cannot both succeed.
+        """
+        trip = self.model(**fields)
+        connection = connections[self.db]
+        columns = list(self.model._meta.concrete_fields)
+        quote = connection.ops.quote_name
+        # Placeholders are cast so the SELECT list has the column types
+        placeholders = ', '.join(f'CAST(%s AS {field.db_type(connection)})' for field in columns)
+        sql = (
+            f'INSERT INTO {quote(self.model._meta.db_table)} ({", ".join(quote(field.column) for field in columns)}) '
+            f'SELECT {placeholders} WHERE EXISTS ('
+            f'SELECT 1 FROM {quote(Route._meta.db_table)} WHERE {quote(Route._meta.pk.column)} = %s) '
+            f'ON CONFLICT DO NOTHING RETURNING {quote(self.model._meta.pk.column)}'
+        )
+        params = [field.get_db_prep_save(getattr(trip, field.attname), connection) for field in columns]
+        # The change feed entry and the route totals go in with the trip
+        with transaction.atomic(using=self.db):
+            with connection.cursor() as cursor:
+                cursor.execute(sql, [*params, trip.route_id])
+                if cursor.fetchone() is None:
+                    return None
+            TripChange.objects.using(self.db).create(trip_id=trip.trip_id, action=TripChange.CREATED)
+            RouteSummary.objects.db_manager(self.db).record([trip])
+        trip._state.adding = False
+        trip._state.db = self.db
+        return trip
+
+    def bulk_create_with_changes(self, trips):
+        with transaction.atomic():
+            self.bulk_create(trips)
+            TripChange.objects.bulk_create([TripChange(trip_id=trip.trip_id, action=TripChange.CREATED)
+                                            for trip in trips])
+            RouteSummary.objects.record(trips)
+        return trips
+
 
 class Trip(models.Model):
     trip_id = models.CharField(primary_key=True, max_length=10)
@@ -11,6 +56,14 @@ class Trip(models.Model):
     driver_name = models.CharField(max_length=100)
     trip_distance = models.DecimalField(max_digits=10, decimal_places=2)
 
+    objects = TripManager()
+
+    class Meta:
+        constraints = [
+            # One trip per route
+            models.UniqueConstraint(fields=['route'], name='trip_unique_route'),
+        ]
+
 # added model level validation for data integrity
     def clean(self):
 
@@ -19,3 +72,73 @@ class Trip(models.Model):
         if not re.match(r'^TP\d{8}$', self.trip_id):
             raise ValidationError("Invalid trip ID format. It should be 'TP' followed by 8 digits.")
 
+
+class TripChange(models.Model):
+    # Append-only log of trip inserts and deletes, read by other services
+    # through /trip_changes/ to keep their own copy of the trip ids current
+    CREATED = 'created'
+    DELETED = 'deleted'
+
+    trip_id = models.CharField(max_length=10)
+    action = models.CharField(max_length=7, choices=[(CREATED, 'Created'), (DELETED, 'Deleted')])
+
+
+@receiver(post_delete, sender=Trip)
+def record_trip_delete(sender, instance, using, **kwargs):
+    TripChange.objects.using(using).create(trip_id=instance.trip_id, action=TripChange.DELETED)
+    RouteSummary.objects.db_manager(using).record([instance], sign=-1)
+
+
+class TripBookingsManager(models.Manager):
+
+    def apply(self, events):
+        """
+        Apply booking events from the booking service outbox, returning how
+        many changed the read model. Every booking keeps the seq of the last
+        event applied to it and older or repeated events are ignored, so a
+        batch can be delivered any number of times, in any order.
+        """
+        by_trip = {}
+        for event in events:
+            by_trip.setdefault(event['trip_id'], []).append(event)
+
+        applied = 0
+        with transaction.atomic(using=self.db):
+            rows = {row.trip_id: row for row in self.select_for_update().filter(trip_id__in=by_trip)}
+            created = []
+            updated = []
+            for trip_id, trip_events in by_trip.items():
+                row = rows.get(trip_id)
+                if row is None:
+                    row = self.model(trip_id=trip_id, entries={})
+                changed = False
+                for event in trip_events:
+                    entry = row.entries.get(event['ticket_id'])
+                    if entry is not None and entry['seq'] >= event['seq']:
+                        continue
+                    booking = event['booking'] if event['action'] == TripBookings.UPSERTED else None
+                    row.entries[event['ticket_id']] = {'seq': event['seq'], 'booking': booking}
+                    changed = True
+                    applied += 1
+                if changed:
+                    (updated if trip_id in rows else created).append(row)
+            self.bulk_create(created)
+            self.bulk_update(updated, ['entries'])
+        return applied
+
+
+class TripBookings(models.Model):
+    # Read model: the bookings of each trip as the booking service reported
+    # them through its outbox, so trip_listing can embed them without a call
+    UPSERTED = 'upserted'
+    DELETED = 'deleted'
+
+    trip = models.OneToOneField(Trip, on_delete=models.DO_NOTHING, db_constraint=False, primary_key=True,
+                                related_name='booking_view')
+    # ticket_id -> {"seq": <last applied event>, "booking": <booking, or None once deleted>}
+    entries = models.JSONField(default=dict)
+
+    objects = TripBookingsManager()
+
+    def bookings(self):
+        return [entry['booking'] for ticket_id, entry in sorted(self.entries.items()) if entry['booking'] is not None]
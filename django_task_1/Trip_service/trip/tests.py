@@ -1,3 +1,370 @@
-from django.test import TestCase
+import json
+import threading
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from jobs.queue import run_pending
+from route.models import Route
+from .models import Trip, TripBookings, TripChange
+from Trip_service.cache import get_details_cache, reset_details_cache
+from Trip_service.testing import AsyncViewsMixin, QueryBudgetMixin
 
-# Create your tests here.
+LOCMEM_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'trip-tests'},
+}
+
+
+@override_settings(CACHES=LOCMEM_CACHES, DETAILS_CACHE={'MAX_ENTRIES': 100, 'BACKEND': 'default'})
+class TripDetailsCacheTests(TestCase):
+
+    def setUp(self):
+        # Start every test with empty caches and zeroed counters
+        reset_details_cache()
+        get_details_cache().backend.clear()
+        for route_id in ['RT00000001', 'RT00000002']:
+            Route.objects.create_with_stops(route_id=route_id, user_id='U1', route_name='Coastal',
+                                            route_origin='Pune', route_destination='Goa', stops=['Satara'])
+        Trip.objects.create(trip_id='TP00000001', user_id='U1', vehicle_id='V1', route_id='RT00000001',
+                            driver_name='Asha', trip_distance='120.50')
+
+    def test_second_read_is_served_from_the_cache(self):
+        first = self.client.get('/trip_details/TP00000001/')
+        with self.assertNumQueries(0):
+            second = self.client.get('/trip_details/TP00000001/')
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(second.json()['trip']['trip_distance'], '120.50')
+
+    def test_add_trip_invalidates_the_entry(self):
+        self.assertEqual(self.client.get('/trip_details/TP00000002/').status_code, 404)
+        response = self.client.post('/add_trip/', json.dumps({
+            'trip_id': 'TP00000002', 'user_id': 'U1', 'vehicle_id': 'V1', 'route_id': 'RT00000002',
+            'driver_name': 'Ravi', 'trip_distance': '80.00',
+        }), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get('/trip_details/TP00000002/').json()['trip']['driver_name'], 'Ravi')
+
+    def test_expand_route_embeds_the_route_in_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/trip_details/TP00000001/?expand=route')
+        trip = response.json()['trip']
+        self.assertEqual(trip['route_id'], 'RT00000001')
+        self.assertEqual(trip['route']['route_origin'], 'Pune')
+        self.assertNotIn('route', self.client.get('/trip_details/TP00000001/').json()['trip'])
+
+    def test_unknown_expand_is_rejected(self):
+        response = self.client.get('/trip_details/TP00000001/?expand=route,driver')
+        self.assertEqual(response.status_code, 400)
+
+
+class TripChangeFeedTests(TestCase):
+
+    def setUp(self):
+        for number in range(1, 4):
+            Route.objects.create_with_stops(route_id=f'RT0000000{number}', user_id='U1', route_name='Coastal',
+                                            route_origin='Pune', route_destination='Goa', stops=['Satara'])
+            Trip.objects.create_if_absent(trip_id=f'TP0000000{number}', user_id='U1', vehicle_id='V1',
+                                            route_id=f'RT0000000{number}', driver_name='Asha', trip_distance='10.00')
+
+    def test_changes_are_paged_in_sequence_order(self):
+        first = self.client.get('/trip_changes/?limit=2').json()
+        self.assertEqual([change['trip_id'] for change in first['changes']], ['TP00000001', 'TP00000002'])
+        self.assertTrue(first['has_more'])
+        second = self.client.get(f"/trip_changes/?after={first['last_seq']}").json()
+        self.assertEqual([change['trip_id'] for change in second['changes']], ['TP00000003'])
+        self.assertFalse(second['has_more'])
+
+    def test_deletes_are_recorded(self):
+        Trip.objects.filter(trip_id='TP00000002').delete()
+        changes = self.client.get('/trip_changes/').json()['changes']
+        self.assertEqual(changes[-1]['trip_id'], 'TP00000002')
+        self.assertEqual(changes[-1]['action'], 'deleted')
+
+
+class AddTripConcurrencyTests(TransactionTestCase):
+
+    def setUp(self):
+        Route.objects.create_with_stops(route_id='RT00000001', user_id='U1', route_name='Coastal',
+                                        route_origin='Pune', route_destination='Goa', stops=['Satara'])
+
+    def test_conflicts_are_reported_like_before(self):
+        trip = {'trip_id': 'TP00000001', 'user_id': 'U1', 'vehicle_id': 'V1', 'route_id': 'RT00000001',
+                'driver_name': 'Asha', 'trip_distance': '10.00'}
+        self.assertEqual(self.client.post('/add_trip/', json.dumps(trip), content_type='application/json').status_code, 200)
+        response = self.client.post('/add_trip/', json.dumps({**trip, 'trip_id': 'TP00000002'}),
+                                    content_type='application/json')
+        self.assertEqual(response.json(), {'error': 'Trip with route_id RT00000001 already exists'})
+        response = self.client.post('/add_trip/', json.dumps({**trip, 'route_id': 'RT00000009'}),
+                                    content_type='application/json')
+        self.assertEqual(response.json(), {'error': 'Route with route_id RT00000009 does not exist'})
+
+    @skipUnlessDBFeature('test_db_allows_multiple_connections')
+    def test_concurrent_inserts_for_one_route_create_one_trip(self):
+        # Every thread races to put a different trip on the same route
+        workers = 8
+        barrier = threading.Barrier(workers)
+        created = []
+        errors = []
+
+        def insert(number):
+            try:
+                barrier.wait()
+                trip = Trip.objects.create_if_absent(trip_id=f'TP{number:08d}', user_id='U1', vehicle_id='V1',
+                                                     route_id='RT00000001', driver_name='Asha', trip_distance='10.00')
+                if trip is not None:
+                    created.append(trip.trip_id)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=insert, args=(number,)) for number in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(created), 1)
+        self.assertEqual(list(Trip.objects.values_list('trip_id', flat=True)), created)
+        self.assertEqual(list(TripChange.objects.values_list('trip_id', flat=True)), created)
+
+
+class TripExportTests(TestCase):
+
+    def setUp(self):
+        for number in range(1, 4):
+            Route.objects.create_with_stops(route_id=f'RT0000000{number}', user_id='U1', route_name=f'Route {number}',
+                                            route_origin='Pune', route_destination='Goa', stops=['Satara'])
+            Trip.objects.create_if_absent(trip_id=f'TP0000000{number}', user_id='U1', vehicle_id='V1',
+                                          route_id=f'RT0000000{number}', driver_name='Asha', trip_distance='10.00')
+
+    def test_trips_stream_with_their_routes_in_one_query(self):
+        response = self.client.get('/trip_export/')
+        with self.assertNumQueries(1):
+            trips = [json.loads(line) for line in response.streaming_content]
+        self.assertEqual([trip['route']['route_name'] for trip in trips], ['Route 1', 'Route 2', 'Route 3'])
+
+    def test_csv_export_flattens_the_route(self):
+        response = self.client.get('/trip_export/?format=csv&query=Route 2')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[6], 'route.route_name')
+        self.assertEqual(len(lines), 2)
+        self.assertIn('TP00000002', lines[1])
+
+
+def booking_event(seq, ticket_id, trip_id, action='upserted'):
+    booking = {'ticket_id': ticket_id, 'trip_id': trip_id, 'ticket_cost': '250.00'} if action == 'upserted' else None
+    return {'seq': seq, 'action': action, 'ticket_id': ticket_id, 'trip_id': trip_id, 'booking': booking}
+
+
+class TripBookingsReadModelTests(TestCase):
+
+    def setUp(self):
+        for number in range(1, 3):
+            Route.objects.create_with_stops(route_id=f'RT0000000{number}', user_id='U1', route_name='Coastal',
+                                            route_origin='Pune', route_destination='Goa', stops=['Satara'])
+            Trip.objects.create_if_absent(trip_id=f'TP0000000{number}', user_id='U1', vehicle_id='V1',
+                                          route_id=f'RT0000000{number}', driver_name='Asha', trip_distance='10.00')
+
+    def deliver(self, events):
+        return self.client.post('/booking_events/', json.dumps({'events': events}), content_type='application/json')
+
+    def test_redelivered_and_stale_events_are_ignored(self):
+        events = [booking_event(1, 'TK00000001', 'TP00000001'), booking_event(2, 'TK00000002', 'TP00000002')]
+        self.assertEqual(self.deliver(events).json(), {'received': 2, 'applied': 2})
+        self.assertEqual(self.deliver(events).json()['applied'], 0)
+
+        # The delete wins over the older upsert however they arrive
+        self.assertEqual(self.deliver([booking_event(3, 'TK00000001', 'TP00000001', 'deleted'),
+                                       booking_event(1, 'TK00000001', 'TP00000001')]).json()['applied'], 1)
+        self.assertEqual(TripBookings.objects.get(trip_id='TP00000001').bookings(), [])
+        self.assertEqual([booking['ticket_id'] for booking in TripBookings.objects.get(trip_id='TP00000002').bookings()],
+                         ['TK00000002'])
+
+    def test_listing_embeds_bookings_in_one_query(self):
+        self.deliver([booking_event(1, 'TK00000002', 'TP00000002')])
+        with self.assertNumQueries(1):
+            trips = self.client.get('/trip_listing/?after=').json()['trips']
+        self.assertEqual([len(trip['bookings']) for trip in trips], [0, 1])
+        self.assertEqual(trips[1]['bookings'][0]['ticket_id'], 'TK00000002')
+
+    def test_malformed_event_is_rejected(self):
+        response = self.deliver([booking_event(1, 'TK00000001', 'TP00000001'), {'seq': 'x'}])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(TripBookings.objects.exists())
+
+
+def trip_payload(number):
+    return {'trip_id': f'TP{number:08d}', 'user_id': 'U1', 'vehicle_id': 'V1', 'route_id': f'RT{number:08d}',
+            'driver_name': 'Asha', 'trip_distance': '10.00'}
+
+
+# Most queries each read may run, whatever the number of trips it returns
+TRIP_READ_BUDGETS = {
+    '/trip_listing/': 2,
+    '/trip_listing/?after=': 1,
+    '/trip_listing/?after=&fields=trip_id,route,bookings': 1,
+    '/trip_listing/?query=Asha&sort_by=relevance': 2,
+    '/trip_details/TP00000001/': 1,
+    '/trip_details/TP00000001/?expand=route': 1,
+    '/trip_changes/': 1,
+    '/trip_export/': 1,
+}
+
+# Reads that must be answered from an index (substring search only has
+# indexes on Postgres)
+TRIP_INDEXED_READS = [
+    '/trip_listing/',
+    '/trip_listing/?after=',
+    '/trip_details/TP00000001/',
+    '/trip_changes/?after=2',
+    '/trip_export/',
+]
+
+
+class TripQueryBudgetTests(QueryBudgetMixin, TestCase):
+
+    def setUp(self):
+        reset_details_cache()
+        for number in range(1, 40):
+            Route.objects.create_with_stops(route_id=f'RT{number:08d}', user_id='U1', route_name='Coastal',
+                                            route_origin='Pune', route_destination='Goa', stops=['Satara'])
+        for number in range(1, 6):
+            Trip.objects.create_if_absent(**trip_payload(number))
+            TripBookings.objects.apply([booking_event(number, f'TK{number:08d}', f'TP{number:08d}')])
+
+    def post_json(self, path, data):
+        return self.client.post(path, json.dumps(data), content_type='application/json')
+
+    def test_reads_stay_within_their_query_budgets(self):
+        for path, budget in TRIP_READ_BUDGETS.items():
+            with self.subTest(path=path):
+                reset_details_cache()
+                with self.assertMaxQueries(budget):
+                    response = self.get_all(path)
+                self.assertEqual(response.status_code, 200)
+
+    def test_writes_do_not_grow_with_the_batch(self):
+        with self.assertMaxQueries(5):
+            self.assertEqual(self.post_json('/add_trip/', trip_payload(6)).status_code, 200)
+        with self.assertMaxQueries(1):
+            lookup = self.post_json('/trip_lookup/', {'trip_ids': [f'TP{number:08d}' for number in range(1, 40)]})
+        self.assertEqual(len(lookup.json()['trip_ids']), 6)
+        for first, last in [(10, 12), (20, 39)]:
+            with self.assertMaxQueries(7):
+                response = self.post_json('/bulk_add_trips/', [trip_payload(number) for number in range(first, last + 1)])
+            self.assertEqual(response.json()['created'], last - first + 1)
+            events = [booking_event(100, f'TK{number:08d}', f'TP{number:08d}') for number in range(first, last + 1)]
+            with self.assertMaxQueries(4):
+                self.assertEqual(self.post_json('/booking_events/', {'events': events}).status_code, 200)
+
+    def test_reads_use_indexes(self):
+        for path in TRIP_INDEXED_READS:
+            with self.subTest(path=path):
+                reset_details_cache()
+                with CaptureQueriesContext(connection) as captured:
+                    self.get_all(path)
+                self.assertIndexScans(captured)
+        with CaptureQueriesContext(connection) as captured:
+            self.post_json('/trip_lookup/', {'trip_ids': ['TP00000001', 'TP00000009']})
+        self.assertIndexScans(captured)
+
+
+@override_settings(ROOT_URLCONF='Trip_service.async_urls')
+class TripAsyncViewsTests(AsyncViewsMixin, TestCase):
+
+    def setUp(self):
+        for number in range(1, 25):
+            Route.objects.create_with_stops(route_id=f'RT{number:08d}', user_id='U1', route_name='Coastal',
+                                            route_origin='Pune', route_destination='Goa', stops=['Satara'])
+        for number in range(1, 13):
+            Trip.objects.create_if_absent(**trip_payload(number))
+            TripBookings.objects.apply([booking_event(number, f'TK{number:08d}', f'TP{number:08d}')])
+
+    def reset_views(self):
+        reset_details_cache()
+
+    def test_add_trip(self):
+        sync_response, async_response = self.send_both(
+            'post', '/add_trip/', trip_payload(20), async_data=trip_payload(21), content_type='application/json')
+        self.assertEqual(sync_response.json(), {'message': 'Trip added successfully', 'trip_id': 'TP00000020'})
+        self.assertEqual(async_response.json(), {'message': 'Trip added successfully', 'trip_id': 'TP00000021'})
+        self.assertEqual(Trip.objects.get(trip_id='TP00000021').route_id, 'RT00000021')
+
+    def test_add_trip_errors(self):
+        cases = [trip_payload(1),  # trip_id taken
+                 {**trip_payload(20), 'route_id': 'RT00000001'},  # route taken
+                 {**trip_payload(20), 'route_id': 'RT00000099'},
+                 {**trip_payload(20), 'trip_distance': '1e20'},
+                 {**trip_payload(20), 'trip_id': 'TP1'}]
+        for data in cases:
+            with self.subTest(data=data):
+                self.assertBothAnswer('post', '/add_trip/', data, status=400, content_type='application/json')
+
+    def test_trip_listing_pages(self):
+        for path in ['/trip_listing/', '/trip_listing/?page=2', '/trip_listing/?page=9',
+                     '/trip_listing/?fields=trip_id,route,bookings', '/trip_listing/?query=Asha&sort_by=relevance']:
+            with self.subTest(path=path):
+                self.assertBothAnswer('get', path)
+
+    def test_trip_listing_cursor(self):
+        first = self.assertBothAnswer('get', '/trip_listing/?after=&fields=trip_id,bookings')
+        second = self.assertBothAnswer('get', f"/trip_listing/?after={first['next_cursor']}&fields=trip_id,bookings")
+        self.assertEqual(len(first['trips']) + len(second['trips']), 12)
+        self.assertFalse(second['has_next'])
+        self.assertBothAnswer('get', '/trip_listing/?after=abc', status=400)
+
+    def test_bad_fields_and_expand(self):
+        for path in ['/trip_listing/?fields=trip_id,nope', '/trip_details/TP00000001/?fields=nope',
+                     '/trip_details/TP00000001/?expand=nope']:
+            with self.subTest(path=path):
+                self.assertBothAnswer('get', path, status=400)
+
+    def test_trip_details(self):
+        for path in ['/trip_details/TP00000001/', '/trip_details/TP00000001/?expand=route',
+                     '/trip_details/TP00000001/?fields=trip_id,route_id&expand=route']:
+            with self.subTest(path=path):
+                self.assertBothAnswer('get', path)
+        self.assertBothAnswer('get', '/trip_details/TP00000099/', status=404)
+
+
+class TripBulkIngestTests(TestCase):
+
+    def setUp(self):
+        for number in range(1, 5):
+            Route.objects.create_with_stops(route_id=f'RT{number:08d}', user_id='U1', route_name='Coastal',
+                                            route_origin='Pune', route_destination='Goa', stops=['Satara'])
+        self.rows = [trip_payload(1), {**trip_payload(2), 'trip_distance': 'abc'}, trip_payload(3),
+                     {**trip_payload(4), 'trip_distance': '123456789.00'}]
+
+    def assertBadDistancesFailed(self, results):
+        self.assertEqual([result['status'] for result in results], ['created', 'error', 'created', 'error'])
+        message = 'trip_distance must be a number with at most 10 digits, 2 of them after the point'
+        self.assertEqual({result['error'] for result in results if result['status'] == 'error'}, {message})
+        self.assertEqual(sorted(Trip.objects.values_list('trip_id', flat=True)), ['TP00000001', 'TP00000003'])
+
+    def test_bad_distance_fails_only_its_row(self):
+        response = self.client.post('/bulk_add_trips/', json.dumps(self.rows), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['created'], response.json()['failed']), (2, 2))
+        self.assertBadDistancesFailed(response.json()['results'])
+
+    def test_bad_distance_in_a_stream(self):
+        body = '\n'.join(json.dumps(row) for row in self.rows)
+        response = self.client.post('/bulk_add_trips/', body, content_type='application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertBadDistancesFailed([json.loads(line) for line in lines[:-1]])
+        self.assertEqual(json.loads(lines[-1]), {'created': 2, 'failed': 2})
+
+    def test_bad_distance_in_a_background_import(self):
+        response = self.client.post('/bulk_add_trips/?background=1', json.dumps(self.rows),
+                                    content_type='application/json')
+        run_pending()
+        job = self.client.get(response.json()['status_url']).json()['job']
+        self.assertEqual((job['status'], job['created'], job['failed']), ('succeeded', 2, 2))
+        self.assertEqual([error['row'] for error in job['errors']], [2, 4])
+
+    def test_add_trip_rejects_a_bad_distance(self):
+        response = self.client.post('/add_trip/', json.dumps(self.rows[1]), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Trip.objects.exists())
@@ -1,8 +1,25 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
-urlpatterns = [
-    path('add_trip/', views.add_trip, name='add_trip'),
-    path('trip_listing/', views.trip_listing, name='trip_listing'),
-    path('trip_details/<str:trip_id>/', views.trip_details, name='trip_details'),
-]
+
+def core_urlpatterns(core_views):
+    """The app's URL patterns, with its core views taken from core_views (views or async_views)."""
+    return [
+        path('add_trip/', core_views.add_trip, name='add_trip'),
+        path('bulk_add_trips/', views.bulk_add_trips, name='bulk_add_trips'),
+        path('trip_listing/', core_views.trip_listing, name='trip_listing'),
+        path('trip_details/<str:trip_id>/', core_views.trip_details, name='trip_details'),
+        path('trip_lookup/', views.trip_lookup, name='trip_lookup'),
+        path('trip_changes/', views.trip_changes, name='trip_changes'),
+        path('booking_events/', views.booking_events, name='booking_events'),
+        path('trip_export/', views.trip_export, name='trip_export'),
+    ]
+
+
+# Pick the async variants of the core views when the deployment runs under ASGI
+core_views = views
+if settings.ASYNC_VIEWS:
+    from . import async_views as core_views
+
+urlpatterns = core_urlpatterns(core_views)
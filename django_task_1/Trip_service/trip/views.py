@@ -1,12 +1,57 @@
 import json
-from django.http import JsonResponse, HttpResponse
-from .models import Trip, Route
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
+from .models import Trip, TripBookings, TripChange, Route
+from .ingest import validate_trip, ingest_trips
 from django.views.decorators.csrf import csrf_exempt
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-import re
 from django.core.exceptions import ValidationError
+from django.db import IntegrityError
 from django.db.models import Q
-import requests
+from Trip_service.pagination import keyset_page, InvalidCursor
+from Trip_service.search import get_search_backend
+from Trip_service.ndjson import parse_lines, result_lines
+from Trip_service.cache import get_details_cache, trip_key
+from route.views import route_details_payload
+from Trip_service.export import export_response, EXPORT_CHUNK_SIZE
+from jobs.queue import enqueue, job_accepted, upload_lines
+from Trip_service.serializers import Serializer, InvalidFields, api_response, pick, requested_fields
+
+# Columns matched by the ?query= search, on the trip and on its route
+TRIP_SEARCH_FIELDS = ['driver_name', 'user_id', 'vehicle_id']
+TRIP_ROUTE_SEARCH_FIELDS = ['route_name', 'route_origin', 'route_destination']
+
+# trip_listing rows, the route must be loaded with select_related('route')
+TRIP_LISTING_SERIALIZER = Serializer(
+    ['trip_id', 'user_id', 'vehicle_id', 'driver_name', 'trip_distance'],
+    nested={'route': Serializer(['route_id', 'route_name', 'route_origin', 'route_destination', 'stops'])},
+)
+
+# Names accepted by trip_listing's ?fields=, bookings come from the TripBookings read model
+TRIP_LISTING_FIELDS = TRIP_LISTING_SERIALIZER.keys + ('bookings',)
+
+
+def trip_listing_serializer(request):
+    """Return the listing serializer narrowed to ?fields= and whether bookings were asked for."""
+    fields = requested_fields(request, TRIP_LISTING_FIELDS)
+    if fields is None:
+        return TRIP_LISTING_SERIALIZER, True
+    return TRIP_LISTING_SERIALIZER.select(fields), 'bookings' in fields
+
+def trip_bookings(trip):
+    # Bookings from the read model, a trip the booking service has not reported on has none
+    try:
+        return trip.booking_view.bookings()
+    except TripBookings.DoesNotExist:
+        return []
+
+def add_trip_conflict(trip_id, route_id):
+    """Explain why create_if_absent() inserted nothing, only queried on that path."""
+    if not Route.objects.filter(route_id=route_id).exists():
+        return f'Route with route_id {route_id} does not exist'
+    if Trip.objects.filter(route_id=route_id).exists():
+        return f'Trip with route_id {route_id} already exists'
+    return f'Trip with trip_id {trip_id} already exists'
+
 
 @csrf_exempt
 def add_trip(request):
@@ -14,27 +59,15 @@ def add_trip(request):
         try:
             data = json.loads(request.body)
 
-            # Check if all required fields are present and not blank
-            required_fields = ['user_id', 'vehicle_id', 'driver_name', 'trip_distance', 'trip_id', 'route_id']
-            for field in required_fields:
-                if field not in data or not data[field]:
-                    return JsonResponse({'error': f'Missing required field: {field}'}, status=400)
-
-            # Validate trip_id format
-            if not re.match(r'^TP\d{8}$', data['trip_id']):
-                return JsonResponse({'error': 'Invalid trip_id format. It should start with TP followed by 8 digits'}, status=400)
+            # Validate input data
+            error = validate_trip(data)
+            if error:
+                return JsonResponse({'error': error}, status=400)
 
-            # Check if the route exists
+            # Add trip to the database, the insert itself checks that the
+            # route exists and that neither the route nor trip_id is taken
             route_id = data['route_id']
-            if not Route.objects.filter(route_id=route_id).exists():
-                return JsonResponse({'error': f'Route with route_id {route_id} does not exist'}, status=400)
-
-            # Check if the trip already exists
-            if Trip.objects.filter(route_id=route_id).exists():
-                return JsonResponse({'error': f'Trip with route_id {route_id} already exists'}, status=400)
-
-            # Add trip to the database
-            trip = Trip.objects.create(
+            trip = Trip.objects.create_if_absent(
                 trip_id=data['trip_id'],
                 user_id=data['user_id'],
                 vehicle_id=data['vehicle_id'],
@@ -42,6 +75,9 @@ def add_trip(request):
                 driver_name=data['driver_name'],
                 trip_distance=data['trip_distance']
             )
+            if trip is None:
+                return JsonResponse({'error': add_trip_conflict(data['trip_id'], route_id)}, status=400)
+            get_details_cache().delete_many([trip_key(trip.trip_id)])
             return JsonResponse({'message': 'Trip added successfully', 'trip_id': trip.trip_id}, status=200)
         except json.JSONDecodeError:
             return JsonResponse({'error': 'Invalid JSON data'}, status=400)
@@ -52,92 +88,269 @@ def add_trip(request):
     else:
         return HttpResponse(status=405)
 
+@csrf_exempt
+def bulk_add_trips(request):
+    if request.method == 'POST':
+        # ?background=1 queues the rows for manage.py run_jobs and answers 202
+        # at once, progress is polled from the returned status_url
+        if request.GET.get('background'):
+            try:
+                job = enqueue('import_trips', upload_lines(request))
+            except ValueError as e:
+                return JsonResponse({'error': str(e)}, status=400)
+            return JsonResponse(job_accepted(job), status=202)
+
+        # NDJSON bodies are read line by line and answered with a stream of row results
+        if request.content_type == 'application/x-ndjson':
+            results = ingest_trips(parse_lines(request))
+            return StreamingHttpResponse(result_lines(results), content_type='application/x-ndjson')
+
+        try:
+            rows = json.loads(request.body)
+        except json.JSONDecodeError:
+            return JsonResponse({'error': 'Invalid JSON data'}, status=400)
+        if not isinstance(rows, list):
+            return JsonResponse({'error': 'Expected a JSON array of trips'}, status=400)
+
+        results = list(ingest_trips(rows))
+        created = sum(1 for result in results if result['status'] == 'created')
+        return JsonResponse({'created': created, 'failed': len(results) - created, 'results': results})
+    else:
+        return HttpResponse(status=405)
+
 @csrf_exempt
 def trip_listing(request):
     if request.method == 'GET':
-        # Fetch all trips with associated route data
-        trips = Trip.objects.select_related('route').all()
+        try:
+            serializer, with_bookings = trip_listing_serializer(request)
+        except InvalidFields as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        # Fetch all trips with associated route data, loading only the
+        # requested columns (and trip_id, which the cursor needs). Pages
+        # follow trip_id unless the search ranks them
+        trips = Trip.objects.order_by('trip_id')
+        if 'route' in serializer.nested:
+            trips = trips.select_related('route')
+        if with_bookings:
+            # Bookings come from the local read model in the same query
+            trips = trips.select_related('booking_view')
+        if serializer is not TRIP_LISTING_SERIALIZER:
+            trips = trips.only('trip_id', *serializer.only(), *(['booking_view__entries'] if with_bookings else []))
 
         # Apply search filter based on query parameters
         query = request.GET.get('query')
+        search = get_search_backend()
         if query:
+            # Route columns are searched in a subquery so each table's own indexes apply
             trips = trips.filter(
-                Q(driver_name__icontains=query) |
-                Q(user_id__icontains=query) |
-                Q(vehicle_id__icontains=query) |
-                Q(route__route_name__icontains=query) |
-                Q(route__route_origin__icontains=query) |
-                Q(route__route_destination__icontains=query) |
-                Q(trip_id__exact=query) |
-                Q(route_id__exact=query)
-                )
-
-        # Sorting, pagination logic
-        page_number = request.GET.get('page', 1)
-        paginator = Paginator(trips, 10)  # Show 10 trips per page
-        try:
-            trips = paginator.page(page_number)
-        except PageNotAnInteger:
-            trips = paginator.page(1)
-        except EmptyPage:
-            trips = paginator.page(paginator.num_pages)
-        
-        data = {
-            'trips': [],
-            'has_next': trips.has_next(),
-            'has_previous': trips.has_previous(),
-            'total_pages': paginator.num_pages,
-            'current_page': trips.number
-        }
-
-        # Fetch booking details for each trip
-        for trip in trips:
-            trip_data = {
-                "trip_id": trip.trip_id,
-                "user_id": trip.user_id,
-                "vehicle_id": trip.vehicle_id,
-                "driver_name": trip.driver_name,
-                "trip_distance": trip.trip_distance,
-                "route": {
-                    "route_id": trip.route.route_id,
-                    "route_name": trip.route.route_name,
-                    "route_origin": trip.route.route_origin,
-                    "route_destination": trip.route.route_destination,
-                    "stops": trip.route.stops
-                },
-                "bookings": []  # Initialize empty list for bookings
+                search.q(query, TRIP_SEARCH_FIELDS, exact_fields=['trip_id', 'route_id']) |
+                Q(route__in=Route.objects.filter(search.q(query, TRIP_ROUTE_SEARCH_FIELDS)))
+            )
+            if request.GET.get('sort_by') == 'relevance':
+                trips = search.rank(trips, query, TRIP_SEARCH_FIELDS + [f'route__{field}' for field in TRIP_ROUTE_SEARCH_FIELDS])
+
+        # Keyset pagination on trip_id when a cursor is given (?after=<cursor>, empty for the first page)
+        if 'after' in request.GET:
+            try:
+                trips, has_next, next_cursor = keyset_page(trips, 'trip_id', request.GET['after'], 10)
+            except InvalidCursor as e:
+                return JsonResponse({'error': str(e)}, status=400)
+            data = {'trips': [], 'has_next': has_next, 'next_cursor': next_cursor}
+        else:
+            # Sorting, pagination logic
+            page_number = request.GET.get('page', 1)
+            paginator = Paginator(trips, 10)  # Show 10 trips per page
+            try:
+                trips = paginator.page(page_number)
+            except PageNotAnInteger:
+                trips = paginator.page(1)
+            except EmptyPage:
+                trips = paginator.page(paginator.num_pages)
+
+            data = {
+                'trips': [],
+                'has_next': trips.has_next(),
+                'has_previous': trips.has_previous(),
+                'total_pages': paginator.num_pages,
+                'current_page': trips.number
             }
-            booking_service_url = f'http://127.0.0.1:8001/booking_listing/?query={trip.trip_id}'
-            booking_response = requests.get(booking_service_url)
-            if booking_response.status_code == 200:
-                booking_data = booking_response.json().get('bookings', [])
-                trip_data['bookings'] = booking_data
 
+        for trip in trips:
+            trip_data = serializer.serialize(trip)
+            if with_bookings:
+                trip_data["bookings"] = trip_bookings(trip)
             data['trips'].append(trip_data)
 
-        return JsonResponse(data)
+        return api_response(request, data)
     else:
         return HttpResponse(status=405)
 
 
+# Related objects trip_details can embed with ?expand=
+TRIP_EXPANSIONS = ['route']
+
+
+def parse_expand(request):
+    """Return the ?expand= names, or raise ValueError naming the unsupported ones."""
+    expand = {name.strip() for name in request.GET.get('expand', '').split(',') if name.strip()}
+    unknown = expand.difference(TRIP_EXPANSIONS)
+    if unknown:
+        raise ValueError(f'Unsupported expand value(s): {", ".join(sorted(unknown))}. '
+                         f'Supported: {", ".join(TRIP_EXPANSIONS)}')
+    return expand
+
+
+TRIP_DETAILS_SERIALIZER = Serializer(['trip_id', 'user_id', 'vehicle_id', 'driver_name', 'trip_distance', 'route_id'])
+
+
+def trip_details_payload(trip):
+    # Cached with the route so every expand variant is served from one entry,
+    # trip must be loaded with select_related('route')
+    return {
+        "trip": TRIP_DETAILS_SERIALIZER.serialize(trip),
+        "route": route_details_payload(trip.route)["route"]
+    }
+
+
+def trip_details_response(request, payload, expand, fields=None):
+    trip = dict(pick(payload["trip"], fields))
+    if 'route' in expand:
+        trip["route"] = payload["route"]
+    return api_response(request, {"trip": trip})
+
+
 @csrf_exempt
 def trip_details(request, trip_id):
     if request.method == 'GET':
         try:
-            # Fetch trip details
-            trip = Trip.objects.get(trip_id=trip_id)
-            data = {
-                "trip": {
-                    "trip_id": trip.trip_id,
-                    "user_id": trip.user_id,
-                    "vehicle_id": trip.vehicle_id,
-                    "driver_name": trip.driver_name,
-                    "trip_distance": trip.trip_distance,
-                    "route_id": trip.route.route_id
-                }
-            }
-            return JsonResponse(data)
+            expand = parse_expand(request)
+            fields = requested_fields(request, TRIP_DETAILS_SERIALIZER.keys)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        try:
+            # Read through the details cache, ?fields= narrows the cached trip
+            details_cache = get_details_cache()
+            payload = details_cache.get(trip_key(trip_id))
+            if payload is None:
+                # Fetch the trip and its route in one query
+                trip = Trip.objects.select_related('route').get(trip_id=trip_id)
+                payload = trip_details_payload(trip)
+                details_cache.set(trip_key(trip_id), payload)
+            return trip_details_response(request, payload, expand, fields)
         except Trip.DoesNotExist:
             return JsonResponse({'error': 'Trip not found'}, status=404)
     else:
         return HttpResponse(status=405)
+
+
+@csrf_exempt
+def trip_lookup(request):
+    if request.method == 'POST':
+        # Which of the given trip_ids exist, answered with one query
+        try:
+            data = json.loads(request.body)
+        except json.JSONDecodeError:
+            return JsonResponse({'error': 'Invalid JSON data'}, status=400)
+        trip_ids = data.get('trip_ids') if isinstance(data, dict) else None
+        if not isinstance(trip_ids, list) or not all(isinstance(trip_id, str) for trip_id in trip_ids):
+            return JsonResponse({'error': 'trip_ids must be a list of trip ids'}, status=400)
+        if len(trip_ids) > 5000:
+            return JsonResponse({'error': 'At most 5000 trip_ids can be looked up at once'}, status=400)
+
+        existing = list(Trip.objects.filter(trip_id__in=set(trip_ids)).values_list('trip_id', flat=True))
+        return JsonResponse({'trip_ids': existing})
+    else:
+        return HttpResponse(status=405)
+
+
+@csrf_exempt
+def trip_changes(request):
+    if request.method == 'GET':
+        # Trip inserts and deletes after the ?after= sequence number, oldest first
+        try:
+            after = int(request.GET.get('after', 0))
+            limit = min(int(request.GET.get('limit', 1000)), 10000)
+        except ValueError:
+            return JsonResponse({'error': 'after and limit must be integers'}, status=400)
+        if limit < 1:
+            return JsonResponse({'error': 'limit must be positive'}, status=400)
+
+        changes = list(TripChange.objects.filter(id__gt=after).order_by('id')
+                       .values_list('id', 'trip_id', 'action')[:limit + 1])
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+        return JsonResponse({
+            'changes': [{'seq': seq, 'trip_id': trip_id, 'action': action} for seq, trip_id, action in changes],
+            'last_seq': changes[-1][0] if changes else after,
+            'has_more': has_more,
+        })
+    else:
+        return HttpResponse(status=405)
+
+
+def invalid_booking_event(event):
+    # True when an outbox event is missing something TripBookings.objects.apply() reads
+    if not isinstance(event, dict) or event.get('action') not in (TripBookings.UPSERTED, TripBookings.DELETED):
+        return True
+    if not isinstance(event.get('seq'), int) or not isinstance(event.get('ticket_id'), str) \
+            or not isinstance(event.get('trip_id'), str):
+        return True
+    return event['action'] == TripBookings.UPSERTED and not isinstance(event.get('booking'), dict)
+
+
+@csrf_exempt
+def booking_events(request):
+    if request.method == 'POST':
+        # Outbox events pushed by the booking service, applied to the TripBookings read model
+        try:
+            data = json.loads(request.body)
+        except json.JSONDecodeError:
+            return JsonResponse({'error': 'Invalid JSON data'}, status=400)
+        events = data.get('events') if isinstance(data, dict) else None
+        if not isinstance(events, list):
+            return JsonResponse({'error': 'events must be a list'}, status=400)
+        for position, event in enumerate(events):
+            if invalid_booking_event(event):
+                return JsonResponse({'error': f'Invalid event at position {position}'}, status=400)
+
+        try:
+            applied = TripBookings.objects.apply(events)
+        except IntegrityError:
+            # Another delivery created the same rows first, the sender retries
+            return JsonResponse({'error': 'Conflicting concurrent delivery, retry'}, status=503)
+        return JsonResponse({'received': len(events), 'applied': applied})
+    else:
+        return HttpResponse(status=405)
+
+
+TRIP_EXPORT_COLUMNS = ['trip_id', 'user_id', 'vehicle_id', 'driver_name', 'trip_distance', 'route_id',
+                       'route.route_name', 'route.route_origin', 'route.route_destination', 'route.stops']
+
+
+def trip_export_rows(trips):
+    # The route columns come from the same joined query, nested back under "route"
+    route_fields = ['route_name', 'route_origin', 'route_destination', 'stops']
+    values = trips.values('trip_id', 'user_id', 'vehicle_id', 'driver_name', 'trip_distance', 'route_id',
+                          *[f'route__{field}' for field in route_fields])
+    for row in values.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        route = {field: row.pop(f'route__{field}') for field in route_fields}
+        row['route'] = route if row['route_id'] is not None else None
+        yield row
+
+
+@csrf_exempt
+def trip_export(request):
+    if request.method == 'GET':
+        # The whole table, or the ?query= matches, streamed in trip_id order
+        trips = Trip.objects.all()
+        query = request.GET.get('query')
+        if query:
+            search = get_search_backend()
+            trips = trips.filter(
+                search.q(query, TRIP_SEARCH_FIELDS, exact_fields=['trip_id', 'route_id']) |
+                Q(route__in=Route.objects.filter(search.q(query, TRIP_ROUTE_SEARCH_FIELDS)))
+            )
+        return export_response(request, trip_export_rows(trips.order_by('trip_id')), TRIP_EXPORT_COLUMNS, 'trips')
+    else:
+        return HttpResponse(status=405)
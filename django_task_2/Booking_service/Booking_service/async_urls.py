@@ -0,0 +1,13 @@
+"""
+The project's URLconf with the async variants of the core views, whatever
+ASYNC_VIEWS says, so the tests can run them next to the sync ones.
+"""
+from django.urls import path, include
+from booking import async_views as booking_async_views
+from booking.urls import core_urlpatterns as booking_urlpatterns
+from .urls import urlpatterns as project_urlpatterns
+
+urlpatterns = [
+    path('', include(booking_urlpatterns(booking_async_views))),
+    *project_urlpatterns,
+]
@@ -0,0 +1,397 @@
+import csv
+import gzip
+import json
+import os
+import re
+import string
+import sys
+import time
+from contextlib import contextmanager
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from itertools import islice
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from .ndjson import parse_lines
+
+FORMATS = ('csv', 'ndjson')
+
+# Temporary table each COPY batch is staged in, dropped when its transaction ends
+STAGING_TABLE = 'bulk_load_staging'
+
+# Characters per write to the COPY stream
+COPY_BUFFER_SIZE = 1 << 16
+
+
+def detect_format(path):
+    name = path[:-3] if path.endswith('.gz') else path
+    extension = os.path.splitext(name)[1].lstrip('.').lower()
+    extension = 'ndjson' if extension in ('jsonl', 'json') else extension
+    if extension not in FORMATS:
+        raise ValueError(f'Cannot tell the format of {path}, pass --format')
+    return extension
+
+
+@contextmanager
+def open_text(path):
+    # "-" reads stdin, a .gz file is decompressed on the fly
+    if path == '-':
+        yield sys.stdin
+        return
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8', newline='') as f:
+        yield f
+
+
+def read_rows(lines, file_format, json_columns=()):
+    """
+    Yield the rows of CSV or NDJSON lines as dicts, or the ValueError for a
+    row that cannot be parsed, like parse_lines. CSV values stay strings,
+    except json_columns, which hold JSON text (e.g. an export's stops).
+    Empty CSV cells are kept as '' and missing ones left out.
+    """
+    if file_format == 'ndjson':
+        yield from parse_lines(lines)
+        return
+    for row in csv.DictReader(lines):
+        data = {column: value for column, value in row.items() if column is not None and value is not None}
+        try:
+            for column in json_columns:
+                if data.get(column):
+                    data[column] = json.loads(data[column])
+        except ValueError as e:
+            yield e
+            continue
+        yield data
+
+
+def sql_literal(text):
+    return "'" + text.replace("'", "''") + "'"
+
+
+def sql_message(template):
+    """An SQL text expression for template, its {field} placeholders read from the staged doc."""
+    parts = []
+    for literal, field, spec, conversion in string.Formatter().parse(template):
+        if literal:
+            parts.append(sql_literal(literal))
+        if field is not None:
+            parts.append(f"coalesce(doc->>'{field}', '')")
+    return ' || '.join(parts) or "''"
+
+
+# A decimal number as text, what Postgres casts to numeric without an error
+DECIMAL_PATTERN = r'^\s*[-+]?([0-9]+(\.[0-9]*)?|\.[0-9]+)\s*$'
+
+
+def decimal_message(field, max_digits, decimal_places):
+    return f'{field} must be a number with at most {max_digits} digits, {decimal_places} of them after the point'
+
+
+def fits_decimal(value, max_digits, decimal_places):
+    """
+    Whether value, a JSON number or numeric string, fits a DecimalField once
+    rounded. The check sql_not_decimal makes on a staged doc, so the ingest
+    functions and the COPY loader accept the same values.
+    """
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        return False
+    if isinstance(value, str) and not re.match(DECIMAL_PATTERN, value, re.ASCII):
+        return False
+    try:
+        number = Decimal(str(value).strip())
+        # quantize() raises for a number with more digits than the context holds
+        rounded = number.quantize(Decimal(1).scaleb(-decimal_places), rounding=ROUND_HALF_UP)
+    except InvalidOperation:
+        return False
+    return rounded.is_finite() and abs(rounded) < Decimal(10) ** (max_digits - decimal_places)
+
+
+# Conditions on a staged doc that hold when the field is invalid, never NULL
+
+def sql_blank(field):
+    # Python's "field not in data or not data[field]"
+    return f"""(NOT doc ? '{field}' OR doc->'{field}' IN ('null', '""', '0', 'false', '[]', '{{}}'))"""
+
+
+def sql_null(field):
+    return f"coalesce(doc->'{field}' = 'null', true)"
+
+
+def sql_mismatch(field, pattern):
+    # Not a string matching the regular expression pattern
+    return f"NOT coalesce(jsonb_typeof(doc->'{field}') = 'string' AND doc->>'{field}' ~ {sql_literal(pattern)}, false)"
+
+
+def sql_not_decimal(field, max_digits, decimal_places):
+    # Not a number, or numeric string, that fits a DecimalField once rounded
+    value = f"doc->>'{field}'"
+    return (f"NOT coalesce(CASE WHEN {value} ~ {sql_literal(DECIMAL_PATTERN)} "
+            f"THEN abs(round(({value})::numeric, {decimal_places})) < 1e{max_digits - decimal_places} END, false)")
+
+
+def sql_too_long(field, max_length):
+    return f"coalesce(char_length(doc->>'{field}') > {max_length}, false)"
+
+
+def length_checks(model, fields):
+    # The error Postgres gives for a value too long for one of model's CharFields
+    checks = []
+    for name in fields:
+        max_length = model._meta.get_field(name).max_length
+        if max_length:
+            checks.append((sql_too_long(name, max_length),
+                           sql_literal(f'value too long for type character varying({max_length})')))
+    return checks
+
+
+def reject_rows(cursor, checks):
+    """
+    Give every staged row that has no error yet the error of the first check
+    it fails. checks are (condition, message) pairs of SQL on the row's doc,
+    in the order the view's validation applies them.
+    """
+    cases = ' '.join(f'WHEN {condition} THEN {message}' for condition, message in checks)
+    cursor.execute(f'UPDATE {STAGING_TABLE} SET error = CASE {cases} END WHERE error IS NULL')
+
+
+def reject_duplicates(cursor, keys):
+    """
+    Reject staged rows repeating an earlier valid row's value of a unique
+    field. keys are (field, message) pairs, the first repeated field's
+    message is used. Unlike the ingest functions, a row is rejected even
+    when the earlier row it repeats fails on another key.
+    """
+    columns = ', '.join(f"row_number() OVER (PARTITION BY doc->>'{field}' ORDER BY row_no) AS seen_{number}"
+                        for number, (field, message) in enumerate(keys))
+    cases = ' '.join(f'WHEN d.seen_{number} > 1 THEN {message}' for number, (field, message) in enumerate(keys))
+    repeated = ' OR '.join(f'd.seen_{number} > 1' for number in range(len(keys)))
+    cursor.execute(
+        f'UPDATE {STAGING_TABLE} s SET error = CASE {cases} END '
+        f'FROM (SELECT row_no, {columns} FROM {STAGING_TABLE} WHERE error IS NULL) d '
+        f'WHERE s.row_no = d.row_no AND ({repeated})'
+    )
+
+
+class _LineReader:
+    # File-like view of an iterator of text lines, read by psycopg2's copy_expert
+
+    def __init__(self, lines):
+        self._lines = lines
+        self._rest = ''
+
+    def read(self, size=-1):
+        chunks = [self._rest]
+        length = len(self._rest)
+        for line in self._lines:
+            chunks.append(line)
+            length += len(line)
+            if 0 <= size <= length:
+                break
+        data = ''.join(chunks)
+        if 0 <= size < len(data):
+            data, self._rest = data[:size], data[size:]
+        else:
+            self._rest = ''
+        return data
+
+
+def copy_lines(cursor, sql, lines):
+    """Run a COPY ... FROM STDIN statement, feeding it lines in COPY text format."""
+    raw = cursor.cursor
+    if hasattr(raw, 'copy_expert'):
+        # psycopg2
+        raw.copy_expert(sql, _LineReader(lines), size=COPY_BUFFER_SIZE)
+        return
+    # psycopg 3
+    reader = _LineReader(lines)
+    with raw.copy(sql) as copy:
+        while True:
+            data = reader.read(COPY_BUFFER_SIZE)
+            if not data:
+                break
+            copy.write(data)
+
+
+def _copy_value(data):
+    if isinstance(data, ValueError):
+        return '\\N\tInvalid JSON data'
+    # json.dumps escapes control characters, only backslashes need doubling for COPY
+    return json.dumps(data, cls=DjangoJSONEncoder).replace('\\', '\\\\') + '\t\\N'
+
+
+def stage_rows(cursor, rows, first_row):
+    """
+    COPY rows into a new STAGING_TABLE (row_no, doc jsonb, error), numbered
+    from first_row, and return how many there were. Unparseable rows are
+    staged with their error already set.
+    """
+    cursor.execute(f'CREATE TEMP TABLE {STAGING_TABLE} (row_no bigint, doc jsonb, error text) ON COMMIT DROP')
+    count = 0
+
+    def lines():
+        nonlocal count
+        for row_no, data in enumerate(rows, start=first_row):
+            count += 1
+            yield f'{row_no}\t{_copy_value(data)}\n'
+
+    copy_lines(cursor, f'COPY {STAGING_TABLE} (row_no, doc, error) FROM STDIN', lines())
+    if count:
+        cursor.execute(f'ANALYZE {STAGING_TABLE}')
+    return count
+
+
+def copy_load(rows, load_batch, id_field, batch_size):
+    """
+    Load rows into Postgres batch_size at a time. Each batch is COPYed into
+    a staging table and handed to load_batch(cursor), which checks and
+    inserts it with set-based statements in the same transaction, recording
+    rejected rows' errors on the staging table. Yields (rows, rejects) per
+    batch, rejects being results like the ingest functions yield.
+    """
+    rows = iter(rows)
+    first_row = 1
+    while True:
+        with transaction.atomic(), connection.cursor() as cursor:
+            staged = stage_rows(cursor, islice(rows, batch_size), first_row)
+            if not staged:
+                cursor.execute(f'DROP TABLE {STAGING_TABLE}')
+                return
+            load_batch(cursor)
+            cursor.execute(f'SELECT row_no, doc->>%s, error FROM {STAGING_TABLE} '
+                           f'WHERE error IS NOT NULL ORDER BY row_no', [id_field])
+            rejects = [{'row': row_no, id_field: value, 'status': 'error', 'error': error}
+                       for row_no, value, error in cursor.fetchall()]
+            # ON COMMIT DROP only fires on a real commit, not inside an outer transaction
+            cursor.execute(f'DROP TABLE {STAGING_TABLE}')
+        yield staged, rejects
+        first_row += staged
+
+
+def orm_load(rows, ingest, batch_size):
+    # The same (rows, rejects) batches from an ingest function, for databases without COPY
+    results = ingest(rows)
+    while True:
+        batch = list(islice(results, batch_size))
+        if not batch:
+            return
+        yield len(batch), [result for result in batch if result['status'] != 'created']
+
+
+def secondary_indexes(tables):
+    """(name, definition) of the indexes on tables that back no primary key or unique constraint."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT i.relname, pg_get_indexdef(x.indexrelid) FROM pg_index x '
+            'JOIN pg_class i ON i.oid = x.indexrelid JOIN pg_class t ON t.oid = x.indrelid '
+            'WHERE t.relname = ANY(%s) AND pg_table_is_visible(t.oid) '
+            'AND NOT x.indisunique AND NOT x.indisprimary ORDER BY i.relname',
+            [list(tables)],
+        )
+        return cursor.fetchall()
+
+
+@contextmanager
+def deferred_indexes(indexes):
+    """Drop indexes for the duration of the block and build them again after, also when it fails."""
+    with connection.cursor() as cursor:
+        for name, definition in indexes:
+            cursor.execute(f'DROP INDEX {connection.ops.quote_name(name)}')
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            for name, definition in indexes:
+                cursor.execute(definition)
+
+
+class LoadTable:
+    """
+    What BulkLoadCommand needs to load one table: the row id field for
+    reports, the CSV columns holding JSON, the set-based COPY batch loader,
+    the ingest function used without Postgres, and the database tables the
+    load writes to, whose secondary indexes --defer-indexes drops.
+    """
+
+    def __init__(self, id_field, load_batch, ingest, models, json_columns=()):
+        self.id_field = id_field
+        self.load_batch = load_batch
+        self.ingest = ingest
+        self.models = models
+        self.json_columns = json_columns
+
+    def db_tables(self):
+        return [model._meta.db_table for model in self.models]
+
+
+class BulkLoadCommand(BaseCommand):
+    """
+    manage.py bulk_load <table> <file>: load a CSV or NDJSON file (such as
+    an export) with the same checks as the bulk endpoints. On Postgres rows
+    go through COPY into a staging table and are checked and inserted with
+    set-based statements, elsewhere through the ingest functions.
+    Subclasses set tables, a dict of table name to LoadTable.
+    """
+
+    tables = {}
+
+    def add_arguments(self, parser):
+        parser.add_argument('table', choices=sorted(self.tables))
+        parser.add_argument('path', help='CSV or NDJSON file, optionally .gz, or - for stdin')
+        parser.add_argument('--format', choices=FORMATS, help='Default: from the file extension')
+        parser.add_argument('--batch-size', type=int, default=200_000,
+                            help='Rows checked and inserted per transaction')
+        parser.add_argument('--defer-indexes', action='store_true',
+                            help='Drop the secondary indexes of the loaded tables while loading (Postgres)')
+        parser.add_argument('--orm', action='store_true', help='Use the ingest functions on Postgres too')
+        parser.add_argument('--rejects', help='Write the rejected rows and their errors to this NDJSON file')
+        parser.add_argument('--show', type=int, default=20, help='Number of rejected rows to print')
+
+    def handle(self, *args, **options):
+        table = self.tables[options['table']]
+        path = options['path']
+        try:
+            file_format = options['format'] or detect_format(path)
+        except ValueError as e:
+            raise CommandError(str(e))
+        use_copy = connection.vendor == 'postgresql' and not options['orm']
+
+        indexes = []
+        if options['defer_indexes']:
+            if not use_copy:
+                raise CommandError('--defer-indexes needs Postgres and the COPY loader')
+            indexes = secondary_indexes(table.db_tables())
+            # Printed first, so they can be recreated by hand should the load be killed
+            for name, definition in indexes:
+                self.stdout.write(f'Deferring {definition};')
+
+        rejects_file = open(options['rejects'], 'w') if options['rejects'] else None
+        loaded = rejected = 0
+        started = time.perf_counter()
+        try:
+            with open_text(path) as lines, deferred_indexes(indexes):
+                rows = read_rows(lines, file_format, table.json_columns)
+                if use_copy:
+                    batches = copy_load(rows, table.load_batch, table.id_field, options['batch_size'])
+                else:
+                    batches = orm_load(rows, table.ingest, options['batch_size'])
+                for count, rejects in batches:
+                    loaded += count - len(rejects)
+                    for reject in rejects:
+                        rejected += 1
+                        if rejects_file is not None:
+                            rejects_file.write(json.dumps(reject) + '\n')
+                        if rejected <= options['show']:
+                            self.stdout.write(f"Row {reject['row']} ({reject[table.id_field]}): {reject['error']}")
+                    elapsed = time.perf_counter() - started
+                    self.stdout.write(f'{loaded + rejected} rows read, {loaded} loaded, {rejected} rejected, '
+                                      f'{(loaded + rejected) / elapsed:.0f} rows/s')
+                if indexes:
+                    self.stdout.write(f'Rebuilding {len(indexes)} indexes')
+        finally:
+            if rejects_file is not None:
+                rejects_file.close()
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Loaded {loaded} {options["table"]} in {elapsed:.1f}s, {rejected} rejected'))
@@ -0,0 +1,58 @@
+import csv
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+# Rows fetched per database round trip while exporting
+EXPORT_CHUNK_SIZE = 2000
+
+
+class _Echo:
+    # csv.writer target that hands back each rendered line instead of storing it
+    def write(self, value):
+        return value
+
+
+def _lookup(row, column):
+    # Dotted columns reach into nested objects, e.g. route.route_name
+    for key in column.split('.'):
+        row = row.get(key) if isinstance(row, dict) else None
+    return row
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+
+
+def csv_lines(rows, columns):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        values = []
+        for column in columns:
+            value = _lookup(row, column)
+            if isinstance(value, (list, dict)):
+                value = json.dumps(value, cls=DjangoJSONEncoder)
+            values.append('' if value is None else value)
+        yield writer.writerow(values)
+
+
+def export_response(request, rows, columns, name):
+    """
+    Stream rows (an iterator of dicts) as NDJSON, or as CSV with the given
+    columns when ?format=csv. Rows are rendered one at a time, so memory use
+    does not grow with the number of rows.
+    """
+    export_format = request.GET.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return JsonResponse({'error': f'format must be one of: {", ".join(EXPORT_FORMATS)}'}, status=400)
+    lines = csv_lines(rows, columns) if export_format == 'csv' else ndjson_lines(rows)
+    response = StreamingHttpResponse(lines, content_type=EXPORT_FORMATS[export_format])
+    response['Content-Disposition'] = f'attachment; filename="{name}.{export_format}"'
+    return response
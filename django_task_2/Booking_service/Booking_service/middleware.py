@@ -0,0 +1,91 @@
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from .metrics import observe_request
+from .request_context import RequestContext, current_request, install_query_observer
+from .tracing import get_tracer
+
+
+def _view_name(request):
+    # The URL pattern's name keeps the label set small, unmatched paths share one
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None else 'unmatched'
+
+
+class RequestContextMiddleware:
+    """
+    Gives each request a RequestContext its SQL queries and peer service
+    calls are added to, then reports it, each part only when enabled:
+
+    - QUERY_COUNT_HEADER: an X-DB-Queries header with the number of SQL
+      queries the request ran, for the load benchmark.
+    - METRICS: the request's latency, and the time it spent in SQL queries
+      and calling peer services, by view, for /metrics.
+    - TRACING: a span for the request, continuing the caller's trace from
+      its traceparent header, with child spans for its SQL queries and peer
+      service calls. The trace id is returned in an X-Request-ID header,
+      manage.py show_trace <id> draws the request across services.
+
+    A streamed body's queries run after the headers are sent, so they are
+    not counted.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not (getattr(settings, 'QUERY_COUNT_HEADER', False) or getattr(settings, 'METRICS', False)
+                or get_tracer() is not None):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        connection_created.connect(install_query_observer)
+        # Connections opened before the middleware loaded miss the signal
+        for connection in connections.all(initialized_only=True):
+            install_query_observer(None, connection)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _start(self, request):
+        tracer = get_tracer()
+        trace = tracer.start_trace(request.headers.get('traceparent')) if tracer is not None else None
+        return RequestContext(trace)
+
+    def _finish(self, request, response, request_context, started):
+        seconds = time.perf_counter() - started
+        view = _view_name(request)
+        if getattr(settings, 'METRICS', False):
+            observe_request(view, request.method, str(response.status_code), seconds, request_context)
+        trace = request_context.trace
+        if trace is not None:
+            trace.finish(view, started, seconds, method=request.method, path=request.path,
+                         status=response.status_code)
+            trace.tracer.export(trace)
+            response['X-Request-ID'] = trace.trace_id
+        if getattr(settings, 'QUERY_COUNT_HEADER', False):
+            response['X-DB-Queries'] = str(request_context.queries)
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request_context = self._start(request)
+        token = current_request.set(request_context)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_request.reset(token)
+        return self._finish(request, response, request_context, started)
+
+    async def __acall__(self, request):
+        request_context = self._start(request)
+        token = current_request.set(request_context)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_request.reset(token)
+        return self._finish(request, response, request_context, started)
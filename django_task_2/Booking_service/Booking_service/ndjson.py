@@ -0,0 +1,24 @@
+import json
+
+
+def parse_lines(lines):
+    """Yield one parsed object per non blank line, or the JSONDecodeError for bad lines."""
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            yield e
+
+
+def result_lines(results):
+    """Render bulk ingest results as NDJSON, one line per row then a summary line."""
+    created = failed = 0
+    for result in results:
+        if result['status'] == 'created':
+            created += 1
+        else:
+            failed += 1
+        yield json.dumps(result) + '\n'
+    yield json.dumps({'created': created, 'failed': failed}) + '\n'
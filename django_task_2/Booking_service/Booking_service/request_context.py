@@ -0,0 +1,45 @@
+import time
+from contextvars import ContextVar
+
+
+class RequestContext:
+    """
+    What the request being handled spent on SQL queries and peer service
+    calls, and its trace when it is traced. The X-DB-Queries header, the
+    request metrics and the trace's spans are all read from it.
+    """
+
+    __slots__ = ('queries', 'db_seconds', 'outbound_seconds', 'trace')
+
+    def __init__(self, trace=None):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.outbound_seconds = 0.0
+        self.trace = trace
+
+
+# The context of the request being handled, also seen from the threads
+# sync_to_async runs ORM calls in
+current_request = ContextVar('current_request', default=None)
+
+
+def observe_query(execute, sql, params, many, context):
+    # Connection execute wrapper adding each query to the request's context
+    request_context = current_request.get()
+    if request_context is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        seconds = time.perf_counter() - started
+        request_context.queries += 1
+        request_context.db_seconds += seconds
+        trace = request_context.trace
+        if trace is not None:
+            trace.add('db', 'SQL', started, seconds, sql=sql[:trace.tracer.sql_length], many=many)
+
+
+def install_query_observer(sender, connection, **kwargs):
+    if observe_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(observe_query)
@@ -0,0 +1,75 @@
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.db.models.functions import Greatest
+from django.utils.module_loading import import_string
+
+
+def _as_decimal(query):
+    try:
+        number = Decimal(query)
+    except InvalidOperation:
+        return None
+    return number if number.is_finite() else None
+
+
+class PortableSearchBackend:
+    """
+    Plain icontains matching, works on every database (SQLite in tests).
+    Results keep the listing's own ordering.
+    """
+
+    def q(self, query, fields, exact_fields=(), numeric_fields=()):
+        condition = Q()
+        for field in fields:
+            condition |= Q(**{f'{field}__icontains': query})
+        for field in exact_fields:
+            condition |= Q(**{field: query})
+        # Numbers match exactly instead of casting the column to text
+        number = _as_decimal(query)
+        if number is not None:
+            for field in numeric_fields:
+                condition |= Q(**{field: number})
+        return condition
+
+    def rank(self, queryset, query, fields):
+        return queryset
+
+
+class TrigramSearchBackend(PortableSearchBackend):
+    """
+    pg_trgm backed search for Postgres.
+
+    The icontains filters compile to UPPER(col::text) LIKE UPPER('%q%'), which
+    the GIN gin_trgm_ops indexes created by the search migrations serve.
+    rank() orders matches by their best word similarity.
+    """
+
+    def rank(self, queryset, query, fields):
+        from django.contrib.postgres.search import TrigramWordSimilarity
+
+        similarities = [TrigramWordSimilarity(query, field) for field in fields]
+        score = Greatest(*similarities) if len(similarities) > 1 else similarities[0]
+        # alias() keeps the score out of .values() payloads
+        return queryset.alias(search_rank=score).order_by('-search_rank', 'pk')
+
+
+@lru_cache(maxsize=None)
+def _load_backend(path):
+    return import_string(path)()
+
+
+def get_search_backend():
+    """
+    Return the backend named by settings.SEARCH_BACKEND, or pick trigram search
+    on Postgres and the portable backend elsewhere.
+    """
+    path = getattr(settings, 'SEARCH_BACKEND', None)
+    if not path:
+        if connection.vendor == 'postgresql':
+            path = 'Booking_service.search.TrigramSearchBackend'
+        else:
+            path = 'Booking_service.search.PortableSearchBackend'
+    return _load_backend(path)
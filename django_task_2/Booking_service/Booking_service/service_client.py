@@ -0,0 +1,214 @@
+import asyncio
+import random
+import threading
+import time
+import weakref
+from collections import deque
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from .metrics import observe_outbound
+from .tracing import outbound_span, record_outbound
+
+DEFAULTS = {
+    'CONNECT_TIMEOUT': 2.0,
+    'READ_TIMEOUT': 5.0,
+    'RETRIES': 2,
+    'BACKOFF': 0.1,
+    'POOL_SIZE': 20,
+}
+
+# Statuses worth another attempt on an idempotent request
+RETRY_STATUSES = {502, 503, 504}
+
+
+class ServiceClient:
+    """
+    HTTP client for calls to a peer service.
+
+    Requests go through one keep-alive connection pool per host, with
+    connect and read deadlines. Idempotent requests are retried on
+    connection errors, timeouts and 502/503/504 answers, sleeping a random
+    (full jitter) exponential backoff between attempts.
+    """
+
+    def __init__(self, base_url, connect_timeout=2.0, read_timeout=5.0, retries=2, backoff=0.1, pool_size=20):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._async_clients = weakref.WeakKeyDictionary()  # event loop -> httpx.AsyncClient
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=1000)
+        self.requests = self.retried = self.failures = 0
+
+    def url(self, path):
+        return f'{self.base_url}/{path.lstrip("/")}'
+
+    def _delay(self, attempt):
+        return random.uniform(0, self.backoff * 2 ** attempt)
+
+    def _propagate(self, kwargs):
+        # Pass a traced request's trace on to the peer, each attempt as its own span
+        span_id, traceparent = outbound_span()
+        if span_id is not None:
+            kwargs['headers'] = {**(kwargs.get('headers') or {}), 'traceparent': traceparent}
+        return span_id
+
+    def _record(self, method, path, span_id, started, status, retried=False, failed=False):
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.requests += 1
+            self.retried += retried
+            self.failures += failed
+            self._latencies.append(elapsed * 1000)
+        observe_outbound(self.base_url, method, status, elapsed)
+        record_outbound(span_id, method, self.url(path), status, started, elapsed)
+
+    def request(self, method, path, idempotent=None, **kwargs):
+        """Send a request, raising requests.RequestException once the attempts run out."""
+        if idempotent is None:
+            idempotent = method in ('GET', 'HEAD')
+        attempts = self.retries + 1 if idempotent else 1
+        kwargs.setdefault('timeout', self.timeout)
+        for attempt in range(attempts):
+            span_id = self._propagate(kwargs)
+            started = time.perf_counter()
+            last_attempt = attempt == attempts - 1
+            try:
+                response = self.session.request(method, self.url(path), **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                self._record(method, path, span_id, started, 'error', retried=not last_attempt, failed=last_attempt)
+                if last_attempt:
+                    raise
+            else:
+                if last_attempt or response.status_code not in RETRY_STATUSES:
+                    self._record(method, path, span_id, started, str(response.status_code))
+                    return response
+                self._record(method, path, span_id, started, str(response.status_code), retried=True)
+            time.sleep(self._delay(attempt))
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def _async_client(self):
+        import httpx
+
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout[1], connect=self.timeout[0]),
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+            )
+            self._async_clients[loop] = client
+        return client
+
+    async def arequest(self, method, path, idempotent=None, **kwargs):
+        """Async request(), raising httpx.HTTPError once the attempts run out."""
+        import httpx
+
+        if idempotent is None:
+            idempotent = method in ('GET', 'HEAD')
+        attempts = self.retries + 1 if idempotent else 1
+        client = self._async_client()
+        for attempt in range(attempts):
+            span_id = self._propagate(kwargs)
+            started = time.perf_counter()
+            last_attempt = attempt == attempts - 1
+            try:
+                response = await client.request(method, self.url(path), **kwargs)
+            except httpx.TransportError:
+                self._record(method, path, span_id, started, 'error', retried=not last_attempt, failed=last_attempt)
+                if last_attempt:
+                    raise
+            else:
+                if last_attempt or response.status_code not in RETRY_STATUSES:
+                    self._record(method, path, span_id, started, str(response.status_code))
+                    return response
+                self._record(method, path, span_id, started, str(response.status_code), retried=True)
+            await asyncio.sleep(self._delay(attempt))
+
+    async def aget(self, path, **kwargs):
+        return await self.arequest('GET', path, **kwargs)
+
+    async def apost(self, path, **kwargs):
+        return await self.arequest('POST', path, **kwargs)
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            data = {
+                'base_url': self.base_url,
+                'requests': self.requests,
+                'retried': self.retried,
+                'failures': self.failures,
+                'latency_ms': {},
+                'pools': [],
+            }
+        if latencies:
+            data['latency_ms'] = {
+                'p50': round(latencies[len(latencies) // 2], 2),
+                'p95': round(latencies[min(len(latencies) - 1, len(latencies) * 95 // 100)], 2),
+                'max': round(latencies[-1], 2),
+            }
+        for adapter in {id(adapter): adapter for adapter in self.session.adapters.values()}.values():
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools[key]
+                data['pools'].append({
+                    'host': f'{pool.scheme}://{pool.host}:{pool.port}',
+                    'connections_opened': pool.num_connections,
+                    'requests': pool.num_requests,
+                    # The pool queue is padded with None for connections not opened yet
+                    'idle': sum(conn is not None for conn in pool.pool.queue) if pool.pool else 0,
+                    'max_size': self.pool_size,
+                })
+        return data
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_service_client(url_setting):
+    """
+    Return the process wide client for the peer service whose base URL is in
+    the url_setting setting, e.g. get_service_client('BOOKING_SERVICE_URL').
+    """
+    client = _clients.get(url_setting)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(url_setting)
+            if client is None:
+                options = {**DEFAULTS, **getattr(settings, 'SERVICE_CLIENT', {})}
+                client = ServiceClient(
+                    getattr(settings, url_setting),
+                    connect_timeout=options['CONNECT_TIMEOUT'],
+                    read_timeout=options['READ_TIMEOUT'],
+                    retries=options['RETRIES'],
+                    backoff=options['BACKOFF'],
+                    pool_size=options['POOL_SIZE'],
+                )
+                _clients[url_setting] = client
+    return client
+
+
+def service_client_stats():
+    return {url_setting: client.stats() for url_setting, client in list(_clients.items())}
+
+
+@receiver(setting_changed)
+def reset_service_clients(setting=None, **kwargs):
+    if setting is None or setting == 'SERVICE_CLIENT' or setting.endswith('_SERVICE_URL'):
+        _clients.clear()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -38,9 +39,13 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'booking',
+    'jobs',
+    # The project package itself, for the commands that are not one app's (bulk_load, show_trace)
+    'Booking_service',
 ]
 
 MIDDLEWARE = [
+    'Booking_service.middleware.RequestContextMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -128,5 +133,64 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-#manually_added
-#TRIP_SERVICE_URL = 'http://127.0.0.1:8000/trip_details/'
\ No newline at end of file
+# Serve the async variants of the views, for ASGI deployments (ASYNC_VIEWS=1)
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', '') == '1'
+
+# Report each request's SQL query count in an X-DB-Queries header, for the
+# load benchmark (QUERY_COUNT_HEADER=1)
+QUERY_COUNT_HEADER = os.environ.get('QUERY_COUNT_HEADER', '') == '1'
+
+# Per view latency, SQL and peer service timings served at /metrics, cheap
+# enough to leave on (METRICS=0 turns them off). The values are kept per
+# process and not aggregated: under gunicorn/uvicorn --workers N a scrape
+# reads whichever worker answers it and the counters jump between scrapes.
+# Scrape each worker as its own target (one port or container per worker)
+# for numbers that add up.
+METRICS = os.environ.get('METRICS', '1') == '1'
+
+# Cross-service request tracing (TRACING=1). Spans of each request, its SQL
+# and its calls to the other service are appended to JSONL files in
+# DIRECTORY, shared by both services, for manage.py show_trace
+TRACING = {
+    'ENABLED': os.environ.get('TRACING', '') == '1',
+    'DIRECTORY': os.environ.get('TRACING_DIRECTORY', str(BASE_DIR.parent.parent / 'traces')),
+    'SERVICE_NAME': 'booking',
+}
+
+# Peer services, called through Booking_service.service_client
+TRIP_SERVICE_URL = os.environ.get('TRIP_SERVICE_URL', 'http://127.0.0.1:8000')
+
+# Timeouts are in seconds, RETRIES only applies to idempotent requests
+SERVICE_CLIENT = {
+    'CONNECT_TIMEOUT': 2.0,
+    'READ_TIMEOUT': 5.0,
+    'RETRIES': 2,
+    'BACKOFF': 0.1,
+    'POOL_SIZE': 20,
+}
+
+# Local copy of the trip ids, synced from the trip service change feed.
+# A trip is confirmed locally only while the copy is at most MAX_STALENESS
+# seconds old, otherwise add_booking asks the trip service.
+TRIP_REPLICA = {
+    'ENABLED': True,
+    'MAX_STALENESS': 30,
+    'PAGE_SIZE': 5000,
+    'RESYNC_OVERLAP': 1000,
+}
+
+# Background imports (bulk endpoints with ?background=1), worked by manage.py run_jobs.
+# HANDLERS maps a job kind to the ingest function its rows go through.
+# LEASE_SECONDS is how long a worker may hold a chunk before another takes it
+# over, keep it far above the time a chunk of CHUNK_SIZE rows takes (about a
+# second locally): a chunk whose worker is still at it when the lease runs
+# out is worked twice, and the second run reports the first one's rows as
+# already existing. run_jobs warns once a chunk takes half the lease.
+JOBS = {
+    'HANDLERS': {
+        'import_bookings': 'booking.ingest.ingest_bookings',
+    },
+    'CHUNK_SIZE': 1000,
+    'LEASE_SECONDS': 300,
+    'MAX_ATTEMPTS': 3,
+}
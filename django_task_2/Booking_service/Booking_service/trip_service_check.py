@@ -1,15 +1,20 @@
+# Run from the project directory: python -m Booking_service.trip_service_check
+import os
 import requests
+from Booking_service.service_client import ServiceClient
 
 def check_trip_service():
-    trip_service_url = 'http://127.0.0.1:8000/trip_details/TP12345678'  # Replace with the actual URL of Trip service
+    trip_service = ServiceClient(os.environ.get('TRIP_SERVICE_URL', 'http://127.0.0.1:8000'), retries=0)
     try:
-        response = requests.get(trip_service_url)
+        response = trip_service.get('/trip_details/TP12345678/')
         if response.status_code == 200:
             print("Trip service is reachable.")
         else:
             print(f"Trip service is not reachable. Status code: {response.status_code}")
     except requests.ConnectionError:
         print("Failed to connect to Trip service. Connection refused.")
+    except requests.Timeout:
+        print("Trip service did not answer in time.")
 
 # Check if the trip service is reachable
 check_trip_service()
@@ -16,8 +16,12 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
+from . import views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('booking.urls')),  # Include booking app URLs
+    path('', include('jobs.urls')),  # Background import status
+    path('service_stats/', views.service_stats, name='service_stats'),
+    path('metrics', views.metrics, name='metrics'),  # Where Prometheus scrapes by default
 ]
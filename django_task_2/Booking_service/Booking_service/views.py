@@ -0,0 +1,27 @@
+from django.http import JsonResponse, HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from .service_client import service_client_stats
+from .metrics import CONTENT_TYPE, render
+from booking.trip_replica import get_trip_replica
+from booking.outbox import outbox_stats
+
+
+@csrf_exempt
+def service_stats(request):
+    if request.method == 'GET':
+        trip_replica = get_trip_replica()
+        return JsonResponse({
+            'service_clients': service_client_stats(),
+            'trip_replica': trip_replica.stats() if trip_replica is not None else None,
+            'outbox': outbox_stats(),
+        })
+    else:
+        return HttpResponse(status=405)
+
+
+@csrf_exempt
+def metrics(request):
+    if request.method == 'GET':
+        return HttpResponse(render(), content_type=CONTENT_TYPE)
+    else:
+        return HttpResponse(status=405)
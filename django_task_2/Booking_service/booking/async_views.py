@@ -0,0 +1,183 @@
+import json
+from django.http import JsonResponse, HttpResponse
+from django.core.exceptions import ValidationError
+from .models import Booking
+from django.db import IntegrityError
+from Booking_service.search import get_search_backend
+from .views import BOOKING_SEARCH_FIELDS, BOOKING_SERIALIZER, BOOKING_DETAILS_FIELDS, add_booking_conflict, \
+    booking_columns, booking_details_data, existing_booking_error
+from Booking_service.serializers import InvalidFields, api_response, loads, pick, requested_fields
+from .ingest import validate_booking
+from .trip_replica import get_trip_replica
+from asgiref.sync import sync_to_async
+from Booking_service.pagination import apaginate, akeyset_page, InvalidCursor
+from Booking_service.service_client import get_service_client
+import httpx
+
+
+# csrf_exempt() from Django 4.2 hides the coroutine from the handler,
+# so mark the async views by hand
+def csrf_exempt(view_func):
+    view_func.csrf_exempt = True
+    return view_func
+
+
+@csrf_exempt
+async def add_booking(request):
+    if request.method == 'POST':
+        try:
+            # deserialization
+            received_data = json.loads(request.body)
+
+            # Validate input data
+            error = validate_booking(received_data)
+            if error:
+                return JsonResponse({'error': error}, status=400)
+
+            error = await sync_to_async(existing_booking_error)(received_data['ticket_id'], received_data['trip_id'])
+            if error:
+                return JsonResponse({'error': error}, status=400)
+
+            # Validate that the trip exists, from the local replica when it
+            # knows the trip and from the trip service otherwise
+            trip_replica = get_trip_replica()
+            if trip_replica is None or not trip_replica.contains(received_data['trip_id']):
+                try:
+                    trip_response = await get_service_client('TRIP_SERVICE_URL').aget(
+                        f'/trip_details/{received_data["trip_id"]}/')
+                except httpx.HTTPError:
+                    return JsonResponse({'error': 'Could not verify trip_id with the trip service'}, status=503)
+
+                if trip_response.status_code == 200:
+                    trip_data = trip_response.json()
+                    trip_id = trip_data.get('trip', {}).get('trip_id')
+                    if trip_id != received_data['trip_id']:
+                        return JsonResponse({'error': 'Provided trip_id does not match the trip_id from the trip service'}, status=400)
+                else:
+                    return JsonResponse({'error': 'Invalid trip_id or trip does not exist'}, status=400)
+
+            # Add booking to the database, the insert itself checks that
+            # neither the ticket_id nor the trip is already booked, and the
+            # trip's totals are updated along with it
+            booking = await sync_to_async(Booking.objects.create_with_changes)(
+                ticket_id=received_data['ticket_id'],
+                trip_id=received_data['trip_id'],
+                traveller_name=received_data['traveller_name'],
+                traveller_number=received_data['traveller_number'],
+                ticket_cost=received_data['ticket_cost'],
+                traveller_email=received_data['traveller_email']
+            )
+            if booking is None:
+                return JsonResponse({'error': await sync_to_async(add_booking_conflict)(received_data['trip_id'])},
+                                    status=400)
+
+            return JsonResponse({'message': 'Booking added successfully', 'ticket_id': booking.ticket_id}, status=200)
+
+        except json.JSONDecodeError:
+            return JsonResponse({'error': 'Invalid JSON data'}, status=400)
+
+        except ValidationError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        except IntegrityError:
+            return JsonResponse({'error': 'Provided ticket_id already exists or does not follow the format'}, status=400)
+
+    else:
+        return JsonResponse({'error': 'Invalid HTTP method'}, status=405)
+
+
+@csrf_exempt
+async def booking_listing(request):
+    if request.method == 'GET':
+        try:
+            fields = requested_fields(request, BOOKING_SERIALIZER.keys)
+        except InvalidFields as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        # In ticket_id order unless sorted otherwise
+        bookings = Booking.objects.order_by('ticket_id')
+
+        # Sorting
+        sort_fields = ['ticket_id', 'traveller_name', 'ticket_cost', 'traveller_number', 'traveller_email', 'trip_id']
+        sort_by = request.GET.get('sort_by', 'ticket_id')
+        if sort_by in sort_fields:
+            bookings = bookings.order_by(sort_by)
+
+        # Searching through the configured search backend
+        query = request.GET.get('query')
+        search = get_search_backend()
+        if query:
+            bookings = bookings.filter(search.q(query, BOOKING_SEARCH_FIELDS, numeric_fields=['ticket_cost']))
+            if sort_by == 'relevance':
+                bookings = search.rank(bookings, query, BOOKING_SEARCH_FIELDS)
+
+        # Select only the requested columns, plus the ones the cursor is read from
+        keyset_sort = sort_by if sort_by in sort_fields else 'ticket_id'
+        bookings = bookings.values(*booking_columns(fields, keyset_sort))
+
+        # Keyset pagination when a cursor is given (?after=<cursor>, empty for the first page)
+        if 'after' in request.GET:
+            try:
+                page_bookings, has_next, next_cursor = await akeyset_page(
+                    bookings, keyset_sort, request.GET['after'], 10)
+            except InvalidCursor as e:
+                return JsonResponse({'error': str(e)}, status=400)
+            data = {"bookings": [pick(booking, fields) for booking in page_bookings],
+                    "has_next": has_next, "next_cursor": next_cursor}
+            return api_response(request, data)
+
+        # Pagination
+        page, page_bookings = await apaginate(bookings, request.GET.get('page', 1), 10)
+
+        data = {"bookings": [pick(booking, fields) for booking in page_bookings]}
+        return api_response(request, data)
+    else:
+        return HttpResponse(status=405)
+
+
+@csrf_exempt
+async def bookings_by_trips(request):
+    if request.method == 'GET':
+        trip_ids = [trip_id.strip() for trip_id in request.GET.get('trip_ids', '').split(',') if trip_id.strip()]
+        if not trip_ids:
+            return JsonResponse({'error': 'trip_ids is required and cannot be blank'}, status=400)
+        if len(trip_ids) > 100:
+            return JsonResponse({'error': 'At most 100 trip_ids can be requested at once'}, status=400)
+
+        data = {"bookings": {trip_id: [] for trip_id in trip_ids}}
+        async for booking in Booking.objects.filter(trip_id__in=trip_ids).order_by('ticket_id').values():
+            data["bookings"][booking['trip_id']].append(booking)
+        return api_response(request, data)
+    else:
+        return HttpResponse(status=405)
+
+
+@csrf_exempt
+async def booking_details(request, ticket_id):
+    if request.method == 'GET':
+        try:
+            fields = requested_fields(request, BOOKING_DETAILS_FIELDS)
+        except InvalidFields as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        try:
+            booking = await Booking.objects.aget(ticket_id=ticket_id)
+
+            # One call returns the trip with its route embedded, skipped when neither is asked for
+            trip_data = {}
+            route_data = {}
+            if fields is None or 'trip' in fields or 'route' in fields:
+                try:
+                    trip_response = await get_service_client('TRIP_SERVICE_URL').aget(
+                        f'/trip_details/{booking.trip_id}/', params={'expand': 'route'})
+                    if trip_response.status_code == 200:
+                        trip_data = loads(trip_response.content).get('trip', {})
+                        route_data = trip_data.pop('route', {})
+                except httpx.HTTPError:
+                    # The trip and route are optional in the answer
+                    pass
+
+            return api_response(request, booking_details_data(booking, trip_data, route_data, fields))
+        except Booking.DoesNotExist:
+            return JsonResponse({'error': 'Booking not found'}, status=404)
+    else:
+        return HttpResponse(status=405)
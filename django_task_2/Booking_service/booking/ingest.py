@@ -0,0 +1,257 @@
+import re
+import requests
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, connection
+from django.db.models import Q
+from .models import Booking, OutboxEvent, TripSummary
+from Booking_service.service_client import get_service_client
+from Booking_service.bulk_load import (STAGING_TABLE, copy_lines, decimal_message, fits_decimal, length_checks,
+                                       reject_duplicates, reject_rows, sql_literal, sql_mismatch, sql_not_decimal,
+                                       sql_null)
+from .trip_replica import get_trip_replica
+
+BOOKING_FIELDS = ['ticket_id', 'traveller_name', 'traveller_number', 'ticket_cost', 'traveller_email', 'trip_id']
+
+# Most trip_ids the trip service's /trip_lookup/ answers in one call
+TRIP_LOOKUP_LIMIT = 5000
+
+# Temporary table of the trip_ids a COPY batch references that exist
+KNOWN_TRIPS_TABLE = 'bulk_load_known_trips'
+
+
+def validate_booking(data):
+    """Return the error message for an add_booking payload, or None when it is valid."""
+    if not isinstance(data, dict):
+        return 'Booking must be a JSON object'
+
+    missing_fields = [field for field in BOOKING_FIELDS if field not in data]
+    if missing_fields:
+        return f'Missing required field(s): {", ".join(missing_fields)}'
+
+    # Validate ticket_id format
+    if not isinstance(data['ticket_id'], str) or not re.match(r'^TK\d{8}$', data['ticket_id']):
+        return 'Invalid ticket_id format. It should start with TK followed by 8 digits'
+
+    # Validate trip_id format
+    if not isinstance(data['trip_id'], str) or not re.match(r'^TP\d{8}$', data['trip_id']):
+        return 'Invalid trip_id format. It should start with TP followed by 8 digits'
+
+    # Validate traveller_number format
+    if not isinstance(data['traveller_number'], str) or not re.match(r'^\d{10}$', data['traveller_number']):
+        return 'Invalid traveller_number format. It should be a 10-digit number'
+
+    # Validate traveller_email format
+    if not isinstance(data['traveller_email'], str) or \
+            not re.match(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$', data['traveller_email']):
+        return 'Invalid traveller_email format'
+
+    cost = Booking._meta.get_field('ticket_cost')
+    if not fits_decimal(data['ticket_cost'], cost.max_digits, cost.decimal_places):
+        return decimal_message('ticket_cost', cost.max_digits, cost.decimal_places)
+    return None
+
+
+def existing_trip_ids(trip_ids):
+    """
+    Return which of trip_ids exist. The local trip replica answers for the
+    trips it knows, the rest are asked of the trip service, TRIP_LOOKUP_LIMIT
+    per call.
+    """
+    trip_replica = get_trip_replica()
+    known = {trip_id for trip_id in trip_ids if trip_replica is not None and trip_replica.contains(trip_id)}
+    unknown = sorted(set(trip_ids) - known)
+    for start in range(0, len(unknown), TRIP_LOOKUP_LIMIT):
+        # A lookup only reads, so it is safe to retry like a GET
+        response = get_service_client('TRIP_SERVICE_URL').post(
+            '/trip_lookup/', json={'trip_ids': unknown[start:start + TRIP_LOOKUP_LIMIT]}, idempotent=True)
+        response.raise_for_status()
+        known.update(response.json()['trip_ids'])
+    return known
+
+
+def ingest_bookings(rows, batch_size=1000):
+    """
+    Validate and insert bookings, yielding one result per ticket in input order.
+
+    Each batch costs one query for tickets and trips that are already booked,
+    one trip service call verifying every distinct trip_id, and one bulk
+    insert of the valid rows.
+    """
+    batch = []
+    for row_number, data in enumerate(rows, start=1):
+        batch.append((row_number, data))
+        if len(batch) >= batch_size:
+            yield from _ingest_batch(batch)
+            batch = []
+    if batch:
+        yield from _ingest_batch(batch)
+
+
+def _ingest_batch(batch):
+    errors = {}
+    candidates = {}
+    for row_number, data in batch:
+        if isinstance(data, ValueError):
+            errors[row_number] = 'Invalid JSON data'
+            continue
+        error = validate_booking(data)
+        if error:
+            errors[row_number] = error
+            continue
+        candidates[row_number] = data
+
+    # Tickets and trips that are already booked, in one query
+    ticket_ids = {data['ticket_id'] for data in candidates.values()}
+    trip_ids = {data['trip_id'] for data in candidates.values()}
+    booked_ticket_ids = set()
+    booked_trip_ids = set()
+    for ticket_id, trip_id in Booking.objects.filter(Q(ticket_id__in=ticket_ids) | Q(trip_id__in=trip_ids)) \
+            .values_list('ticket_id', 'trip_id'):
+        booked_ticket_ids.add(ticket_id)
+        booked_trip_ids.add(trip_id)
+
+    for row_number, data in list(candidates.items()):
+        if data['trip_id'] in booked_trip_ids:
+            errors[row_number] = 'Trip ID already exists'
+        elif data['ticket_id'] in booked_ticket_ids:
+            errors[row_number] = 'Provided ticket_id already exists or does not follow the format'
+        else:
+            booked_trip_ids.add(data['trip_id'])
+            booked_ticket_ids.add(data['ticket_id'])
+            continue
+        del candidates[row_number]
+
+    # Verify the remaining trips with the trip service
+    if candidates:
+        try:
+            known_trip_ids = existing_trip_ids({data['trip_id'] for data in candidates.values()})
+        except (requests.RequestException, ValueError, KeyError):
+            known_trip_ids = None
+        for row_number, data in list(candidates.items()):
+            if known_trip_ids is None:
+                errors[row_number] = 'Could not verify trip_id with the trip service'
+            elif data['trip_id'] not in known_trip_ids:
+                errors[row_number] = 'Invalid trip_id or trip does not exist'
+            else:
+                continue
+            del candidates[row_number]
+
+    bookings = {row_number: Booking(**{field: data[field] for field in BOOKING_FIELDS})
+                for row_number, data in candidates.items()}
+    if bookings:
+        try:
+            Booking.objects.bulk_create_with_changes(list(bookings.values()))
+        except (DatabaseError, ValidationError):
+            # A concurrent insert or a value the database rejects, retry row by row
+            for row_number, booking in list(bookings.items()):
+                try:
+                    Booking.objects.bulk_create_with_changes([booking])
+                except (DatabaseError, ValidationError) as e:
+                    errors[row_number] = str(e)
+                    del bookings[row_number]
+
+    for row_number, data in batch:
+        if row_number in bookings:
+            yield {'row': row_number, 'ticket_id': bookings[row_number].ticket_id, 'status': 'created'}
+        else:
+            ticket_id = data.get('ticket_id') if isinstance(data, dict) else None
+            yield {'row': row_number, 'ticket_id': ticket_id, 'status': 'error', 'error': errors[row_number]}
+
+
+def copy_ingest_bookings(cursor):
+    """
+    The COPY loader's version of _ingest_batch: check and insert the bookings
+    staged by bulk_load.copy_load with set-based statements, recording each
+    rejected row's error on the staging table. The batch's distinct trip_ids
+    are verified through existing_trip_ids(). The trip totals and outbox
+    events go in with the bookings.
+    """
+    quote = connection.ops.quote_name
+    bookings = quote(Booking._meta.db_table)
+    summaries = quote(TripSummary._meta.db_table)
+    outbox = quote(OutboxEvent._meta.db_table)
+    cost = Booking._meta.get_field('ticket_cost')
+    rounded_cost = f"round((doc->>'ticket_cost')::numeric, {cost.decimal_places})"
+
+    missing = ', '.join(f"CASE WHEN NOT doc ? '{field}' THEN '{field}' END" for field in BOOKING_FIELDS)
+    checks = [
+        ("jsonb_typeof(doc) <> 'object'", sql_literal('Booking must be a JSON object')),
+        (' OR '.join(f"NOT doc ? '{field}'" for field in BOOKING_FIELDS),
+         f"'Missing required field(s): ' || concat_ws(', ', {missing})"),
+        (sql_mismatch('ticket_id', r'^TK[0-9]{8}$'),
+         sql_literal('Invalid ticket_id format. It should start with TK followed by 8 digits')),
+        (sql_mismatch('trip_id', r'^TP[0-9]{8}$'),
+         sql_literal('Invalid trip_id format. It should start with TP followed by 8 digits')),
+        (sql_mismatch('traveller_number', r'^[0-9]{10}$'),
+         sql_literal('Invalid traveller_number format. It should be a 10-digit number')),
+        (sql_mismatch('traveller_email', r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'),
+         sql_literal('Invalid traveller_email format')),
+        (sql_null('traveller_name'), sql_literal('traveller_name cannot be null')),
+        (sql_not_decimal('ticket_cost', cost.max_digits, cost.decimal_places),
+         sql_literal(decimal_message('ticket_cost', cost.max_digits, cost.decimal_places))),
+    ]
+    checks += length_checks(Booking, ['traveller_name', 'traveller_email'])
+    reject_rows(cursor, checks)
+
+    reject_rows(cursor, [
+        (f"EXISTS (SELECT 1 FROM {bookings} b WHERE b.trip_id = doc->>'trip_id')",
+         sql_literal('Trip ID already exists')),
+        (f"EXISTS (SELECT 1 FROM {bookings} b WHERE b.ticket_id = doc->>'ticket_id')",
+         sql_literal('Provided ticket_id already exists or does not follow the format')),
+    ])
+    reject_duplicates(cursor, [
+        ('trip_id', sql_literal('Trip ID already exists')),
+        ('ticket_id', sql_literal('Provided ticket_id already exists or does not follow the format')),
+    ])
+
+    # Verify the remaining trips with the trip service
+    cursor.execute(f"SELECT DISTINCT doc->>'trip_id' FROM {STAGING_TABLE} WHERE error IS NULL")
+    trip_ids = [row[0] for row in cursor.fetchall()]
+    if trip_ids:
+        try:
+            known_trip_ids = existing_trip_ids(trip_ids)
+        except (requests.RequestException, ValueError, KeyError):
+            cursor.execute(f'UPDATE {STAGING_TABLE} SET error = '
+                           f"{sql_literal('Could not verify trip_id with the trip service')} WHERE error IS NULL")
+            return
+        cursor.execute(f'CREATE TEMP TABLE {KNOWN_TRIPS_TABLE} (trip_id text PRIMARY KEY) ON COMMIT DROP')
+        copy_lines(cursor, f'COPY {KNOWN_TRIPS_TABLE} (trip_id) FROM STDIN',
+                   (f'{trip_id}\n' for trip_id in known_trip_ids))
+        cursor.execute(
+            f"UPDATE {STAGING_TABLE} s SET error = {sql_literal('Invalid trip_id or trip does not exist')} "
+            f"WHERE error IS NULL AND NOT EXISTS (SELECT 1 FROM {KNOWN_TRIPS_TABLE} k WHERE k.trip_id = s.doc->>'trip_id')"
+        )
+        cursor.execute(f'DROP TABLE {KNOWN_TRIPS_TABLE}')
+
+    # A booking inserted since the checks by someone else is left out and rejected
+    cursor.execute(
+        f'WITH inserted AS ('
+        f'  INSERT INTO {bookings} (ticket_id, trip_id, traveller_name, traveller_number, ticket_cost, traveller_email)'
+        f"  SELECT doc->>'ticket_id', doc->>'trip_id', doc->>'traveller_name', doc->>'traveller_number',"
+        f"         {rounded_cost}, doc->>'traveller_email'"
+        f"  FROM {STAGING_TABLE} WHERE error IS NULL ORDER BY doc->>'ticket_id'"
+        f'  ON CONFLICT DO NOTHING RETURNING ticket_id'
+        f') UPDATE {STAGING_TABLE} s '
+        f"SET error = {sql_literal('Provided ticket_id already exists or does not follow the format')} "
+        f"WHERE error IS NULL AND NOT EXISTS (SELECT 1 FROM inserted i WHERE i.ticket_id = s.doc->>'ticket_id')"
+    )
+    # Incremented like TripSummary.objects.record(), one row per trip
+    cursor.execute(
+        f'INSERT INTO {summaries} AS summary (trip_id, booking_count, revenue) '
+        f"SELECT doc->>'trip_id', 1, {rounded_cost} FROM {STAGING_TABLE} WHERE error IS NULL "
+        f"ORDER BY doc->>'trip_id' "
+        f'ON CONFLICT (trip_id) DO UPDATE SET '
+        f'booking_count = summary.booking_count + excluded.booking_count, '
+        f'revenue = summary.revenue + excluded.revenue'
+    )
+    # The outbox events carry booking_document() of each booking
+    document = ', '.join(
+        f"'{field}', {rounded_cost}::text" if field == 'ticket_cost' else f"'{field}', doc->>'{field}'"
+        for field in [field.attname for field in Booking._meta.concrete_fields]
+    )
+    cursor.execute(
+        f'INSERT INTO {outbox} (ticket_id, trip_id, action, booking, created_at, delivered_at, attempts) '
+        f"SELECT doc->>'ticket_id', doc->>'trip_id', {sql_literal(OutboxEvent.UPSERTED)}, "
+        f'jsonb_build_object({document}), now(), NULL, 0 '
+        f'FROM {STAGING_TABLE} WHERE error IS NULL ORDER BY row_no'
+    )
@@ -0,0 +1,12 @@
+from Booking_service.bulk_load import BulkLoadCommand, LoadTable
+from booking.ingest import copy_ingest_bookings, ingest_bookings
+from booking.models import Booking, OutboxEvent, TripSummary
+
+
+class Command(BulkLoadCommand):
+    help = ('Load bookings from a CSV or NDJSON file with the checks of /bulk_add_bookings/, '
+            'through COPY on Postgres')
+
+    tables = {
+        'bookings': LoadTable('ticket_id', copy_ingest_bookings, ingest_bookings, [Booking, TripSummary, OutboxEvent]),
+    }
@@ -0,0 +1,37 @@
+import time
+import requests
+from django.core.management.base import BaseCommand, CommandError
+from booking.outbox import deliver_pending
+
+
+class Command(BaseCommand):
+    help = 'Deliver the booking outbox events to the trip service read model'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Deliver what is pending, then exit')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to wait when the outbox is empty')
+        parser.add_argument('--max-backoff', type=float, default=60.0)
+
+    def handle(self, *args, **options):
+        failures = 0
+        while True:
+            try:
+                delivered = deliver_pending(options['batch_size'])
+            except requests.RequestException as e:
+                if options['once']:
+                    raise CommandError(f'Delivery failed: {e}')
+                # Back off exponentially while the trip service is unavailable
+                failures += 1
+                delay = min(options['max_backoff'], options['interval'] * 2 ** failures)
+                self.stderr.write(f'Delivery failed, retrying in {delay:.1f}s: {e}')
+                time.sleep(delay)
+                continue
+
+            failures = 0
+            if delivered:
+                self.stdout.write(f'Delivered {delivered} events')
+            elif options['once']:
+                return
+            else:
+                time.sleep(options['interval'])
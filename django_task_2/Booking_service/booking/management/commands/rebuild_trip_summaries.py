@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from booking.models import TripSummary
+
+
+class Command(BaseCommand):
+    help = 'Recompute the per trip booking totals from the bookings, or with --verify only compare them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true', help='Report summaries that differ, change nothing')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--show', type=int, default=20, help='Number of differing trips to print')
+
+    def handle(self, *args, **options):
+        if not options['verify']:
+            created = TripSummary.objects.rebuild(batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt {created} trip summaries'))
+            return
+
+        mismatches = 0
+        for trip_id, stored, expected in TripSummary.objects.mismatches(batch_size=options['batch_size']):
+            mismatches += 1
+            if mismatches <= options['show']:
+                self.stdout.write(f'{trip_id}: stored {_totals(stored)}, expected {_totals(expected)}')
+        if mismatches:
+            raise CommandError(f'{mismatches} trip summaries differ from the bookings, '
+                               f'run rebuild_trip_summaries to fix them')
+        self.stdout.write(self.style.SUCCESS('Trip summaries match the bookings'))
+
+
+def _totals(row):
+    if row is None:
+        return 'missing'
+    booking_count, revenue = row
+    return f'booking_count={booking_count} revenue={revenue}'
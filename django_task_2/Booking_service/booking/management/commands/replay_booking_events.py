@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from booking.outbox import replay_bookings
+
+
+class Command(BaseCommand):
+    help = 'Queue an outbox event for every booking, to rebuild the trip service read model'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        queued = replay_bookings(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Queued {queued} booking events, run deliver_outbox to send them'))
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.30 on 2026-10-18 17:47
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def check_no_duplicate_trips(apps, schema_editor):
+    # Stop with the offending trips rather than fail on the constraint, the
+    # duplicate bookings have to be resolved by hand before migrating
+    Booking = apps.get_model('booking', 'Booking')
+    duplicates = list(Booking.objects.values('trip_id').annotate(bookings=Count('ticket_id'))
+                      .filter(bookings__gt=1).order_by('trip_id').values_list('trip_id', flat=True)[:21])
+    if duplicates:
+        listed = ', '.join(duplicates[:20]) + (' and more' if len(duplicates) > 20 else '')
+        raise RuntimeError(f'Cannot make trip_id unique, these trips have more than one booking: {listed}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0003_search_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_no_duplicate_trips, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='booking',
+            constraint=models.UniqueConstraint(fields=('trip_id',), name='booking_unique_trip'),
+        ),
+        # The unique index replaces the plain trip_id index
+        migrations.AlterField(
+            model_name='booking',
+            name='trip_id',
+            field=models.CharField(max_length=10),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.30 on 2026-10-18 17:59
+
+from django.db import migrations, models
+
+
+def backfill_trip_summaries(apps, schema_editor):
+    # Totals for the trips that already have bookings
+    Booking = apps.get_model('booking', 'Booking')
+    TripSummary = apps.get_model('booking', 'TripSummary')
+    trips = Booking.objects.order_by('trip_id').values('trip_id').annotate(
+        booking_count=models.Count('ticket_id'),
+        revenue=models.Sum('ticket_cost'),
+    ).values_list('trip_id', 'booking_count', 'revenue')
+    batch = []
+    for trip_id, booking_count, revenue in trips.iterator(chunk_size=5000):
+        batch.append(TripSummary(trip_id=trip_id, booking_count=booking_count, revenue=revenue))
+        if len(batch) >= 5000:
+            TripSummary.objects.bulk_create(batch)
+            batch = []
+    TripSummary.objects.bulk_create(batch)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0004_booking_unique_trip'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TripSummary',
+            fields=[
+                ('trip_id', models.CharField(max_length=10, primary_key=True, serialize=False)),
+                ('booking_count', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+        ),
+        migrations.RunPython(backfill_trip_summaries, migrations.RunPython.noop),
+    ]
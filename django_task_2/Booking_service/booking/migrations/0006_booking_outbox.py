@@ -0,0 +1,44 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:01
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+def queue_existing_bookings(apps, schema_editor):
+    # The trip service read model starts from an upserted event per booking
+    Booking = apps.get_model('booking', 'Booking')
+    OutboxEvent = apps.get_model('booking', 'OutboxEvent')
+    batch = []
+    for booking in Booking.objects.order_by('ticket_id').values().iterator(chunk_size=5000):
+        batch.append(OutboxEvent(ticket_id=booking['ticket_id'], trip_id=booking['trip_id'], action='upserted',
+                                 booking=booking))
+        if len(batch) >= 5000:
+            OutboxEvent.objects.bulk_create(batch)
+            batch = []
+    OutboxEvent.objects.bulk_create(batch)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0005_trip_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ticket_id', models.CharField(max_length=10)),
+                ('trip_id', models.CharField(max_length=10)),
+                ('action', models.CharField(choices=[('upserted', 'Upserted'), ('deleted', 'Deleted')], max_length=8)),
+                ('booking', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('delivered_at', models.DateTimeField(blank=True, null=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('delivered_at__isnull', True)), fields=['id'], name='outbox_event_pending')],
+            },
+        ),
+        migrations.RunPython(queue_existing_bookings, migrations.RunPython.noop),
+    ]
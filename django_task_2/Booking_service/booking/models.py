@@ -1,17 +1,76 @@
 # booking/models.py
-from django.db import models
+from decimal import Decimal
+from django.db import connections, models, transaction
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, Q, Sum
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 import re
 from django.core.exceptions import ValidationError
+from django.db.backends.utils import format_number
 from django.conf import settings
 
+class BookingManager(models.Manager):
+
+    def create_if_absent(self, **fields):
+        """
+        Insert the booking in a single INSERT ... ON CONFLICT DO NOTHING.
+        Returns the booking, or None when the ticket_id or trip_id is already
+        taken. The unique constraints decide, so concurrent requests cannot
+        both succeed.
+        """
+        booking = self.model(**fields)
+        connection = connections[self.db]
+        columns = list(self.model._meta.concrete_fields)
+        quote = connection.ops.quote_name
+        sql = (
+            f'INSERT INTO {quote(self.model._meta.db_table)} ({", ".join(quote(field.column) for field in columns)}) '
+            f'VALUES ({", ".join(["%s"] * len(columns))}) '
+            f'ON CONFLICT DO NOTHING RETURNING {quote(self.model._meta.pk.column)}'
+        )
+        params = [field.get_db_prep_save(getattr(booking, field.attname), connection) for field in columns]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            if cursor.fetchone() is None:
+                return None
+        booking._state.adding = False
+        booking._state.db = self.db
+        return booking
+
+    def create_with_changes(self, **fields):
+        # create_if_absent(), with the trip's totals and the outbox event for
+        # the trip service written in the same transaction
+        with transaction.atomic(using=self.db):
+            booking = self.create_if_absent(**fields)
+            if booking is not None:
+                TripSummary.objects.db_manager(self.db).record([booking])
+                OutboxEvent.objects.db_manager(self.db).record([booking], OutboxEvent.UPSERTED)
+        return booking
+
+    def bulk_create_with_changes(self, bookings):
+        with transaction.atomic(using=self.db):
+            self.bulk_create(bookings)
+            TripSummary.objects.db_manager(self.db).record(bookings)
+            OutboxEvent.objects.db_manager(self.db).record(bookings, OutboxEvent.UPSERTED)
+        return bookings
+
+
 class Booking(models.Model):
     ticket_id = models.CharField(primary_key=True, max_length=10)
-    trip_id = models.CharField(max_length=10)  
+    trip_id = models.CharField(max_length=10)
     traveller_name = models.CharField(max_length=100)
     traveller_number = models.CharField(max_length=15)
     ticket_cost = models.DecimalField(max_digits=10, decimal_places=2)
     traveller_email = models.EmailField()
 
+    objects = BookingManager()
+
+    class Meta:
+        constraints = [
+            # One booking per trip, its index also serves the trip_id lookups
+            models.UniqueConstraint(fields=['trip_id'], name='booking_unique_trip'),
+        ]
+
     def clean(self):
         # Validate ticket_id format
         if not self.ticket_id.startswith('TK'):
@@ -32,4 +91,150 @@ class Booking(models.Model):
             if response.status_code == 200:
                 return response.json()
         return None
-'''
\ No newline at end of file
+'''
+
+
+class TripSummaryManager(models.Manager):
+
+    def record(self, bookings, sign=1):
+        """
+        Add bookings to their trips' totals, or take them off with sign=-1.
+        Each trip is one INSERT ... ON CONFLICT DO UPDATE that increments
+        the stored counters, so concurrent writers never overwrite each other.
+        """
+        deltas = {}
+        for booking in bookings:
+            count, revenue = deltas.get(booking.trip_id, (0, Decimal(0)))
+            deltas[booking.trip_id] = (count + sign, revenue + sign * Decimal(str(booking.ticket_cost)))
+        if not deltas:
+            return
+
+        connection = connections[self.db]
+        quote = connection.ops.quote_name
+        table = quote(self.model._meta.db_table)
+        revenue_field = self.model._meta.get_field('revenue')
+        sql = (
+            f'INSERT INTO {table} (trip_id, booking_count, revenue) VALUES (%s, %s, %s) '
+            f'ON CONFLICT (trip_id) DO UPDATE SET '
+            f'booking_count = {table}.booking_count + excluded.booking_count, '
+            f'revenue = {table}.revenue + excluded.revenue'
+        )
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, [(trip_id, count, revenue_field.get_db_prep_save(revenue, connection))
+                                     for trip_id, (count, revenue) in sorted(deltas.items())])
+
+    def computed(self):
+        # The summaries recomputed from the bookings, in trip_id order
+        return Booking.objects.using(self.db).order_by('trip_id').values('trip_id').annotate(
+            booking_count=Count('ticket_id'),
+            revenue=Sum('ticket_cost'),
+        ).values_list('trip_id', 'booking_count', 'revenue')
+
+    def rebuild(self, batch_size=1000):
+        """Replace every summary with one recomputed from the bookings, returning the row count."""
+        created = 0
+        with transaction.atomic(using=self.db):
+            self.all().delete()
+            batch = []
+            for trip_id, booking_count, revenue in self.computed().iterator(chunk_size=batch_size):
+                batch.append(self.model(trip_id=trip_id, booking_count=booking_count, revenue=revenue))
+                if len(batch) >= batch_size:
+                    created += len(self.bulk_create(batch))
+                    batch = []
+            created += len(self.bulk_create(batch))
+        return created
+
+    def mismatches(self, batch_size=1000):
+        """
+        Yield (trip_id, stored, expected) for every summary that differs from
+        the bookings, stored or expected is None for a missing row. A stored
+        row of zeros matches a trip whose bookings were all deleted. Both
+        sides are read in trip_id order and merged, so memory stays flat.
+        """
+        stored = self.order_by('trip_id').exclude(booking_count=0, revenue=0) \
+            .values_list('trip_id', 'booking_count', 'revenue').iterator(chunk_size=batch_size)
+        expected = self.computed().iterator(chunk_size=batch_size)
+        yield from merge_mismatches(stored, expected)
+
+
+def merge_mismatches(stored, expected):
+    # Both iterators yield (key, *values) tuples sorted on key
+    stored_row = next(stored, None)
+    expected_row = next(expected, None)
+    while stored_row is not None or expected_row is not None:
+        if expected_row is None or (stored_row is not None and stored_row[0] < expected_row[0]):
+            yield stored_row[0], stored_row[1:], None
+            stored_row = next(stored, None)
+        elif stored_row is None or expected_row[0] < stored_row[0]:
+            yield expected_row[0], None, expected_row[1:]
+            expected_row = next(expected, None)
+        else:
+            if stored_row[1:] != expected_row[1:]:
+                yield stored_row[0], stored_row[1:], expected_row[1:]
+            stored_row = next(stored, None)
+            expected_row = next(expected, None)
+
+
+class TripSummary(models.Model):
+    # Per trip totals of its bookings, kept current by every booking insert
+    # and delete so dashboards read one row instead of scanning the bookings
+    trip_id = models.CharField(primary_key=True, max_length=10)
+    booking_count = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    objects = TripSummaryManager()
+
+
+def booking_document(booking):
+    # The booking as the read model stores it, the same shape .values() gives
+    document = {}
+    for field in Booking._meta.concrete_fields:
+        value = getattr(booking, field.attname)
+        if isinstance(field, models.DecimalField) and value is not None:
+            value = format_number(Decimal(str(value)), field.max_digits, field.decimal_places)
+        document[field.attname] = value
+    return document
+
+
+class OutboxEventManager(models.Manager):
+
+    def record(self, bookings, action):
+        self.bulk_create([
+            self.model(ticket_id=booking.ticket_id, trip_id=booking.trip_id, action=action,
+                       booking=booking_document(booking) if action == OutboxEvent.UPSERTED else None)
+            for booking in bookings
+        ])
+
+
+class OutboxEvent(models.Model):
+    # Booking changes for the trip service's read model. Each one is written
+    # in the same transaction as the change and kept until deliver_outbox has
+    # handed it over, so no change is lost if the trip service is down.
+    UPSERTED = 'upserted'
+    DELETED = 'deleted'
+
+    ticket_id = models.CharField(max_length=10)
+    trip_id = models.CharField(max_length=10)
+    action = models.CharField(max_length=8, choices=[(UPSERTED, 'Upserted'), (DELETED, 'Deleted')])
+    booking = models.JSONField(encoder=DjangoJSONEncoder, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+
+    objects = OutboxEventManager()
+
+    class Meta:
+        indexes = [
+            # The worker only ever scans the undelivered events, oldest first
+            models.Index(fields=['id'], condition=Q(delivered_at__isnull=True), name='outbox_event_pending'),
+        ]
+
+    def message(self):
+        return {'seq': self.id, 'action': self.action, 'ticket_id': self.ticket_id, 'trip_id': self.trip_id,
+                'booking': self.booking}
+
+
+@receiver(post_delete, sender=Booking)
+def record_booking_delete(sender, instance, using, **kwargs):
+    TripSummary.objects.db_manager(using).record([instance], sign=-1)
+    OutboxEvent.objects.db_manager(using).record([instance], OutboxEvent.DELETED)
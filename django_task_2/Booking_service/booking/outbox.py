@@ -0,0 +1,68 @@
+import requests
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from Booking_service.service_client import get_service_client
+from Booking_service.serializers import JSON_CONTENT_TYPE, dumps
+from .models import Booking, OutboxEvent
+
+
+def deliver_pending(batch_size=500):
+    """
+    Send the oldest undelivered outbox events to the trip service in one call
+    and mark them delivered, returning how many were sent.
+
+    Delivery is at least once: events are only marked after the trip service
+    has accepted them, so a failure leaves them to be sent again, and the
+    trip service ignores any event it has already applied. Raises
+    requests.RequestException when the trip service does not accept them.
+    """
+    error = None
+    with transaction.atomic():
+        # Rows another worker is sending are skipped rather than waited on
+        events = list(OutboxEvent.objects.select_for_update(skip_locked=True)
+                      .filter(delivered_at__isnull=True).order_by('id')[:batch_size])
+        if not events:
+            return 0
+        ids = [event.id for event in events]
+        try:
+            # Applying an event twice is harmless, so the call may be retried
+            response = get_service_client('TRIP_SERVICE_URL').post(
+                '/booking_events/', data=dumps({'events': [event.message() for event in events]}),
+                headers={'Content-Type': JSON_CONTENT_TYPE}, idempotent=True)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            error = e
+            OutboxEvent.objects.filter(id__in=ids).update(attempts=F('attempts') + 1)
+        else:
+            OutboxEvent.objects.filter(id__in=ids).update(delivered_at=timezone.now(), attempts=F('attempts') + 1)
+    if error is not None:
+        raise error
+    return len(events)
+
+
+def replay_bookings(batch_size=1000):
+    """
+    Queue an upserted event for every booking, returning how many were
+    queued. Once delivered they bring a rebuilt or drifted read model back
+    in line with the bookings.
+    """
+    queued = 0
+    batch = []
+    for booking in Booking.objects.order_by('ticket_id').iterator(chunk_size=batch_size):
+        batch.append(booking)
+        if len(batch) >= batch_size:
+            OutboxEvent.objects.record(batch, OutboxEvent.UPSERTED)
+            queued += len(batch)
+            batch = []
+    OutboxEvent.objects.record(batch, OutboxEvent.UPSERTED)
+    return queued + len(batch)
+
+
+def outbox_stats():
+    pending = OutboxEvent.objects.filter(delivered_at__isnull=True)
+    oldest = pending.order_by('id').values_list('created_at', flat=True).first()
+    return {
+        'pending': pending.count(),
+        'oldest_pending_age_seconds': None if oldest is None else round((timezone.now() - oldest).total_seconds(), 1),
+    }
@@ -1,3 +1,472 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import threading
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+from django.core.management import CommandError, call_command
+import requests
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from .models import Booking, OutboxEvent, TripSummary
+from .outbox import deliver_pending, replay_bookings
+from .trip_replica import TripReplica
+from .views import add_booking_conflict
+from Booking_service.pagination import encode_cursor
+from Booking_service.service_client import ServiceClient
+from Booking_service.testing import AsyncViewsMixin, QueryBudgetMixin, service_response, stub_service_calls
+from Booking_service.tracing import read_spans
 
-# Create your tests here.
+
+def booking_fields(ticket_id, trip_id):
+    return {
+        'ticket_id': ticket_id,
+        'trip_id': trip_id,
+        'traveller_name': 'Asha',
+        'traveller_number': '9876543210',
+        'ticket_cost': '250.00',
+        'traveller_email': 'asha@example.com',
+    }
+
+
+class CreateIfAbsentTests(TestCase):
+
+    def test_inserts_in_one_statement(self):
+        with self.assertNumQueries(1):
+            booking = Booking.objects.create_if_absent(**booking_fields('TK00000001', 'TP00000001'))
+        self.assertEqual(booking.ticket_id, 'TK00000001')
+        self.assertEqual(Booking.objects.get(ticket_id='TK00000001').ticket_cost, Decimal('250.00'))
+
+    def test_conflicts_return_none(self):
+        Booking.objects.create_if_absent(**booking_fields('TK00000001', 'TP00000001'))
+        self.assertIsNone(Booking.objects.create_if_absent(**booking_fields('TK00000002', 'TP00000001')))
+        self.assertEqual(add_booking_conflict('TP00000001'), 'Trip ID already exists')
+        self.assertIsNone(Booking.objects.create_if_absent(**booking_fields('TK00000001', 'TP00000002')))
+        self.assertEqual(add_booking_conflict('TP00000002'),
+                         'Provided ticket_id already exists or does not follow the format')
+
+
+@override_settings(TRIP_REPLICA={'ENABLED': False})
+class AddBookingDuplicateTests(TestCase):
+
+    def test_duplicates_are_refused_without_asking_the_trip_service(self):
+        Booking.objects.create_with_changes(**booking_fields('TK00000001', 'TP00000001'))
+        cases = [(booking_fields('TK00000002', 'TP00000001'), 'Trip ID already exists'),
+                 (booking_fields('TK00000001', 'TP00000002'),
+                  'Provided ticket_id already exists or does not follow the format')]
+        # The trip service being down does not matter for a duplicate
+        with mock.patch('requests.Session.request', side_effect=requests.ConnectionError):
+            for booking, error in cases:
+                response = self.client.post('/add_booking/', json.dumps(booking), content_type='application/json')
+                self.assertEqual((response.status_code, response.json()), (400, {'error': error}))
+            response = self.client.post('/add_booking/', json.dumps(booking_fields('TK00000003', 'TP00000003')),
+                                        content_type='application/json')
+            self.assertEqual(response.status_code, 503)
+
+
+class TripReplicaTests(TestCase):
+
+    def test_lookups_miss_until_a_background_sync_warms_it(self):
+        replica = TripReplica(max_staleness=30)
+        changes = {'changes': [{'seq': 1, 'trip_id': 'TP00000001', 'action': 'created'}],
+                   'last_seq': 1, 'has_more': False}
+        released = threading.Event()
+        callers = []
+
+        def request(client, method, path, **kwargs):
+            # Held until the lookup has answered, which must not wait for it
+            callers.append(threading.current_thread())
+            released.wait(5)
+            return service_response(200, changes)
+
+        with mock.patch.object(ServiceClient, 'request', request):
+            self.assertFalse(replica.contains('TP00000001'))
+            self.assertFalse(replica.contains('TP00000001'))
+            released.set()
+            replica._refresher.join()
+            self.assertTrue(replica.contains('TP00000001'))
+        self.assertEqual(callers, [replica._refresher])
+        self.assertIsNone(replica.refresh_if_due())
+
+    def test_failed_sync_keeps_missing(self):
+        replica = TripReplica(max_staleness=30)
+        with stub_service_calls({('GET', '/trip_changes/'): (503, {})}):
+            self.assertFalse(replica.contains('TP00000001'))
+            replica._refresher.join()
+            self.assertFalse(replica.contains('TP00000001'))
+        self.assertEqual(replica.stats()['sync_errors'], 1)
+
+
+class CreateIfAbsentConcurrencyTests(TransactionTestCase):
+
+    @skipUnlessDBFeature('test_db_allows_multiple_connections')
+    def test_concurrent_bookings_for_one_trip_create_one_booking(self):
+        # Every thread races to book the same trip with its own ticket
+        workers = 8
+        barrier = threading.Barrier(workers)
+        created = []
+        errors = []
+
+        def insert(number):
+            try:
+                barrier.wait()
+                booking = Booking.objects.create_if_absent(**booking_fields(f'TK{number:08d}', 'TP00000001'))
+                if booking is not None:
+                    created.append(booking.ticket_id)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=insert, args=(number,)) for number in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(created), 1)
+        self.assertEqual(list(Booking.objects.values_list('ticket_id', flat=True)), created)
+
+
+class TripSummaryTests(TestCase):
+
+    def test_totals_follow_booking_writes(self):
+        Booking.objects.create_with_changes(**booking_fields('TK00000001', 'TP00000001'))
+        self.assertIsNone(Booking.objects.create_with_changes(**booking_fields('TK00000002', 'TP00000001')))
+        with self.assertNumQueries(1):
+            summary = self.client.get('/trip_summary/TP00000001/').json()['trip_summary']
+        self.assertEqual(summary, {'trip_id': 'TP00000001', 'booking_count': 1, 'revenue': '250.00'})
+        self.assertEqual(self.client.get('/trip_summary/TP00000002/').json()['trip_summary']['booking_count'], 0)
+
+        Booking.objects.get(ticket_id='TK00000001').delete()
+        summary = TripSummary.objects.get(trip_id='TP00000001')
+        self.assertEqual((summary.booking_count, summary.revenue), (0, 0))
+        call_command('rebuild_trip_summaries', '--verify', stdout=StringIO())
+
+    def test_verify_reports_drift_and_rebuild_fixes_it(self):
+        Booking.objects.create_with_changes(**booking_fields('TK00000001', 'TP00000001'))
+        Booking.objects.create(**booking_fields('TK00000002', 'TP00000002'))
+        out = StringIO()
+        with self.assertRaisesMessage(CommandError, '1 trip summaries differ'):
+            call_command('rebuild_trip_summaries', '--verify', stdout=out)
+        self.assertIn('TP00000002: stored missing', out.getvalue())
+
+        call_command('rebuild_trip_summaries', stdout=StringIO())
+        call_command('rebuild_trip_summaries', '--verify', stdout=StringIO())
+        self.assertEqual([summary['trip_id'] for summary in self.client.get('/trip_summaries/').json()['trip_summaries']],
+                         ['TP00000001', 'TP00000002'])
+
+
+# Nothing listens on port 9, so every delivery attempt fails fast
+@override_settings(TRIP_SERVICE_URL='http://127.0.0.1:9', SERVICE_CLIENT={'RETRIES': 0, 'CONNECT_TIMEOUT': 0.5})
+class OutboxTests(TestCase):
+
+    def test_booking_writes_queue_events(self):
+        Booking.objects.create_with_changes(**booking_fields('TK00000001', 'TP00000001'))
+        self.assertIsNone(Booking.objects.create_with_changes(**booking_fields('TK00000002', 'TP00000001')))
+        Booking.objects.get(ticket_id='TK00000001').delete()
+        events = list(OutboxEvent.objects.order_by('id'))
+        self.assertEqual([event.action for event in events], [OutboxEvent.UPSERTED, OutboxEvent.DELETED])
+        self.assertEqual(events[0].booking, {**booking_fields('TK00000001', 'TP00000001'), 'ticket_cost': '250.00'})
+        self.assertIsNone(events[1].booking)
+
+    def test_failed_delivery_keeps_events_pending(self):
+        Booking.objects.create_with_changes(**booking_fields('TK00000001', 'TP00000001'))
+        with self.assertRaises(requests.RequestException):
+            deliver_pending()
+        event = OutboxEvent.objects.get()
+        self.assertIsNone(event.delivered_at)
+        self.assertEqual(event.attempts, 1)
+
+    def test_replay_queues_every_booking(self):
+        Booking.objects.create(**booking_fields('TK00000001', 'TP00000001'))
+        Booking.objects.create(**booking_fields('TK00000002', 'TP00000002'))
+        self.assertEqual(replay_bookings(batch_size=1), 2)
+        self.assertEqual(list(OutboxEvent.objects.order_by('id').values_list('ticket_id', flat=True)),
+                         ['TK00000001', 'TK00000002'])
+
+
+# Most queries each read may run, whatever the number of bookings it returns
+BOOKING_READ_BUDGETS = {
+    '/booking_listing/': 2,
+    '/booking_listing/?after=': 1,
+    '/booking_listing/?after=&fields=ticket_id,ticket_cost': 1,
+    '/booking_listing/?query=Asha&sort_by=relevance': 2,
+    '/bookings_by_trips/?trip_ids=TP00000001,TP00000002,TP00000003': 1,
+    '/booking_details/TK00000001/': 1,
+    '/booking_export/': 1,
+    '/trip_summary/TP00000001/': 1,
+    '/trip_summaries/': 1,
+}
+
+# Reads that must be answered from an index (substring search only has
+# indexes on Postgres)
+BOOKING_INDEXED_READS = [
+    '/booking_listing/',
+    '/booking_listing/?after=',
+    '/bookings_by_trips/?trip_ids=TP00000001,TP00000002,TP00000003',
+    '/booking_details/TK00000001/',
+    '/booking_export/',
+    '/trip_summary/TP00000001/',
+    '/trip_summaries/?after=',
+]
+
+# What the stubbed trip service answers
+TRIP_SERVICE_ANSWERS = {
+    ('GET', '/trip_details/TP00000001/'): (200, {'trip': {'trip_id': 'TP00000001', 'route': {'route_id': 'RT00000001'}}}),
+    ('GET', '/trip_details/TP00000006/'): (200, {'trip': {'trip_id': 'TP00000006'}}),
+    ('POST', '/trip_lookup/'): (200, {'trip_ids': [f'TP{number:08d}' for number in range(10, 40)]}),
+}
+
+
+# The trip service is stubbed, and the trip replica off so add_booking asks it
+@override_settings(TRIP_REPLICA={'ENABLED': False})
+class BookingQueryBudgetTests(QueryBudgetMixin, TestCase):
+
+    def setUp(self):
+        for number in range(1, 6):
+            Booking.objects.create_with_changes(**booking_fields(f'TK{number:08d}', f'TP{number:08d}'))
+
+    def post_json(self, path, data):
+        return self.client.post(path, json.dumps(data), content_type='application/json')
+
+    def test_reads_stay_within_their_query_budgets(self):
+        with stub_service_calls(TRIP_SERVICE_ANSWERS) as calls:
+            for path, budget in BOOKING_READ_BUDGETS.items():
+                with self.subTest(path=path):
+                    with self.assertMaxQueries(budget):
+                        response = self.get_all(path)
+                    self.assertEqual(response.status_code, 200)
+        self.assertEqual(calls, [('GET', '/trip_details/TP00000001/')])
+
+    def test_writes_do_not_grow_with_the_batch(self):
+        with stub_service_calls(TRIP_SERVICE_ANSWERS):
+            # The duplicate pre-check before the trip service call is the sixth
+            with self.assertMaxQueries(6):
+                response = self.post_json('/add_booking/', booking_fields('TK00000006', 'TP00000006'))
+            self.assertEqual(response.status_code, 200)
+            for first, last in [(10, 12), (20, 39)]:
+                bookings = [booking_fields(f'TK{number:08d}', f'TP{number:08d}') for number in range(first, last + 1)]
+                with self.assertMaxQueries(6):
+                    response = self.post_json('/bulk_add_bookings/', bookings)
+                self.assertEqual(response.json()['created'], len(bookings))
+
+    def test_reads_use_indexes(self):
+        with stub_service_calls(TRIP_SERVICE_ANSWERS):
+            for path in BOOKING_INDEXED_READS:
+                with self.subTest(path=path):
+                    with CaptureQueriesContext(connection) as captured:
+                        self.get_all(path)
+                    self.assertIndexScans(captured)
+
+
+class BookingListingCursorTests(TestCase):
+
+    def setUp(self):
+        for number in range(1, 13):
+            Booking.objects.create_with_changes(**booking_fields(f'TK{number:08d}', f'TP{number:08d}'))
+
+    def test_next_cursor_continues_the_listing(self):
+        first = self.client.get('/booking_listing/?sort_by=ticket_cost&after=').json()
+        second = self.client.get(f"/booking_listing/?sort_by=ticket_cost&after={first['next_cursor']}").json()
+        self.assertEqual(len(first['bookings']) + len(second['bookings']), 12)
+        self.assertFalse(second['has_next'])
+
+    def test_tampered_cursor_is_a_bad_request(self):
+        for value in ['abc', {'a': 1}, [1], None]:
+            with self.subTest(value=value):
+                cursor = encode_cursor('ticket_cost', value, 'TK00000001')
+                response = self.client.get(f'/booking_listing/?sort_by=ticket_cost&after={cursor}')
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {'error': 'Invalid cursor'})
+
+
+@override_settings(ROOT_URLCONF='Booking_service.async_urls', TRIP_REPLICA={'ENABLED': False})
+class BookingAsyncViewsTests(AsyncViewsMixin, TestCase):
+
+    def setUp(self):
+        for number in range(1, 13):
+            Booking.objects.create_with_changes(**booking_fields(f'TK{number:08d}', f'TP{number:08d}'))
+
+    def test_add_booking(self):
+        answers = {('GET', f'/trip_details/TP000000{number}/'): (200, {'trip': {'trip_id': f'TP000000{number}'}})
+                   for number in (20, 21)}
+        with stub_service_calls(answers):
+            sync_response, async_response = self.send_both(
+                'post', '/add_booking/', booking_fields('TK00000020', 'TP00000020'),
+                async_data=booking_fields('TK00000021', 'TP00000021'), content_type='application/json')
+        self.assertEqual(sync_response.json(), {'message': 'Booking added successfully', 'ticket_id': 'TK00000020'})
+        self.assertEqual(async_response.json(), {'message': 'Booking added successfully', 'ticket_id': 'TK00000021'})
+        self.assertEqual(Booking.objects.get(ticket_id='TK00000021').trip_id, 'TP00000021')
+
+    def test_add_booking_errors(self):
+        answers = {('GET', '/trip_details/TP00000030/'): (404, {'error': 'Trip not found'}),
+                   ('GET', '/trip_details/TP00000031/'): (200, {'trip': {'trip_id': 'TP00000032'}})}
+        cases = [booking_fields('TK00000001', 'TP00000020'),  # ticket_id taken
+                 booking_fields('TK00000020', 'TP00000001'),  # trip already booked
+                 booking_fields('TK00000020', 'TP00000030'),
+                 booking_fields('TK00000020', 'TP00000031'),
+                 booking_fields('TK1', 'TP00000020')]
+        with stub_service_calls(answers):
+            for data in cases:
+                with self.subTest(data=data):
+                    self.assertBothAnswer('post', '/add_booking/', data, status=400, content_type='application/json')
+
+    def test_booking_listing_pages(self):
+        for path in ['/booking_listing/', '/booking_listing/?page=2', '/booking_listing/?page=9',
+                     '/booking_listing/?sort_by=traveller_name&fields=ticket_id,ticket_cost']:
+            with self.subTest(path=path):
+                self.assertBothAnswer('get', path)
+
+    def test_booking_listing_cursor(self):
+        first = self.assertBothAnswer('get', '/booking_listing/?sort_by=ticket_cost&after=')
+        second = self.assertBothAnswer('get', f"/booking_listing/?sort_by=ticket_cost&after={first['next_cursor']}")
+        self.assertEqual(len(first['bookings']) + len(second['bookings']), 12)
+        self.assertFalse(second['has_next'])
+        self.assertBothAnswer('get', '/booking_listing/?after=abc', status=400)
+
+    def test_bad_fields(self):
+        for path in ['/booking_listing/?fields=ticket_id,nope', '/booking_details/TK00000001/?fields=nope']:
+            with self.subTest(path=path):
+                self.assertBothAnswer('get', path, status=400)
+
+    def test_bookings_by_trips(self):
+        data = self.assertBothAnswer('get', '/bookings_by_trips/?trip_ids=TP00000001,TP00000099')
+        self.assertEqual(len(data['bookings']['TP00000001']), 1)
+        self.assertBothAnswer('get', '/bookings_by_trips/?trip_ids=', status=400)
+
+    def test_booking_details(self):
+        with stub_service_calls(TRIP_SERVICE_ANSWERS):
+            data = self.assertBothAnswer('get', '/booking_details/TK00000001/')
+            self.assertBothAnswer('get', '/booking_details/TK00000001/?fields=ticket_id,trip')
+        self.assertEqual(data['route']['route_id'], 'RT00000001')
+        self.assertBothAnswer('get', '/booking_details/TK00000099/', status=404)
+
+
+@override_settings(TRIP_REPLICA={'ENABLED': False})
+class BookingBulkIngestTests(TestCase):
+
+    def setUp(self):
+        self.rows = [booking_fields(f'TK{number:08d}', f'TP{number:08d}') for number in range(10, 14)]
+        self.rows[1]['ticket_cost'] = 'abc'
+        self.rows[3]['ticket_cost'] = 123456789
+
+    def test_bad_cost_fails_only_its_row(self):
+        with stub_service_calls(TRIP_SERVICE_ANSWERS):
+            response = self.client.post('/bulk_add_bookings/', json.dumps(self.rows), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([result['status'] for result in results], ['created', 'error', 'created', 'error'])
+        message = 'ticket_cost must be a number with at most 10 digits, 2 of them after the point'
+        self.assertEqual({result['error'] for result in results if result['status'] == 'error'}, {message})
+        self.assertEqual(sorted(Booking.objects.values_list('ticket_id', flat=True)), ['TK00000010', 'TK00000012'])
+
+    def test_add_booking_rejects_a_bad_cost_before_asking_the_trip_service(self):
+        with stub_service_calls({}) as calls:
+            response = self.client.post('/add_booking/', json.dumps(self.rows[1]), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(calls, [])
+
+
+@override_settings(TRIP_REPLICA={'ENABLED': False})
+class BulkLoadCommandTests(TestCase):
+    # The COPY loader on Postgres, the ingest functions elsewhere, with the same results
+
+    def load(self, rows, answers):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'bookings.ndjson')
+        with open(path, 'w') as f:
+            f.write(''.join(json.dumps(row) + '\n' for row in rows))
+        with stub_service_calls(answers):
+            call_command('bulk_load', 'bookings', path, '--rejects', path + '.rejects', '--batch-size', '2',
+                         stdout=StringIO())
+        with open(path + '.rejects') as f:
+            return [(reject['row'], reject['error']) for reject in map(json.loads, f)]
+
+    def test_bookings_are_checked_like_the_bulk_endpoint(self):
+        rejects = self.load([
+            booking_fields('TK00000010', 'TP00000010'),
+            booking_fields('TK00000011', 'TP00000010'),
+            booking_fields('TK00000012', 'TP00000099'),
+            booking_fields('TK00000010', 'TP00000011'),
+            {'ticket_id': 'TK00000013', 'trip_id': 'TP00000013'},
+            {**booking_fields('TK00000014', 'TP00000012'), 'ticket_cost': 99.5},
+        ], TRIP_SERVICE_ANSWERS)
+        self.assertEqual(rejects, [
+            (2, 'Trip ID already exists'),
+            (3, 'Invalid trip_id or trip does not exist'),
+            (4, 'Provided ticket_id already exists or does not follow the format'),
+            (5, 'Missing required field(s): traveller_name, traveller_number, ticket_cost, traveller_email'),
+        ])
+        self.assertEqual(sorted(TripSummary.objects.values_list('trip_id', 'booking_count', 'revenue')),
+                         [('TP00000010', 1, Decimal('250.00')), ('TP00000012', 1, Decimal('99.50'))])
+        events = OutboxEvent.objects.order_by('id')
+        self.assertEqual([event.booking['ticket_cost'] for event in events], ['250.00', '99.50'])
+        self.assertEqual(events[1].message()['booking'], {
+            **booking_fields('TK00000014', 'TP00000012'), 'ticket_cost': '99.50'})
+
+    def test_trip_service_down(self):
+        rejects = self.load([booking_fields('TK00000010', 'TP00000010')],
+                            {('POST', '/trip_lookup/'): (503, {'error': 'unavailable'})})
+        self.assertEqual(rejects, [(1, 'Could not verify trip_id with the trip service')])
+        self.assertFalse(Booking.objects.exists())
+
+
+def metric_value(text, sample):
+    # The value of one sample line of /metrics, 0 when it is not there yet
+    for line in text.splitlines():
+        if line.startswith(sample + ' '):
+            return float(line.rsplit(' ', 1)[1])
+    return 0
+
+
+class MetricsTests(TestCase):
+
+    def test_booking_details_time_is_split_between_db_and_trip_service(self):
+        Booking.objects.create_with_changes(**booking_fields('TK00000001', 'TP00000001'))
+        target = 'target="http://127.0.0.1:8000",method="GET"'
+        samples = [
+            'http_request_duration_seconds_count{view="booking_details",method="GET",status="200"}',
+            'http_request_db_queries_total{view="booking_details"}',
+            'http_request_db_duration_seconds_count{view="booking_details"}',
+            'http_request_outbound_duration_seconds_count{view="booking_details"}',
+            'outbound_requests_total{' + target + ',status="200"}',
+            'outbound_request_duration_seconds_bucket{' + target + ',le="+Inf"}',
+        ]
+        before = self.client.get('/metrics').content.decode()
+
+        trip = service_response(200, {'trip': {'trip_id': 'TP00000001', 'route': {'route_id': 'RT00000001'}}})
+        with override_settings(TRIP_SERVICE_URL='http://127.0.0.1:8000'), \
+                mock.patch('requests.Session.request', return_value=trip):
+            self.assertEqual(self.client.get('/booking_details/TK00000001/').status_code, 200)
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        after = response.content.decode()
+        self.assertEqual([metric_value(after, sample) - metric_value(before, sample) for sample in samples],
+                         [1, 1, 1, 1, 1, 1])
+        self.assertIn('# TYPE http_request_duration_seconds histogram', after)
+
+
+class TracingTests(TestCase):
+
+    def test_trip_service_calls_carry_the_trace(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        Booking.objects.create_with_changes(**booking_fields('TK00000001', 'TP00000001'))
+        trip = service_response(200, {'trip': {'trip_id': 'TP00000001'}})
+        tracing = {'ENABLED': True, 'DIRECTORY': directory.name, 'SERVICE_NAME': 'booking'}
+        with override_settings(TRACING=tracing, TRIP_SERVICE_URL='http://127.0.0.1:8000'), \
+                mock.patch('requests.Session.request', return_value=trip) as request:
+            trace_id = self.client.get('/booking_details/TK00000001/')['X-Request-ID']
+
+        spans = read_spans(directory.name, trace_id)
+        server = next(span for span in spans if span['kind'] == 'server')
+        call = next(span for span in spans if span['kind'] == 'client')
+        self.assertEqual(request.call_args.kwargs['headers']['traceparent'], f'00-{trace_id}-{call["span_id"]}-01')
+        self.assertEqual((call['parent_id'], call['attributes']['url'], call['attributes']['status']),
+                         (server['span_id'], 'http://127.0.0.1:8000/trip_details/TP00000001/', '200'))
@@ -0,0 +1,185 @@
+import heapq
+import re
+import threading
+import time
+from array import array
+from bisect import bisect_left
+import requests
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from Booking_service.service_client import get_service_client
+
+DEFAULTS = {
+    'ENABLED': True,
+    'MAX_STALENESS': 30,
+    'PAGE_SIZE': 5000,
+    'RESYNC_OVERLAP': 1000,
+}
+
+TRIP_ID_PATTERN = re.compile(r'^TP(\d{8})$')
+
+
+class TripReplica:
+    """
+    Local copy of the trip ids known to the trip service.
+
+    The ids are kept as their 8 digit numbers in a sorted array (4 bytes
+    each, binary searched), plus a small set of ids added since the array
+    was last rebuilt. The copy is brought up to date from the trip service
+    change feed (/trip_changes/) by a background thread, started by the
+    first lookup that finds it half way to max_staleness seconds old, so
+    under steady traffic it is refreshed before it goes stale and no
+    request ever waits for a sync. While it is cold or stale the replica
+    answers every lookup with a miss, so a hit is never staler than that.
+
+    Only a hit is authoritative: a trip missing here may just be newer than
+    the last sync, so callers fall back to asking the trip service.
+    """
+
+    def __init__(self, max_staleness=30, page_size=5000, resync_overlap=1000, compact_at=10000):
+        self.max_staleness = max_staleness
+        self.page_size = page_size
+        self.resync_overlap = resync_overlap
+        self.compact_at = compact_at
+        self._ids = array('I')
+        self._recent = set()
+        self._last_seq = 0
+        self._synced_at = None
+        self._attempted_at = None
+        self._sync_lock = threading.Lock()
+        self._refresher = None
+        self.hits = self.misses = self.syncs = self.sync_errors = 0
+
+    def _contains(self, number):
+        if number in self._recent:
+            return True
+        ids = self._ids
+        position = bisect_left(ids, number)
+        return position < len(ids) and ids[position] == number
+
+    def contains(self, trip_id):
+        """
+        True when trip_id is known to exist, False when the trip service has
+        to be asked. Never syncs in the caller's thread, cheap enough to call
+        from async code.
+        """
+        match = TRIP_ID_PATTERN.match(trip_id) if isinstance(trip_id, str) else None
+        if match is None:
+            return False
+        self.refresh_if_due()
+        if not self.stale() and self._contains(int(match.group(1))):
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def stale(self):
+        return self._synced_at is None or time.monotonic() - self._synced_at > self.max_staleness
+
+    def refresh_if_due(self):
+        """
+        Start a sync in a background thread when the last one was attempted
+        more than half of max_staleness ago, so a failed sync is retried
+        that much later. Returns the thread, or None when none was due.
+        """
+        if self._attempted_at is not None and time.monotonic() - self._attempted_at <= self.max_staleness / 2:
+            return None
+        if self._sync_lock.locked():
+            return None
+        # Claimed here, so the requests arriving while the thread starts do not start their own
+        self._attempted_at = time.monotonic()
+        self._refresher = threading.Thread(target=self.sync, name='trip-replica-sync', daemon=True)
+        self._refresher.start()
+        return self._refresher
+
+    def sync(self, blocking=False):
+        """
+        Apply the changes since the last sync, returning False when another
+        thread is already syncing (blocking=False) or the feed is unreachable.
+        """
+        if not self._sync_lock.acquire(blocking=blocking):
+            return False
+        self._attempted_at = time.monotonic()
+        try:
+            # Feed entries can commit out of sequence order, so read back over
+            # the last resync_overlap entries as well. Replaying them is harmless.
+            after = max(0, self._last_seq - self.resync_overlap) if self._synced_at is not None else 0
+            trip_service = get_service_client('TRIP_SERVICE_URL')
+            added = set()
+            removed = set()
+            while True:
+                response = trip_service.get('/trip_changes/', params={'after': after, 'limit': self.page_size})
+                response.raise_for_status()
+                page = response.json()
+                for change in page['changes']:
+                    match = TRIP_ID_PATTERN.match(change['trip_id'])
+                    if match is None:
+                        continue
+                    number = int(match.group(1))
+                    if change['action'] == 'deleted':
+                        added.discard(number)
+                        removed.add(number)
+                    else:
+                        removed.discard(number)
+                        added.add(number)
+                after = page['last_seq']
+                if not page['has_more']:
+                    break
+        except (requests.RequestException, ValueError, KeyError):
+            self.sync_errors += 1
+            return False
+        else:
+            self._apply(added, removed)
+            self._last_seq = max(self._last_seq, after)
+            self._synced_at = time.monotonic()
+            self.syncs += 1
+            return True
+        finally:
+            self._sync_lock.release()
+
+    def _apply(self, added, removed):
+        added = {number for number in added if not self._contains(number)}
+        if any(self._contains(number) for number in removed) or len(self._recent) + len(added) > self.compact_at:
+            # Rebuild the array, it is swapped in whole so readers never see a partial one
+            merged = heapq.merge(self._ids, sorted(self._recent | added))
+            self._ids = array('I', (number for number in merged if number not in removed))
+            self._recent = set()
+        else:
+            self._recent = (self._recent | added) - removed
+
+    def stats(self):
+        return {
+            'entries': len(self._ids) + len(self._recent),
+            'last_seq': self._last_seq,
+            'age_seconds': None if self._synced_at is None else round(time.monotonic() - self._synced_at, 1),
+            'max_staleness': self.max_staleness,
+            'hits': self.hits,
+            'misses': self.misses,
+            'syncs': self.syncs,
+            'sync_errors': self.sync_errors,
+        }
+
+
+_replica = None
+_replica_lock = threading.Lock()
+
+
+def get_trip_replica():
+    """Return the process wide replica, or None when TRIP_REPLICA['ENABLED'] is off."""
+    global _replica
+    options = {**DEFAULTS, **getattr(settings, 'TRIP_REPLICA', {})}
+    if not options['ENABLED']:
+        return None
+    if _replica is None:
+        with _replica_lock:
+            if _replica is None:
+                _replica = TripReplica(options['MAX_STALENESS'], options['PAGE_SIZE'], options['RESYNC_OVERLAP'])
+    return _replica
+
+
+@receiver(setting_changed)
+def reset_trip_replica(setting=None, **kwargs):
+    global _replica
+    if setting in (None, 'TRIP_REPLICA', 'TRIP_SERVICE_URL'):
+        _replica = None
@@ -1,8 +1,25 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
-urlpatterns = [
-    path('add_booking/', views.add_booking, name='add_booking'),
-    path('booking_listing/', views.booking_listing, name='booking_listing'),
-    path('booking_details/<str:ticket_id>/', views.booking_details, name='booking_details'),
-]
+
+def core_urlpatterns(core_views):
+    """The app's URL patterns, with its core views taken from core_views (views or async_views)."""
+    return [
+        path('add_booking/', core_views.add_booking, name='add_booking'),
+        path('bulk_add_bookings/', views.bulk_add_bookings, name='bulk_add_bookings'),
+        path('booking_listing/', core_views.booking_listing, name='booking_listing'),
+        path('bookings_by_trips/', core_views.bookings_by_trips, name='bookings_by_trips'),
+        path('booking_details/<str:ticket_id>/', core_views.booking_details, name='booking_details'),
+        path('booking_export/', views.booking_export, name='booking_export'),
+        path('trip_summary/<str:trip_id>/', views.trip_summary, name='trip_summary'),
+        path('trip_summaries/', views.trip_summaries, name='trip_summaries'),
+    ]
+
+
+# Pick the async variants of the core views when the deployment runs under ASGI
+core_views = views
+if settings.ASYNC_VIEWS:
+    from . import async_views as core_views
+
+urlpatterns = core_urlpatterns(core_views)
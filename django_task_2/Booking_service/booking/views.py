@@ -1,14 +1,71 @@
 import requests
 import json
-import re
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.core.validators import validate_email
 from django.core.exceptions import ValidationError
-from .models import Booking
+from .models import Booking, TripSummary
+from .ingest import validate_booking, ingest_bookings
+from .trip_replica import get_trip_replica
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.views.decorators.csrf import csrf_exempt
 from django.db import IntegrityError
 from django.db.models import Q
+from Booking_service.pagination import keyset_page, InvalidCursor
+from Booking_service.search import get_search_backend
+from Booking_service.ndjson import parse_lines, result_lines
+from Booking_service.service_client import get_service_client
+from Booking_service.export import export_response, EXPORT_CHUNK_SIZE
+from jobs.queue import enqueue, job_accepted, upload_lines
+from Booking_service.serializers import Serializer, InvalidFields, api_response, loads, pick, requested_fields
+
+# Columns matched by the ?query= search, ticket_cost is matched as a number
+BOOKING_SEARCH_FIELDS = ['traveller_name', 'ticket_id', 'traveller_number', 'traveller_email', 'trip_id']
+
+BOOKING_SERIALIZER = Serializer(['ticket_id', 'trip_id', 'traveller_name', 'traveller_number', 'ticket_cost',
+                                 'traveller_email'])
+
+# Names accepted by booking_details' ?fields=, trip and route come from the trip service
+BOOKING_DETAILS_FIELDS = BOOKING_SERIALIZER.keys + ('trip', 'route')
+
+
+def booking_columns(fields, keyset_sort):
+    """values() columns for ?fields=, all of them when fields is None."""
+    if fields is None:
+        return ()
+    wanted = fields | {keyset_sort, 'ticket_id'}
+    return [name for name in BOOKING_SERIALIZER.keys if name in wanted]
+
+
+def booking_details_data(booking, trip_data, route_data, fields):
+    # booking_details answer narrowed to ?fields=, fields is None keeps everything
+    data = {"booking": pick(BOOKING_SERIALIZER.serialize(booking), fields)}
+    if fields is None or 'trip' in fields:
+        data["trip"] = trip_data
+    if fields is None or 'route' in fields:
+        data["route"] = route_data
+    return data
+
+def add_booking_conflict(trip_id):
+    """Explain why create_if_absent() inserted nothing, only queried on that path."""
+    if Booking.objects.filter(trip_id=trip_id).exists():
+        return 'Trip ID already exists'
+    return 'Provided ticket_id already exists or does not follow the format'
+
+
+def existing_booking_error(ticket_id, trip_id):
+    """
+    The error for a booking whose trip or ticket_id is already taken, None
+    otherwise, in one query. Checked before the trip service is asked, so a
+    duplicate costs no remote call; create_with_changes() still decides races.
+    """
+    booked_trip_ids = list(Booking.objects.filter(Q(ticket_id=ticket_id) | Q(trip_id=trip_id))
+                           .values_list('trip_id', flat=True)[:2])
+    if not booked_trip_ids:
+        return None
+    if trip_id in booked_trip_ids:
+        return 'Trip ID already exists'
+    return 'Provided ticket_id already exists or does not follow the format'
+
 
 @csrf_exempt
 def add_booking(request):
@@ -21,45 +78,35 @@ def add_booking(request):
 
             
             # Validate input data
-            required_fields = ['ticket_id', 'traveller_name', 'traveller_number', 'ticket_cost', 'traveller_email', 'trip_id']
-            missing_fields = [field for field in required_fields if field not in received_data]
-            if missing_fields:
-                return JsonResponse({'error': f'Missing required field(s): {", ".join(missing_fields)}'}, status=400)
-            
-            # Validate ticket_id format
-            if not re.match(r'^TK\d{8}$', received_data['ticket_id']):
-                return JsonResponse({'error': 'Invalid ticket_id format. It should start with TK followed by 8 digits'}, status=400)
-            
-            # Validate trip_id format
-            if not re.match(r'^TP\d{8}$', received_data['trip_id']):
-                return JsonResponse({'error': 'Invalid trip_id format. It should start with TP followed by 8 digits'}, status=400)
-            
-            # Validate traveller_number format
-            if not re.match(r'^\d{10}$', received_data['traveller_number']):
-                return JsonResponse({'error': 'Invalid traveller_number format. It should be a 10-digit number'}, status=400)
-            
-            # Validate traveller_email format
-            if not re.match(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$', received_data['traveller_email']):
-                return JsonResponse({'error': 'Invalid traveller_email format'}, status=400)
-            
-            # Check if the trip_id already exists in the database
-            if Booking.objects.filter(trip_id=received_data['trip_id']).exists():
-                return JsonResponse({'error': 'Trip ID already exists'}, status=400)
-            
-            # Fetch trip details to validate if the trip_id exists
-            trip_service_url = f'http://localhost:8000/trip_details/{received_data["trip_id"]}/'
-            trip_response = requests.get(trip_service_url)
+            error = validate_booking(received_data)
+            if error:
+                return JsonResponse({'error': error}, status=400)
+
+            error = existing_booking_error(received_data['ticket_id'], received_data['trip_id'])
+            if error:
+                return JsonResponse({'error': error}, status=400)
             
-            if trip_response.status_code == 200:
-                trip_data = trip_response.json()
-                trip_id = trip_data.get('trip', {}).get('trip_id')
-                if trip_id != received_data['trip_id']:
-                    return JsonResponse({'error': 'Provided trip_id does not match the trip_id from the trip service'}, status=400)
-            else:
-                return JsonResponse({'error': 'Invalid trip_id or trip does not exist'}, status=400)
+            # Validate that the trip exists, from the local replica when it
+            # knows the trip and from the trip service otherwise
+            trip_replica = get_trip_replica()
+            if trip_replica is None or not trip_replica.contains(received_data['trip_id']):
+                try:
+                    trip_response = get_service_client('TRIP_SERVICE_URL').get(f'/trip_details/{received_data["trip_id"]}/')
+                except requests.RequestException:
+                    return JsonResponse({'error': 'Could not verify trip_id with the trip service'}, status=503)
+
+                if trip_response.status_code == 200:
+                    trip_data = trip_response.json()
+                    trip_id = trip_data.get('trip', {}).get('trip_id')
+                    if trip_id != received_data['trip_id']:
+                        return JsonResponse({'error': 'Provided trip_id does not match the trip_id from the trip service'}, status=400)
+                else:
+                    return JsonResponse({'error': 'Invalid trip_id or trip does not exist'}, status=400)
             
-            # Add booking to the database
-            booking = Booking.objects.create(
+            # Add booking to the database, the insert itself checks that
+            # neither the ticket_id nor the trip is already booked, and the
+            # trip's totals are updated along with it
+            booking = Booking.objects.create_with_changes(
                 ticket_id=received_data['ticket_id'],
                 trip_id=received_data['trip_id'],
                 traveller_name=received_data['traveller_name'],
@@ -67,6 +114,8 @@ def add_booking(request):
                 ticket_cost=received_data['ticket_cost'],
                 traveller_email=received_data['traveller_email']
             )
+            if booking is None:
+                return JsonResponse({'error': add_booking_conflict(received_data['trip_id'])}, status=400)
             
             return JsonResponse({'message': 'Booking added successfully', 'ticket_id': booking.ticket_id}, status=200)
         
@@ -86,26 +135,75 @@ def add_booking(request):
         return JsonResponse({'error': 'Invalid HTTP method'}, status=405)
 
 
+@csrf_exempt
+def bulk_add_bookings(request):
+    if request.method == 'POST':
+        # ?background=1 queues the rows for manage.py run_jobs and answers 202
+        # at once, progress is polled from the returned status_url
+        if request.GET.get('background'):
+            try:
+                job = enqueue('import_bookings', upload_lines(request))
+            except ValueError as e:
+                return JsonResponse({'error': str(e)}, status=400)
+            return JsonResponse(job_accepted(job), status=202)
+
+        # NDJSON bodies are read line by line and answered with a stream of per ticket results
+        if request.content_type == 'application/x-ndjson':
+            results = ingest_bookings(parse_lines(request))
+            return StreamingHttpResponse(result_lines(results), content_type='application/x-ndjson')
+
+        try:
+            rows = json.loads(request.body)
+        except json.JSONDecodeError:
+            return JsonResponse({'error': 'Invalid JSON data'}, status=400)
+        if not isinstance(rows, list):
+            return JsonResponse({'error': 'Expected a JSON array of bookings'}, status=400)
+
+        results = list(ingest_bookings(rows))
+        created = sum(1 for result in results if result['status'] == 'created')
+        return JsonResponse({'created': created, 'failed': len(results) - created, 'results': results})
+    else:
+        return JsonResponse({'error': 'Invalid HTTP method'}, status=405)
+
 
 @csrf_exempt
 def booking_listing(request):
     if request.method == 'GET':
+        try:
+            fields = requested_fields(request, BOOKING_SERIALIZER.keys)
+        except InvalidFields as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        # In ticket_id order unless sorted otherwise
+        bookings = Booking.objects.order_by('ticket_id')
+
         # Sorting
+        sort_fields = ['ticket_id', 'traveller_name', 'ticket_cost', 'traveller_number', 'traveller_email', 'trip_id']
         sort_by = request.GET.get('sort_by', 'ticket_id')  # Default sort by ticket_id
-        if sort_by in ['ticket_id', 'traveller_name', 'ticket_cost', 'traveller_number', 'traveller_email', 'trip_id']:
-            bookings = Booking.objects.all().order_by(sort_by)
+        if sort_by in sort_fields:
+            bookings = bookings.order_by(sort_by)
 
-        # Searching used Q for complex query searches with logical or
+        # Searching through the configured search backend
         query = request.GET.get('query')
+        search = get_search_backend()
         if query:
-            bookings = bookings.filter(
-                Q(traveller_name__icontains=query) |
-                Q(ticket_id__icontains=query) |
-                Q(ticket_cost__icontains=query) |
-                Q(traveller_number__icontains=query) |
-                Q(traveller_email__icontains=query) |
-                Q(trip_id__icontains=query)
-            )
+            bookings = bookings.filter(search.q(query, BOOKING_SEARCH_FIELDS, numeric_fields=['ticket_cost']))
+            if sort_by == 'relevance':
+                bookings = search.rank(bookings, query, BOOKING_SEARCH_FIELDS)
+
+        # Select only the requested columns, plus the ones the cursor is read from
+        keyset_sort = sort_by if sort_by in sort_fields else 'ticket_id'
+        bookings = bookings.values(*booking_columns(fields, keyset_sort))
+
+        # Keyset pagination when a cursor is given (?after=<cursor>, empty for the first page)
+        if 'after' in request.GET:
+            try:
+                bookings, has_next, next_cursor = keyset_page(bookings, keyset_sort, request.GET['after'], 10)
+            except InvalidCursor as e:
+                return JsonResponse({'error': str(e)}, status=400)
+            data = {"bookings": [pick(booking, fields) for booking in bookings],
+                    "has_next": has_next, "next_cursor": next_cursor}
+            return api_response(request, data)
 
         # Pagination
         paginator = Paginator(bookings, 10)  # Show 10 bookings per page
@@ -121,8 +219,27 @@ def booking_listing(request):
         except EmptyPage:
             bookings = paginator.page(paginator.num_pages)
 
-        data = {"bookings": list(bookings.object_list.values())}
-        return JsonResponse(data)
+        data = {"bookings": [pick(booking, fields) for booking in bookings.object_list]}
+        return api_response(request, data)
+    else:
+        return HttpResponse(status=405)
+
+
+@csrf_exempt
+def bookings_by_trips(request):
+    if request.method == 'GET':
+        # Comma separated list of trip ids, e.g. ?trip_ids=TP00000001,TP00000002
+        trip_ids = [trip_id.strip() for trip_id in request.GET.get('trip_ids', '').split(',') if trip_id.strip()]
+        if not trip_ids:
+            return JsonResponse({'error': 'trip_ids is required and cannot be blank'}, status=400)
+        if len(trip_ids) > 100:
+            return JsonResponse({'error': 'At most 100 trip_ids can be requested at once'}, status=400)
+
+        # Exact match on the indexed trip_id column, grouped by trip
+        data = {"bookings": {trip_id: [] for trip_id in trip_ids}}
+        for booking in Booking.objects.filter(trip_id__in=trip_ids).order_by('ticket_id').values():
+            data["bookings"][booking['trip_id']].append(booking)
+        return api_response(request, data)
     else:
         return HttpResponse(status=405)
 
@@ -131,50 +248,85 @@ def booking_listing(request):
 @csrf_exempt
 def booking_details(request, ticket_id):
     if request.method == 'GET':
+        try:
+            fields = requested_fields(request, BOOKING_DETAILS_FIELDS)
+        except InvalidFields as e:
+            return JsonResponse({'error': str(e)}, status=400)
         try:
             # Fetch booking details
             booking = Booking.objects.get(ticket_id=ticket_id)
             
-            # Fetch trip details using the trip_id from the booking
+            # Fetch the trip with its route embedded in a single call. The trip
+            # and route are optional in the answer, leave them empty when the
+            # trip service cannot be reached or neither was asked for
             trip_id = booking.trip_id
-            trip_details_url = f'http://127.0.0.1:8000/trip_details/{trip_id}/'
-            trip_response = requests.get(trip_details_url)
+            trip_response = None
+            if fields is None or 'trip' in fields or 'route' in fields:
+                try:
+                    trip_response = get_service_client('TRIP_SERVICE_URL').get(f'/trip_details/{trip_id}/',
+                                                                               params={'expand': 'route'})
+                except requests.RequestException:
+                    pass
             
-            if trip_response.status_code == 200:
-                trip_data = trip_response.json().get('trip', {})
-                route_id = trip_data.get('route_id')  # Get route_id from trip data
-                print("Trip Data:", trip_data)  # Debugging: Print trip data
-                print("Route ID:", route_id)  # Debugging: Print route id
+            if trip_response is not None and trip_response.status_code == 200:
+                trip_data = loads(trip_response.content).get('trip', {})
+                route_data = trip_data.pop('route', {})
             else:
                 trip_data = {}
-                route_id = None
-            
-            if route_id:
-                # Fetch route details using the route_id from the trip data
-                route_details_url = f'http://127.0.0.1:8000/route_details/{route_id}/'
-                route_response = requests.get(route_details_url)
-                
-                if route_response.status_code == 200:
-                    route_data = route_response.json().get('route', {})
-                else:
-                    route_data = {}
-            else:
                 route_data = {}
             
-            data = {
-                "booking": {
-                    "ticket_id": booking.ticket_id,
-                    "trip_id": booking.trip_id,
-                    "traveller_name": booking.traveller_name,
-                    "traveller_number": booking.traveller_number,
-                    "ticket_cost": booking.ticket_cost,
-                    "traveller_email": booking.traveller_email
-                },
-                "trip": trip_data,  # Include trip details fetched from the endpoint
-                "route": route_data  # Include route details fetched from the endpoint
-            }
-            return JsonResponse(data)
+            return api_response(request, booking_details_data(booking, trip_data, route_data, fields))
         except Booking.DoesNotExist:
             return JsonResponse({'error': 'Booking not found'}, status=404)
     else:
         return HttpResponse(status=405)
+
+
+BOOKING_EXPORT_COLUMNS = ['ticket_id', 'trip_id', 'traveller_name', 'traveller_number', 'ticket_cost', 'traveller_email']
+
+
+@csrf_exempt
+def booking_export(request):
+    if request.method == 'GET':
+        # The whole table, or the ?query= matches, streamed in ticket_id order
+        bookings = Booking.objects.all()
+        query = request.GET.get('query')
+        if query:
+            bookings = bookings.filter(get_search_backend().q(query, BOOKING_SEARCH_FIELDS, numeric_fields=['ticket_cost']))
+        rows = bookings.order_by('ticket_id').values(*BOOKING_EXPORT_COLUMNS).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        return export_response(request, rows, BOOKING_EXPORT_COLUMNS, 'bookings')
+    else:
+        return HttpResponse(status=405)
+
+
+TRIP_SUMMARY_SERIALIZER = Serializer(['trip_id', 'booking_count', 'revenue'])
+
+
+@csrf_exempt
+def trip_summary(request, trip_id):
+    if request.method == 'GET':
+        # One primary key lookup, the totals are maintained as bookings are
+        # written. A trip without bookings has no row and reads as zeros.
+        summary = TripSummary.objects.filter(trip_id=trip_id).first() or TripSummary(trip_id=trip_id)
+        return api_response(request, {'trip_summary': TRIP_SUMMARY_SERIALIZER.serialize(summary)})
+    else:
+        return HttpResponse(status=405)
+
+
+@csrf_exempt
+def trip_summaries(request):
+    if request.method == 'GET':
+        # The totals of every booked trip, paged on trip_id (?after=<cursor>)
+        try:
+            summaries, has_next, next_cursor = keyset_page(
+                TripSummary.objects.all(), 'trip_id', request.GET.get('after'), 10)
+        except InvalidCursor as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        data = {
+            'trip_summaries': TRIP_SUMMARY_SERIALIZER.serialize_many(summaries),
+            'has_next': has_next,
+            'next_cursor': next_cursor,
+        }
+        return api_response(request, data)
+    else:
+        return HttpResponse(status=405)
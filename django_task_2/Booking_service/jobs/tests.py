@@ -0,0 +1,36 @@
+import json
+from django.test import TestCase, override_settings
+from booking.models import Booking
+from Booking_service.testing import stub_service_calls
+from .queue import run_pending
+
+
+def booking_row(number, **fields):
+    return {'ticket_id': f'TK{number:08d}', 'trip_id': f'TP{number:08d}', 'traveller_name': 'Asha',
+            'traveller_number': '9876543210', 'ticket_cost': '250.00', 'traveller_email': 'asha@example.com',
+            **fields}
+
+
+@override_settings(JOBS={'HANDLERS': {'import_bookings': 'booking.ingest.ingest_bookings'}, 'CHUNK_SIZE': 2},
+                   TRIP_REPLICA={'ENABLED': False})
+class BackgroundImportTests(TestCase):
+
+    def test_upload_is_queued_then_worked_in_chunks(self):
+        rows = [booking_row(1), booking_row(2), booking_row(3, ticket_cost='abc'), booking_row(9)]
+        response = self.client.post('/bulk_add_bookings/?background=1', json.dumps(rows),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+        self.assertFalse(Booking.objects.exists())
+
+        trips = {('POST', '/trip_lookup/'): (200, {'trip_ids': ['TP00000001', 'TP00000002']})}
+        with stub_service_calls(trips) as calls:
+            self.assertEqual(run_pending(), 2)
+        # One lookup per chunk, the row with a bad cost never reaches the trip service
+        self.assertEqual(len(calls), 2)
+        job = self.client.get(response.json()['status_url']).json()['job']
+        self.assertEqual((job['status'], job['created'], job['failed']), ('succeeded', 2, 2))
+        self.assertEqual([(error['row'], error['error']) for error in job['errors']], [
+            (3, 'ticket_cost must be a number with at most 10 digits, 2 of them after the point'),
+            (4, 'Invalid trip_id or trip does not exist'),
+        ])
+        self.assertEqual(sorted(Booking.objects.values_list('ticket_id', flat=True)), ['TK00000001', 'TK00000002'])
@@ -0,0 +1,17 @@
+from django.http import JsonResponse, HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from .models import Job
+from .queue import job_status
+
+
+@csrf_exempt
+def job_details(request, job_id):
+    if request.method == 'GET':
+        # Progress, throughput and the first failed rows of a background import
+        try:
+            job = Job.objects.get(id=job_id)
+        except Job.DoesNotExist:
+            return JsonResponse({'error': 'Job not found'}, status=404)
+        return JsonResponse({'job': job_status(job)})
+    else:
+        return HttpResponse(status=405)